@@ -0,0 +1,140 @@
+"""
+Record `python -X importtime` for the common onelogin-aws-login code paths.
+
+Each scenario is run several times in a fresh interpreter, and the median
+cumulative import time of every top level import is reported, along with any
+of the heavy dependencies which were imported on that path.
+
+    $ python benchmarks/importtime.py
+    $ python benchmarks/importtime.py --runs 20 --output importtime.json
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+
+SCENARIOS = {
+    'import': 'import onelogin_aws_cli.cli',
+    'version': (
+        'from onelogin_aws_cli.cli import login\n'
+        'try:\n'
+        '    login(["--version"])\n'
+        'except SystemExit:\n'
+        '    pass\n'
+    ),
+    'construct': (
+        'from onelogin_aws_cli import OneloginAWS\n'
+        'OneloginAWS(dict(base_uri="https://api.us.onelogin.com/",\n'
+        '                 client_id="id", client_secret="secret",\n'
+        '                 duration_seconds=3600))\n'
+    ),
+    'sts_client': (
+        'from onelogin_aws_cli import OneloginAWS\n'
+        'OneloginAWS(dict(base_uri="https://api.us.onelogin.com/",\n'
+        '                 client_id="id", client_secret="secret",\n'
+        '                 duration_seconds=3600)).sts_client\n'
+    ),
+    # A `--credential-process` run answered from the credentials cache
+    'credential_process': (
+        'import base64, datetime, tempfile\n'
+        'from onelogin_aws_cli import OneloginAWS\n'
+        'from onelogin_aws_cli.cache import EncryptedFileCache\n'
+        'from onelogin_aws_cli.cli import _credential_process\n'
+        'api = OneloginAWS(dict(base_uri="https://api.us.onelogin.com/",\n'
+        '                       client_id="id", client_secret="secret",\n'
+        '                       aws_app_id="1", username="user",\n'
+        '                       role_arn="arn:aws:iam::1:role/Role",\n'
+        '                       duration_seconds=3600))\n'
+        'with tempfile.TemporaryDirectory() as tmp:\n'
+        '    api.credentials_cache = EncryptedFileCache(\n'
+        '        "credentials", tmp,\n'
+        '        key=base64.urlsafe_b64encode(b"0" * 32))\n'
+        '    api._cache_credentials(dict(\n'
+        '        Credentials=dict(\n'
+        '            AccessKeyId="ASIA", SecretAccessKey="secret",\n'
+        '            SessionToken="token",\n'
+        '            Expiration=datetime.datetime.now(datetime.timezone.utc)\n'
+        '            + datetime.timedelta(hours=1)),\n'
+        '        AssumedRoleUser=dict(\n'
+        '            Arn="arn:aws:sts::1:assumed-role/Role/user",\n'
+        '            AssumedRoleId="ROLE:user")))\n'
+        '    # Read back from disk, as by the next credential_process run\n'
+        '    api._cached_credentials.clear()\n'
+        '    _credential_process(api)\n'
+    ),
+}
+
+HEAVY_MODULES = [
+    'boto3',
+    'botocore',
+    'cryptography',
+    'keyring',
+    'onelogin.api.client',
+    'pkg_resources',
+    'requests',
+]
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def run_scenario(code: str) -> dict:
+    """
+    Run `code` in a fresh interpreter under `-X importtime`
+
+    :return: The cumulative import time in microseconds of each module
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True,
+    )
+
+    modules = {}
+    for line in result.stderr.decode().splitlines():
+        match = LINE.match(line)
+        if match:
+            _, cumulative, indent, module = match.groups()
+            modules[module] = (len(indent), int(cumulative))
+    return modules
+
+
+def summarise(runs: list) -> dict:
+    """Summarise several runs of the same scenario"""
+    totals = [
+        sum(cumulative for depth, cumulative in run.values() if depth == 1)
+        for run in runs
+    ]
+    imported = set.intersection(*[set(run) for run in runs])
+    return dict(
+        median_us=statistics.median(totals),
+        min_us=min(totals),
+        max_us=max(totals),
+        heavy_modules=[m for m in HEAVY_MODULES if m in imported],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help='Write the results as JSON')
+    parser.add_argument('scenarios', nargs='*', default=sorted(SCENARIOS))
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenarios:
+        runs = [run_scenario(SCENARIOS[name]) for _ in range(args.runs)]
+        results[name] = summarise(runs)
+        print("{:<12} {:>10.1f} ms  heavy: {}".format(
+            name,
+            results[name]['median_us'] / 1000,
+            ", ".join(results[name]['heavy_modules']) or "-",
+        ))
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
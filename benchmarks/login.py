@@ -0,0 +1,155 @@
+"""
+Measure end-to-end login wall time against a local OneLogin and STS stand-in.
+
+Every login goes over real HTTP to the fake server in
+`onelogin_aws_cli/tests/fake_server.py`, starting from empty caches, and the
+p50 and p99 wall time of each scenario is reported. Save the results of one
+commit with `--output`, and compare another against them with `--compare`.
+
+    $ python benchmarks/login.py
+    $ python benchmarks/login.py --runs 50 --latency 40 --output base.json
+    $ python benchmarks/login.py --runs 50 --latency 40 --compare base.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from onelogin_aws_cli.tests.fake_server import FakeServer  # noqa: E402
+
+
+def single_role(server: FakeServer, cache_dir: str, args):
+    """Log in and save the credentials for one role"""
+    server.client(cache_dir, profile='benchmark').save_credentials()
+
+
+def many_roles(server: FakeServer, cache_dir: str, args):
+    """Log in once and save the credentials for every role"""
+    server.client(cache_dir).save_all_credentials()
+
+
+def concurrent_users(server: FakeServer, cache_dir: str, args):
+    """Log several users in at the same time, each saving one role"""
+    errors = []
+
+    def login(user):
+        try:
+            server.client(
+                os.path.join(cache_dir, str(user)),
+                username='user{}@example.com'.format(user),
+                profile='benchmark-{}'.format(user),
+            ).save_credentials()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=login, args=(user,))
+        for user in range(args.users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+SCENARIOS = {
+    'single_role': (single_role, lambda args: 1),
+    'many_roles': (many_roles, lambda args: args.roles),
+    'concurrent_users': (concurrent_users, lambda args: 1),
+}
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """Return the nearest-rank percentile of `samples`"""
+    ordered = sorted(samples)
+    index = max(int(math.ceil(fraction * len(ordered))) - 1, 0)
+    return ordered[index]
+
+
+def run_scenario(name: str, args) -> dict:
+    """
+    Log in `args.runs` times, each from empty caches
+
+    :return: The p50, p99, min and max wall time in milliseconds
+    """
+    scenario, roles = SCENARIOS[name]
+    timings = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['AWS_SHARED_CREDENTIALS_FILE'] = \
+            os.path.join(tmp, 'credentials')
+        with FakeServer(roles=roles(args), mfa=args.mfa,
+                        latency=args.latency / 1000) as server:
+            for run in range(args.warmup + args.runs):
+                cache_dir = os.path.join(tmp, 'cache-{}'.format(run))
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    scenario(server, cache_dir, args)
+                elapsed = (time.perf_counter() - started) * 1000
+                if run >= args.warmup:
+                    timings.append(elapsed)
+
+    return dict(
+        p50_ms=percentile(timings, 0.5),
+        p99_ms=percentile(timings, 0.99),
+        min_ms=min(timings),
+        max_ms=max(timings),
+        runs=len(timings),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2,
+                        help='Runs to make before measuring')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Milliseconds the fake server waits before '
+                             'answering each request')
+    parser.add_argument('--roles', type=int, default=50,
+                        help='Roles in the many_roles assertion')
+    parser.add_argument('--users', type=int, default=10,
+                        help='Users logging in at once in concurrent_users')
+    parser.add_argument('--mfa', choices=['push'],
+                        help='Require MFA, approved by push notification')
+    parser.add_argument('--output', help='Write the results as JSON')
+    parser.add_argument('--compare',
+                        help='Results written by an earlier --output')
+    parser.add_argument('scenarios', nargs='*', default=sorted(SCENARIOS))
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = run_scenario(name, args)
+        line = "{:<18} p50 {:>8.1f} ms  p99 {:>8.1f} ms".format(
+            name, results[name]['p50_ms'], results[name]['p99_ms'],
+        )
+        if name in baseline:
+            line += "  p50 {:+.1%}  p99 {:+.1%}".format(
+                results[name]['p50_ms'] / baseline[name]['p50_ms'] - 1,
+                results[name]['p99_ms'] / baseline[name]['p99_ms'] - 1,
+            )
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
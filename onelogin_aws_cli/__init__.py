@@ -1,25 +1,48 @@
-"""OneLogin/AWS Business logic"""
+"""
+OneLogin/AWS Business logic
 
-from typing import Optional
+boto3 and the OneLogin SDK are slow to import, so they are only
+imported on the code paths which use them.
+"""
 
-import configparser
-import xml.etree.ElementTree as ElementTree
+from typing import Optional
 
-import base64
-import boto3
+import datetime
+import fnmatch
 import os
 import re
+import threading
+import time
 
-from requests import get
-
-from onelogin.api.client import OneLoginClient
-
+from onelogin_aws_cli import keychain
+from onelogin_aws_cli.aliases import AccountAliases
+from onelogin_aws_cli.cache import EncryptedFileCache, FileCache
 from onelogin_aws_cli.configuration import Section
 from onelogin_aws_cli.credentials import MFACredentials, UserCredentials
-from onelogin_aws_cli.userquery import user_role_prompt
+from onelogin_aws_cli.oauth import TokenStore
+from onelogin_aws_cli.push import supports_push
+from onelogin_aws_cli.saml import assertion_expiry, parse_assertion, \
+    parse_saml_datetime
+from onelogin_aws_cli.sharedcredentials import SharedCredentialsFile, \
+    shared_credentials_path
+from onelogin_aws_cli.singleflight import SingleFlight
+from onelogin_aws_cli.tracing import NETWORK, USER, span, traced
+from onelogin_aws_cli.userquery import RoleIndex, user_role_prompt
 
 CONFIG_FILENAME = ".onelogin-aws.config"
 DEFAULT_CONFIG_PATH = os.path.join(os.path.expanduser("~"), CONFIG_FILENAME)
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Stop reusing a cached SAML assertion this long before it expires, so that
+# there is still time to present it to STS
+SAML_CACHE_MARGIN = datetime.timedelta(seconds=30)
+
+# How long a looked up public IP address is reused for on the same network
+DEFAULT_IP_ADDRESS_TTL = 900
+
+# Refresh cached STS credentials once they have less than this many seconds
+# of validity remaining
+DEFAULT_REFRESH_MARGIN = 300
 
 
 class OneloginAWS(object):
@@ -29,22 +52,107 @@ class OneloginAWS(object):
     """
 
     def __init__(self, config: Section):
-        self.sts_client = boto3.client("sts")
+        self._sts_client = None
+        self._sts_endpoint = None
+        # Roles are assumed from several threads at once, and `auto` probes
+        # every candidate, so only the first of them resolves the endpoint
+        self._sts_endpoint_lock = threading.Lock()
+        self._ol_client = None
         self.config = config
+        keychain.use_backend(config.get('keyring_backend'))
         self.saml = None
         self.all_roles = None
         self.role_arn = None
         self.credentials = None
+        self.profile_roles = {}
+        # Seconds the clock of AWS was ahead of this one at the last STS call
+        self.clock_skew = None
         self.duration_seconds = int(config['duration_seconds'])
         self.user_credentials = UserCredentials(config)
         self.mfa = MFACredentials(config)
+        # Held while interacting with the user, so that instances logging in
+        # concurrently take turns
+        self.prompt_lock = threading.RLock()
+        self.saml_cache = EncryptedFileCache("saml")
+        self.credentials_cache = EncryptedFileCache("credentials")
+        self.ip_address_cache = FileCache("ip-address")
+        self.account_aliases = AccountAliases(
+            FileCache("account-alias"),
+            static_file=self.config.get('account_aliases_file'),
+        )
+        # Learned by default, so that later prompts show them
+        self.account_aliases.learning = str(
+            self.config.get('learn_account_aliases') or 'true'
+        ).lower() not in ('0', 'false', 'no', 'off')
+        self.token_store = TokenStore(
+            EncryptedFileCache("oauth-token"),
+            "{section}:{base_uri}:{client_id}".format(
+                section=getattr(config, 'section_name', ''),
+                base_uri=config['base_uri'],
+                client_id=config['client_id'],
+            ),
+        )
+        self._cached_credentials = {}
+
+    @property
+    def sts_client(self):
+        """
+        The AWS STS client for the configured region, shared with every other
+        instance in the process. The built-in client is used unless the
+        `sts_client` directive asks for boto3, or the endpoint needs it.
+        """
+        if self._sts_client is not None:
+            return self._sts_client
 
-        base_uri_parts = self.config['base_uri'].split('.')
-        self.ol_client = OneLoginClient(
-            self.config['client_id'],
-            self.config['client_secret'],
-            base_uri_parts[1],
+        from onelogin_aws_cli.sts import (
+            BOTO3_CLIENT, get_saml_client, get_sts_client
         )
+        with self._sts_endpoint_lock:
+            if self._sts_endpoint is None:
+                self._sts_endpoint = self._resolve_sts_endpoint()
+
+        if self.config.get('sts_client') != BOTO3_CLIENT:
+            client = get_saml_client(*self._sts_endpoint)
+            if client is not None:
+                return client
+        return get_sts_client(*self._sts_endpoint)
+
+    def _resolve_sts_endpoint(self):
+        from onelogin_aws_cli.sts import (
+            DEFAULT_PROBE_TTL, parse_candidates, resolve_sts_endpoint
+        )
+
+        ttl = self.config.get('sts_endpoint_ttl')
+        return resolve_sts_endpoint(
+            self.config.get('sts_endpoint'),
+            region=self.config.get('region') or None,
+            candidates=parse_candidates(
+                self.config.get('sts_endpoint_candidates')
+            ),
+            ttl=DEFAULT_PROBE_TTL if ttl is None else int(ttl),
+        )
+
+    @sts_client.setter
+    def sts_client(self, client):
+        self._sts_client = client
+
+    @property
+    def ol_client(self):
+        """The OneLogin API client, created on first use"""
+        if self._ol_client is None:
+            from onelogin.api.client import OneLoginClient
+
+            base_uri_parts = self.config['base_uri'].split('.')
+            self._ol_client = OneLoginClient(
+                self.config['client_id'],
+                self.config['client_secret'],
+                base_uri_parts[1],
+            )
+        return self._ol_client
+
+    @ol_client.setter
+    def ol_client(self, client):
+        self._ol_client = client
 
     def check_for_errors(self, response):
         """
@@ -59,47 +167,181 @@ class OneloginAWS(object):
             desc=self.ol_client.error_description
         ))
 
+    @traced("get_saml_assertion")
     def get_saml_assertion(self):
         """
         Retrieve users credentials and get the SAML assertion from Onelogin,
         based on the users choice of AWS account to log into
         """
 
-        self.user_credentials.load_credentials()
+        self.user_credentials.load_username()
 
-        saml_resp = self.check_for_errors(
-            self.ol_client.get_saml_assertion(
+        if self._load_cached_saml_assertion():
+            return
+
+        # Look the IP address up while the password is loaded, rather than
+        # after it
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=1)
+        ip_address = executor.submit(self.get_ip_address)
+        executor.shutdown(wait=False)
+
+        with self.prompt_lock:
+            self.user_credentials.load_password()
+
+        # Reuse the OAuth token from an earlier run if it is still valid
+        with span("onelogin_oauth_token", NETWORK):
+            self.token_store.prepare(self.ol_client)
+
+        ip_address = ip_address.result()
+        saml_resp = self._request_saml_assertion(ip_address)
+        if self.token_store.rejected(self.ol_client):
+            # The reused token was revoked before it expired
+            with span("onelogin_oauth_token", NETWORK):
+                self.token_store.prepare(self.ol_client)
+            saml_resp = self._request_saml_assertion(ip_address)
+        saml_resp = self.check_for_errors(saml_resp)
+
+        if saml_resp.mfa:
+            with self.prompt_lock:
+                if not self.mfa.ready():
+                    if not self.mfa.keep_device(saml_resp.mfa.devices):
+                        self.mfa.select_device(saml_resp.mfa.devices)
+                    if not self.mfa.has_otp and \
+                            not supports_push(self.mfa.device):
+                        self.mfa.prompt_token()
+                device = self.mfa.device
+                otp = self.mfa.otp
+
+                push = otp is None and supports_push(device)
+                if push:
+                    # An OTP can still be typed while waiting on the push
+                    with span("mfa_push", USER, device_type=device.type):
+                        saml_resp = self._verify_with_push(
+                            device, saml_resp.mfa.state_token
+                        )
+
+            if not push:
+                with span("mfa_verify", NETWORK, device_type=device.type):
+                    saml_resp = self.check_for_errors(
+                        self.ol_client.get_saml_assertion_verifying(
+                            self.config['aws_app_id'],
+                            device.id,
+                            saml_resp.mfa.state_token,
+                            otp
+                        )
+                    )
+
+        self.saml = saml_resp
+        self._cache_saml_assertion()
+
+    def _request_saml_assertion(self, ip_address: Optional[str]):
+        with span("onelogin_saml_assertion", NETWORK):
+            return self.ol_client.get_saml_assertion(
                 username_or_email=self.user_credentials.username,
                 password=self.user_credentials.password,
                 app_id=self.config['aws_app_id'],
                 subdomain=self.config['subdomain'],
-                ip_address=self.get_ip_address(),
+                ip_address=ip_address,
             )
-        )
 
-        if saml_resp.mfa:
-            if not self.mfa.ready():
-                self.mfa.select_device(saml_resp.mfa.devices)
-                if not self.mfa.has_otp:
-                    self.mfa.prompt_token()
+    def _verify_with_push(self, device, state_token: str):
+        """
+        Send a push notification to the MFA device, and wait for either the
+        user to approve it or to type an OTP instead
+        """
+
+        from onelogin_aws_cli.push import (
+            DEFAULT_PUSH_INTERVAL, DEFAULT_PUSH_TIMEOUT, PushVerification,
+            read_line
+        )
 
-            saml_resp = self.check_for_errors(
+        def verify(otp_token=None, do_not_notify=False):
+            return self.check_for_errors(
                 self.ol_client.get_saml_assertion_verifying(
                     self.config['aws_app_id'],
-                    self.mfa.device.id,
-                    saml_resp.mfa.state_token,
-                    self.mfa.otp
+                    device.id,
+                    state_token,
+                    otp_token=otp_token,
+                    do_not_notify=do_not_notify,
                 )
             )
 
-        self.saml = saml_resp
+        interval = self.config.get('mfa_push_interval')
+        timeout = self.config.get('mfa_push_timeout')
+        verification = PushVerification(
+            verify,
+            interval=float(
+                DEFAULT_PUSH_INTERVAL if interval is None else interval
+            ),
+            timeout=float(
+                DEFAULT_PUSH_TIMEOUT if timeout is None else timeout
+            ),
+        )
+
+        print("Approve the push notification sent to {}".format(device.type))
+        return verification.run(
+            lambda stop: read_line(
+                "or type a {} Token: ".format(device.type), stop
+            )
+        )
+
+    def _saml_cache_key(self) -> Optional[str]:
+        if self.config.get('no_saml_cache'):
+            return None
+        return "{section}:{app_id}:{username}".format(
+            section=getattr(self.config, 'section_name', ''),
+            app_id=self.config['aws_app_id'],
+            username=self.user_credentials.username,
+        )
+
+    def _load_cached_saml_assertion(self) -> bool:
+        """
+        Reuse a still-valid SAML assertion from a previous run, if there is
+        one, skipping the OneLogin login and MFA entirely.
+
+        :return: True if a cached assertion was loaded
+        """
+
+        key = self._saml_cache_key()
+        if key is None:
+            return False
+
+        cached = self.saml_cache.get(key)
+        if cached is None:
+            return False
+
+        from onelogin.api.models.saml_endpoint_response import \
+            SAMLEndpointResponse
 
+        self.saml = SAMLEndpointResponse('success', 'Cached')
+        self.saml.saml_response = cached['saml_response']
+        return True
+
+    def _cache_saml_assertion(self):
+        key = self._saml_cache_key()
+        if key is None:
+            return
+
+        expiry = assertion_expiry(self.saml.saml_response)
+        if expiry is None:
+            return
+
+        expires = expiry - SAML_CACHE_MARGIN
+        if expires > datetime.datetime.now(datetime.timezone.utc):
+            self.saml_cache.set(
+                key, dict(saml_response=self.saml.saml_response), expires
+            )
+
+    @traced("get_ip_address", NETWORK)
     def get_ip_address(self) -> Optional[str]:
         """
         Get the client IP address.
         Uses either the `ip_address` in config,
         or if `auto_determine_ip_address` is specified in config,
-        the ipify service is used to dynamically lookup the IP address.
+        the `ip_address_endpoints` are used to dynamically lookup the IP
+        address. A looked up address is reused until the network changes or
+        `ip_address_ttl` seconds pass.
         """
 
         # if ip address has been hard coded in config file, use that
@@ -107,34 +349,55 @@ class OneloginAWS(object):
         if ip_address is not None:
             return ip_address
 
-        # if auto determine is enabled, use ipify to lookup the ip
+        # if auto determine is enabled, look the ip up
         if self.config.auto_determine_ip_address:
-            ip_address = get('https://api.ipify.org').text
-            return ip_address
+            return self._lookup_ip_address()
 
+    def _lookup_ip_address(self) -> Optional[str]:
+        from onelogin_aws_cli.network import (
+            DEFAULT_IP_ADDRESS_ENDPOINTS, DEFAULT_IP_ADDRESS_TIMEOUT,
+            lookup_public_ip, network_fingerprint,
+        )
+
+        key = network_fingerprint()
+        cached = self.ip_address_cache.get(key)
+        if cached is not None:
+            return cached['ip_address']
+
+        endpoints = DEFAULT_IP_ADDRESS_ENDPOINTS
+        if self.config.get('ip_address_endpoints'):
+            endpoints = [
+                url.strip()
+                for url in self.config['ip_address_endpoints'].split(',')
+                if url.strip()
+            ]
+        timeout = self.config.get('ip_address_timeout')
+        ip_address = lookup_public_ip(
+            endpoints,
+            DEFAULT_IP_ADDRESS_TIMEOUT if timeout is None else float(timeout),
+        )
+        if ip_address is None:
+            print("Could not determine the client IP address")
+            return None
+
+        ttl = self.config.get('ip_address_ttl')
+        self.ip_address_cache.set(
+            key,
+            dict(ip_address=ip_address),
+            datetime.datetime.now(datetime.timezone.utc) +
+            datetime.timedelta(seconds=int(
+                DEFAULT_IP_ADDRESS_TTL if ttl is None else ttl
+            )),
+        )
+        return ip_address
+
+    @traced("get_arns")
     def get_arns(self):
         """Extract the IAM Role ARNs from the SAML Assertion"""
 
         if not self.saml:
             self.get_saml_assertion()
-        # Parse the returned assertion and extract the authorized roles
-        aws_roles = []
-        root = ElementTree.fromstring(
-            base64.b64decode(self.saml.saml_response))
-
-        namespace = "{urn:oasis:names:tc:SAML:2.0:assertion}"
-        role_name = "https://aws.amazon.com/SAML/Attributes/Role"
-        for attr in root.iter(namespace + "Attribute"):
-            if attr.get("Name") == role_name:
-                for val in attr.iter(namespace + "AttributeValue"):
-                    aws_roles.append(val.text)
-
-        # Note the format of the attribute value should be role_arn,
-        # principal_arn but lots of blogs list it as principal_arn,role_arn so
-        # let's reverse them if needed
-        aws_roles = [role.split(",") for role in aws_roles]
-        aws_roles = [(role, principal) for role, principal in aws_roles]
-        self.all_roles = aws_roles
+        self.all_roles = parse_assertion(self.saml.saml_response).roles
 
     def get_role(self):
         """
@@ -150,83 +413,499 @@ class OneloginAWS(object):
         # If I have more than one role, ask the user which one they want,
         # otherwise just proceed
 
-        self.role_arn, self.principal_arn = user_role_prompt(
-            self.all_roles,
-            saved_choice=self.config.get("role_arn"),
-        )
+        with self.prompt_lock, span("choose_role", USER):
+            self.role_arn, self.principal_arn = user_role_prompt(
+                self.all_roles,
+                saved_choice=self.config.get("role_arn"),
+                aliases=self.account_aliases.get(
+                    RoleIndex.split_arn(role)[0] for role, _ in self.all_roles
+                ),
+            )
+
+    def get_matching_roles(self) -> list:
+        """
+        Return every (role, principal) pair in the SAML assertion matching the
+        `role_filter` glob, or all of them if no filter is configured
+        """
+
+        if not self.all_roles:
+            self.get_arns()
+
+        role_filter = self.config.get('role_filter')
+        roles = [
+            (role, principal) for role, principal in self.all_roles
+            if not role_filter or fnmatch.fnmatchcase(role, role_filter)
+        ]
+
+        if not roles:
+            raise Exception("No roles found")
+
+        return roles
 
     def assume_role(self):
         """Perform an AWS SAML role assumption"""
 
         if not self.role_arn:
             self.get_role()
-        if self.config['region']:
-            self.sts_client = boto3.client(
-                "sts",
-                region_name=self.config["region"])
-        res = self.sts_client.assume_role_with_saml(
-            RoleArn=self.role_arn,
-            PrincipalArn=self.principal_arn,
-            SAMLAssertion=self.saml.saml_response,
-            DurationSeconds=self.duration_seconds
+
+        self.credentials = self._assume_role_with_saml(
+            self.role_arn,
+            self.principal_arn,
         )
+        self._cache_credentials(self.credentials)
 
-        self.credentials = res
+    def assume_all_roles(self, roles: list = None) -> list:
+        """
+        Assume several roles from a single SAML assertion, running the STS
+        calls concurrently.
+
+        :param roles: (role, principal) pairs to assume. Defaults to every
+                      role matching `role_filter`
+        :return: A list of `assume_role_with_saml` responses, in the same
+                 order as the roles
+        """
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        if roles is None:
+            roles = self.get_matching_roles()
+        max_workers = int(self.config.get(
+            'max_concurrency', DEFAULT_MAX_CONCURRENCY
+        ))
 
-    def save_credentials(self):
-        """Save the AWS Federation credentials to disk"""
+        with ThreadPoolExecutor(
+                max_workers=min(max_workers, len(roles))) as executor:
+            return list(executor.map(
+                lambda role: self._assume_role_with_saml(*role),
+                roles,
+            ))
+
+    def _assume_role_with_saml(self, role_arn: str, principal_arn: str):
+        with span("assume_role", NETWORK, role_arn=role_arn):
+            response = self.sts_client.assume_role_with_saml(
+                RoleArn=role_arn,
+                PrincipalArn=principal_arn,
+                SAMLAssertion=self.saml.saml_response,
+                DurationSeconds=self.duration_seconds
+            )
+        self._measure_clock_skew(response)
+        self.account_aliases.learn(role_arn, response)
+        return response
+
+    def _measure_clock_skew(self, response: dict):
+        received = time.time()
+        try:
+            date = response['ResponseMetadata']['HTTPHeaders']['date']
+        except (KeyError, TypeError):
+            return
+        if not isinstance(date, str):
+            return
+
+        from email.utils import parsedate_to_datetime
+        try:
+            server_time = parsedate_to_datetime(date).timestamp()
+        except (TypeError, ValueError):
+            return
+        # The Date header only has a resolution of a second
+        skew = server_time - received
+        self.clock_skew = skew if abs(skew) >= 1 else 0.0
+
+    def get_credentials(self, single_flight: bool = True) -> dict:
+        """
+        Return the `assume_role_with_saml` response for the configured role,
+        reusing previously assumed credentials for as long as they remain
+        valid for longer than `refresh_margin` seconds.
+
+        :param single_flight: Wait for other processes assuming the same role,
+                              using a lock kept next to the credentials file
+        """
 
-        if not self.credentials:
+        credentials = self.cached_credentials()
+        if credentials is None and \
+                (not single_flight or self._credentials_cache_key() is None):
             self.assume_role()
+            credentials = self.credentials
+            self.credentials = None
+        elif credentials is None:
+            # Another process may be assuming the same role, in which case
+            # its credentials are cached by the time the lock is acquired
+            with self._single_flight().lock():
+                credentials = self.cached_credentials()
+                if credentials is None:
+                    self.assume_role()
+                    credentials = self.credentials
+                    self.credentials = None
+
+        return credentials
+
+    def cached_credentials(self) -> Optional[dict]:
+        """
+        Return the `assume_role_with_saml` response for the configured role
+        if one is cached, in memory or on disk, and is still fresh
+        """
+
+        self.user_credentials.load_username()
+
+        key = self._credentials_cache_key()
+        if key is None:
+            return None
+
+        credentials = self._cached_credentials.get(key)
+        if credentials is None:
+            cached = self.credentials_cache.get(key)
+            if cached is not None:
+                credentials = self._deserialize_credentials(cached)
+                self._cached_credentials[key] = credentials
+
+        if credentials is None or not self._is_fresh(credentials):
+            return None
+        return credentials
+
+    def _credentials_cache_key(self) -> Optional[str]:
+        """
+        Identify the credentials of the role, or return `None` if no role is
+        configured and none has been picked yet. Each process picking a role
+        at the prompt may pick a different one, so nothing can be shared.
+        """
+
+        role_arn = self.config.get('role_arn') or self.role_arn
+        if not role_arn:
+            return None
+
+        return "{section}:{app_id}:{username}:{role_arn}:{duration}:" \
+            "{region}:{profile}".format(
+                section=getattr(self.config, 'section_name', ''),
+                app_id=self.config['aws_app_id'],
+                username=self.user_credentials.username,
+                role_arn=role_arn,
+                duration=self.duration_seconds,
+                region=self.config.get('region') or '',
+                profile=self.config.get('profile') or '',
+            )
 
-        creds = self.credentials["Credentials"]
+    def _is_fresh(self, credentials: dict) -> bool:
+        refresh_margin = self.config.get('refresh_margin')
+        if refresh_margin is None:
+            refresh_margin = DEFAULT_REFRESH_MARGIN
 
+        expiration = credentials["Credentials"]["Expiration"]
+        refresh_at = expiration - datetime.timedelta(
+            seconds=int(refresh_margin)
+        )
+        return datetime.datetime.now(datetime.timezone.utc) < refresh_at
+
+    def _cache_credentials(self, credentials: dict):
+        key = self._credentials_cache_key()
+        if key is None:
+            return
+        self._cached_credentials[key] = credentials
+        self.credentials_cache.set(
+            key,
+            self._serialize_credentials(credentials),
+            credentials["Credentials"]["Expiration"],
+        )
+
+    @staticmethod
+    def _serialize_credentials(credentials: dict) -> dict:
+        creds = dict(credentials["Credentials"])
+        creds["Expiration"] = creds["Expiration"].isoformat()
+        return dict(
+            Credentials=creds,
+            AssumedRoleUser=dict(credentials["AssumedRoleUser"]),
+        )
+
+    @staticmethod
+    def _deserialize_credentials(cached: dict) -> dict:
+        creds = dict(cached["Credentials"])
+        creds["Expiration"] = parse_saml_datetime(creds["Expiration"])
+        return dict(
+            Credentials=creds,
+            AssumedRoleUser=cached["AssumedRoleUser"],
+        )
+
+    def save_credentials(self) -> dict:
+        """
+        Save the AWS Federation credentials to disk
+
+        :return: Mapping of the saved profile name to its credentials
+        """
+
+        self.user_credentials.load_username()
         cred_file = self._initialize_credentials()
 
-        cred_config = configparser.ConfigParser()
+        if not self.config.get('role_arn'):
+            # The role is picked at a prompt, so processes saving the profile
+            # at once may each want a different one
+            profiles = self.assume_profiles()
+            self._write_credentials(profiles)
+        else:
+            # Processes saving the same profile at once queue up here, and
+            # reuse the credentials saved while they waited
+            flight = self._single_flight(cred_file)
+            with flight.lock():
+                profiles = self._completed_profiles(
+                    flight.completed(), cred_file
+                )
+                if profiles is None:
+                    profiles = self.assume_profiles()
+                    self._write_credentials(profiles)
+                    flight.complete(self._completion(profiles))
+
+        name, credentials = next(iter(profiles.items()))
+
+        print("Credentials cached in '{}'".format(cred_file))
+        print("Expires at {}".format(
+            credentials["Credentials"]["Expiration"]
+        ))
+        print("Use aws cli with --profile " + name)
+
+        return profiles
+
+    def _single_flight(self, cred_file: str = None) -> SingleFlight:
+        self.user_credentials.load_username()
+        if cred_file is None:
+            cred_file = self._initialize_credentials()
+
+        return SingleFlight(
+            os.path.dirname(os.path.abspath(cred_file)),
+            self._credentials_cache_key(),
+        )
+
+    def _completion(self, profiles: dict) -> dict:
+        name, credentials = next(iter(profiles.items()))
+        role_arn, principal_arn = self.profile_roles[name]
+        return dict(
+            profile=name,
+            role_arn=role_arn,
+            principal_arn=principal_arn,
+            assumed_role_arn=credentials["AssumedRoleUser"]["Arn"],
+            expiration=credentials["Credentials"]["Expiration"].isoformat(),
+        )
+
+    def _completed_profiles(self, completion: Optional[dict],
+                            cred_file: str) -> Optional[dict]:
+        """
+        Read back the profile saved by another process, if it is still fresh
+        """
+
+        if completion is None:
+            return None
+
+        import configparser
+
+        cred_config = configparser.ConfigParser(interpolation=None)
         cred_config.read(cred_file)
+        name = completion['profile']
+        if not cred_config.has_section(name):
+            return None
+
+        section = cred_config[name]
+        credentials = dict(
+            Credentials=dict(
+                AccessKeyId=section.get('aws_access_key_id'),
+                SecretAccessKey=section.get('aws_secret_access_key'),
+                SessionToken=section.get('aws_session_token'),
+                Expiration=parse_saml_datetime(completion['expiration']),
+            ),
+            AssumedRoleUser=dict(Arn=completion['assumed_role_arn']),
+        )
+        if not all(credentials["Credentials"].values()) or \
+                not self._is_fresh(credentials):
+            return None
+
+        self.profile_roles[name] = (
+            completion['role_arn'], completion['principal_arn']
+        )
+        return {name: credentials}
+
+    def save_all_credentials(self) -> dict:
+        """
+        Assume every matching role and save all of the AWS Federation
+        credentials to disk in a single write.
+
+        :return: Mapping of each saved profile name to its credentials
+        """
+
+        profiles = self.assume_profiles(all_roles=True)
+        cred_file = self._write_credentials(profiles)
+
+        print("Credentials cached in '{}'".format(cred_file))
+        for name, credentials in profiles.items():
+            print("Profile {} expires at {}".format(
+                name, credentials["Credentials"]["Expiration"]
+            ))
+
+        return profiles
+
+    def assume_profiles(self, all_roles: bool = False) -> dict:
+        """
+        Assume the chosen role, or every matching role, without saving the
+        credentials
+
+        :param all_roles: Assume every role matching `role_filter`
+        :return: Mapping of the profile name to save each role as to its
+                 credentials
+        """
+
+        if not all_roles:
+            if not self.credentials:
+                self.assume_role()
+
+            name = self._profile_name(self.credentials)
+            if "profile" in self.config:
+                name = self.config["profile"]
 
-        # Update with new credentials
-        name = self.credentials["AssumedRoleUser"]["Arn"]
+            profiles = {name: self.credentials}
+            self.profile_roles[name] = (self.role_arn, self.principal_arn)
+
+            # Reset state in the case of another transaction
+            self.credentials = None
+            return profiles
+
+        roles = self.get_matching_roles()
+
+        profiles = {}
+        for role, credentials in zip(roles, self.assume_all_roles(roles)):
+            name = self._profile_name(credentials)
+            profiles[name] = credentials
+            self.profile_roles[name] = role
+        return profiles
+
+    def refresh_profiles(self, names: list) -> dict:
+        """
+        Assume the roles behind previously saved profiles again, and save the
+        new credentials to disk in a single write. The SAML assertion held in
+        memory, or in the cache, is reused while it is still valid.
+
+        :param names: Names of profiles saved by this instance
+        :return: Mapping of each profile name to its new credentials
+        """
+
+        profiles = self.reassume_profiles(names)
+        self._write_credentials(profiles)
+
+        return profiles
+
+    def reassume_profiles(self, names: list) -> dict:
+        """
+        Assume the roles behind previously saved profiles again, without
+        saving the credentials
+
+        :param names: Names of profiles saved by this instance
+        :return: Mapping of each profile name to its new credentials
+        """
+
+        self._refresh_saml_assertion()
+
+        roles = [self.profile_roles[name] for name in names]
+        return dict(zip(names, self.assume_all_roles(roles)))
+
+    def _refresh_saml_assertion(self):
+        expiry = None
+        if self.saml is not None:
+            expiry = assertion_expiry(self.saml.saml_response)
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if expiry is None or expiry - SAML_CACHE_MARGIN <= now:
+            self.saml = None
+            self.get_saml_assertion()
+
+    @staticmethod
+    def _profile_name(credentials) -> str:
+        """Derive a profile name from the assumed role ARN"""
+
+        name = credentials["AssumedRoleUser"]["Arn"]
         m = re.search(r'(arn\:aws([\w-]*)\:sts\:\:)(.*)', name)
 
         if m is not None:
             name = m.group(3)
-        name = name.replace(":assumed-role", "")
-        if "profile" in self.config:
-            name = self.config["profile"]
+        return name.replace(":assumed-role", "")
 
-        # Initialize the profile block if it is undefined
-        if name not in cred_config:
-            cred_config[name] = {}
+    def credential_updates(self, profiles: dict) -> dict:
+        """
+        Return the options to set in the credentials file for each profile
 
-        # Set each value specifically instead of overwriting the entire
-        # profile block in case they have other parameters defined
-        cred_config[name]['aws_access_key_id'] = creds["AccessKeyId"]
-        cred_config[name]['aws_secret_access_key'] = creds["SecretAccessKey"]
-        cred_config[name]['aws_session_token'] = creds["SessionToken"]
+        :param profiles: Mapping of profile name to `assume_role_with_saml`
+                         response
+        """
 
-        # Set region for this profile if passed in via configuration
-        if self.config['region']:
-            cred_config[name]['region'] = self.config['region']
+        updates = {}
+        for name, credentials in profiles.items():
+            creds = credentials["Credentials"]
 
-        with open(cred_file, "w") as cred_config_file:
-            cred_config.write(cred_config_file)
+            # Set each value specifically instead of overwriting the entire
+            # profile block in case they have other parameters defined
+            updates[name] = {
+                'aws_access_key_id': creds["AccessKeyId"],
+                'aws_secret_access_key': creds["SecretAccessKey"],
+                'aws_session_token': creds["SessionToken"],
+            }
 
-        print("Credentials cached in '{}'".format(cred_file))
-        print("Expires at {}".format(creds["Expiration"]))
-        print("Use aws cli with --profile " + name)
+            # Set region for this profile if passed in via configuration
+            if self.config.get('region'):
+                updates[name]['region'] = self.config['region']
 
-        # Reset state in the case of another transaction
-        self.credentials = None
+        return updates
 
-    def _initialize_credentials(self):
-        cred_file = os.environ.get('AWS_SHARED_CREDENTIALS_FILE', None)
+    def expiry_updates(self, profiles: dict) -> dict:
+        """
+        Return the entry to record in the expiry index for each profile
 
-        if cred_file is None:
-            cred_file = os.path.expanduser("~/.aws/credentials")
-            cred_dir = os.path.expanduser("~/.aws/")
-            if not os.path.exists(cred_dir):
-                os.makedirs(cred_dir)
+        :param profiles: Mapping of profile name to `assume_role_with_saml`
+                         response
+        """
+
+        updates = {}
+        for name, credentials in profiles.items():
+            role_arn = self.profile_roles.get(name, (self.role_arn, None))[0]
+            updates[name] = dict(
+                expiration=credentials["Credentials"]["Expiration"]
+                .isoformat(),
+                config_name=getattr(self.config, 'section_name', None),
+                role_arn=role_arn or self.config.get('role_arn'),
+            )
+        return updates
+
+    def saved_profiles(self) -> list:
+        """
+        Look up the profiles this config section saves in the expiry index,
+        without logging in
+
+        :return: The name of each profile and the seconds it remains valid
+                 for, which is empty if none have been saved
+        """
+
+        index = SharedCredentialsFile(
+            self._initialize_credentials()
+        ).expiry_index
+        clock_skew = index.load()['clock_skew']
+        return [
+            (name, index.remaining(entry, clock_skew))
+            for name, entry in index.find(
+                profile=self.config.get('profile'),
+                config_name=getattr(self.config, 'section_name', None),
+            )
+        ]
+
+    @traced("write_credentials")
+    def _write_credentials(self, profiles: dict) -> str:
+        """
+        Write a set of profiles to the credentials file in a single locked,
+        atomic update.
+
+        :param profiles: Mapping of profile name to `assume_role_with_saml`
+                         response
+        :return: Path to the credentials file
+        """
+
+        cred_file = self._initialize_credentials()
+        SharedCredentialsFile(cred_file).update(
+            self.credential_updates(profiles),
+            expiry=self.expiry_updates(profiles),
+            clock_skew=self.clock_skew,
+        )
 
         return cred_file
+
+    def _initialize_credentials(self):
+        return shared_credentials_path()
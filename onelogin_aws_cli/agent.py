@@ -0,0 +1,274 @@
+"""
+A long-lived login agent, in the style of ssh-agent.
+
+The agent keeps the OAuth token, SAML assertion and STS credentials of every
+login it makes in memory, and hands credentials out over a Unix domain
+socket. Each request and response is a single line of JSON.
+"""
+import errno
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Callable, Optional
+
+from onelogin_aws_cli import OneloginAWS
+from onelogin_aws_cli.cache import CACHE_DIR
+from onelogin_aws_cli.configuration import ConfigurationFile
+from onelogin_aws_cli.multilogin import MultiSectionLogin
+
+SOCKET_ENV = "ONELOGIN_AWS_CLI_AGENT_SOCK"
+DEFAULT_SOCKET_PATH = os.path.join(CACHE_DIR, "agent.sock")
+
+# Options of `onelogin-aws-login` which are passed on to the agent
+FORWARDED_OPTIONS = (
+    'profile',
+    'region',
+    'username',
+    'duration_seconds',
+    'refresh_margin',
+    'no_saml_cache',
+)
+
+# While a burst of requests fills the agent's backlog, connecting is retried
+# this often
+CONNECT_RETRY_DELAY = 0.01
+
+# Long enough for the agent to prompt for a password and MFA
+RESPONSE_TIMEOUT = 300
+
+
+class LoginAgent(object):
+    """
+    Answers requests for credentials, keeping a `OneloginAWS` instance for
+    each config section and set of options asked for.
+
+    Requests for the same section and options are answered one at a time, so
+    concurrent requests for the same role are served by a single STS call.
+    Sections share prompts and SAML assertions as they do when logging in to
+    several sections at once, and prompts are shown in the agent's terminal.
+    """
+
+    def __init__(self, config_file: ConfigurationFile,
+                 create: Callable[..., OneloginAWS] = OneloginAWS):
+        """
+        :param config_file: The loaded config file
+        :param create: Creates the `OneloginAWS` instance for a section
+        """
+        self.config_file = config_file
+        self.logins = MultiSectionLogin([])
+        self._create = create
+        self._lock = threading.Lock()
+        self._apis = {}
+
+    def handle(self, request: dict) -> dict:
+        """
+        Answer a single request
+
+        :param request: A `command`, which is `ping`, or `credentials` along
+                        with the `config_name` and `options` to log in with
+        """
+
+        command = request.get('command')
+        if command == 'ping':
+            return dict(ok=True, pid=os.getpid())
+        if command != 'credentials':
+            return dict(ok=False, error="Unknown command '{}'".format(
+                command
+            ))
+
+        try:
+            options = {
+                key: value
+                for key, value in (request.get('options') or {}).items()
+                if key in FORWARDED_OPTIONS
+            }
+            api, credentials = self.credentials(
+                request.get('config_name') or
+                self.config_file.default_section,
+                options,
+            )
+        except Exception as e:
+            return dict(ok=False, error=str(e))
+
+        name = api._profile_name(credentials)
+        if "profile" in api.config:
+            name = api.config["profile"]
+
+        return dict(
+            ok=True,
+            profile=name,
+            credentials=api._serialize_credentials(credentials),
+            updates=api.credential_updates({name: credentials}),
+            expiry=api.expiry_updates({name: credentials}),
+            clock_skew=api.clock_skew,
+        )
+
+    def credentials(self, config_name: str, options: dict):
+        """
+        Return the credentials for a config section, logging in and assuming
+        the role only if those held in memory are no longer fresh
+
+        :return: The `OneloginAWS` instance for the section and options, and
+                 its `assume_role_with_saml` response
+        """
+
+        api, lock = self._api(config_name, options)
+        with lock:
+            credentials = api.cached_credentials()
+            if credentials is None:
+                self.logins.load_saml_assertion(api, refresh=True)
+                credentials = api.get_credentials()
+        return api, credentials
+
+    def _api(self, config_name: str, options: dict):
+        key = (config_name, json.dumps(options, sort_keys=True))
+        with self._lock:
+            if key not in self._apis:
+                section = self.config_file.section(config_name)
+                if section is None or not section.has_required:
+                    raise Exception(
+                        "Configuration '{}' not defined".format(config_name)
+                    )
+                section.set_overrides(options)
+
+                api = self._create(section)
+                self.logins.add(api)
+                self._apis[key] = (api, threading.Lock())
+            return self._apis[key]
+
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves a `LoginAgent` on a Unix domain socket"""
+
+    daemon_threads = True
+    # Bursts of processes ask for credentials at once
+    request_queue_size = 128
+
+    def __init__(self, path: str, agent: LoginAgent):
+        self.agent = agent
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.exists(path):
+            if AgentClient(path).request(dict(command='ping')) is not None:
+                raise Exception(
+                    "A login agent is already listening on '{}'".format(path)
+                )
+            os.remove(path)
+
+        super().__init__(path, _Handler)
+
+    def server_bind(self):
+        # Only the owner may ask the agent for credentials, so the socket is
+        # never reachable by anyone else, even before it could be chmod'd
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def verify_request(self, request, client_address) -> bool:
+        """Refuse connections from processes run by any other user"""
+        if not hasattr(socket, 'SO_PEERCRED'):
+            # Not available outside Linux, where the socket's permissions
+            # have to do
+            return True
+        _pid, uid, _gid = struct.unpack('3i', request.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')
+        ))
+        return uid == os.getuid()
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                response = dict(ok=False, error="Invalid request")
+            else:
+                response = self.server.agent.handle(request)
+
+            self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+class AgentClient(object):
+    """Asks a login agent for credentials"""
+
+    def __init__(self, path: str, timeout: float = RESPONSE_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+
+    def request(self, request: dict) -> Optional[dict]:
+        """
+        Send a request to the agent
+
+        :return: The response, or `None` if no agent is listening
+        """
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            if not self._connect(sock):
+                return None
+
+            sock.sendall(json.dumps(request).encode('utf-8') + b"\n")
+            with sock.makefile('rb') as fp:
+                line = fp.readline()
+        finally:
+            sock.close()
+
+        if not line:
+            raise Exception("The login agent closed the connection")
+        return json.loads(line.decode('utf-8'))
+
+    def _connect(self, sock: socket.socket) -> bool:
+        """
+        Connect to the agent, waiting while its backlog is full
+
+        :return: Whether an agent is listening
+        """
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                sock.connect(self.path)
+                return True
+            except OSError as e:
+                if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                    return False
+                if e.errno != errno.EAGAIN or time.monotonic() >= deadline:
+                    raise
+            time.sleep(CONNECT_RETRY_DELAY)
+
+    def credentials(self, config_name: str, options: dict) -> Optional[dict]:
+        """
+        Ask the agent for the credentials of a config section
+
+        :return: The agent's response, holding the `profile` name, the
+                 `credentials`, the `updates` to make to the credentials
+                 file and the `expiry` index entries to record along with
+                 the `clock_skew`, or `None` if no agent is listening
+        """
+
+        response = self.request(dict(
+            command='credentials',
+            config_name=config_name,
+            options=options,
+        ))
+        if response is not None and not response.get('ok'):
+            raise Exception(response.get('error'))
+        return response
@@ -0,0 +1,183 @@
+"""
+Friendly names for AWS accounts, remembered between invocations
+"""
+import collections
+import datetime
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+from onelogin_aws_cli.cache import FileCache
+from onelogin_aws_cli.userquery import RoleIndex
+
+# How long a looked up alias is trusted for
+ALIAS_TTL = datetime.timedelta(days=30)
+# How long to wait before asking again about an account without an alias,
+# or whose roles may not list it
+MISSING_TTL = datetime.timedelta(days=1)
+
+LOOKUP_TIMEOUT = 3
+# Longest a login waits before exiting for look ups which are still running
+EXIT_WAIT = 1.5
+# Accounts looked up at once, however many roles are assumed together
+MAX_LOOKUPS = 2
+
+
+def list_account_alias(credentials: dict) -> Optional[str]:
+    """
+    Ask IAM for the alias of the account that `credentials` belong to
+
+    :param credentials: The `Credentials` of an `assume_role_with_saml`
+                        response
+    :return: The alias, or `None` if the account does not have one
+    """
+
+    import boto3
+    from botocore.config import Config
+
+    client = boto3.session.Session(
+        aws_access_key_id=credentials['AccessKeyId'],
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken'],
+    ).client('iam', config=Config(
+        connect_timeout=LOOKUP_TIMEOUT,
+        read_timeout=LOOKUP_TIMEOUT,
+        retries={'max_attempts': 0},
+    ))
+    aliases = client.list_account_aliases()['AccountAliases']
+    return aliases[0] if aliases else None
+
+
+class AccountAliases(object):
+    """
+    Account aliases, from a static mapping file or from a cache which is
+    filled in the background as roles are assumed, so that showing them
+    never waits on AWS.
+    """
+
+    def __init__(self, cache: FileCache, static_file: str = None,
+                 lookup: Callable[[dict], Optional[str]] = list_account_alias):
+        """
+        :param cache: Cache for aliases which have been looked up
+        :param static_file: JSON file mapping account IDs to aliases, which
+                            take precedence over those looked up
+        :param lookup: Returns the alias of the account that the given
+                       credentials belong to
+        """
+        self._cache = cache
+        self._static_file = static_file
+        self._static = None
+        self._lookup = lookup
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._pending = set()
+        self._queue = collections.deque()
+        self._workers = 0
+        # Whether `learn` looks aliases up. Processes which hand the
+        # credentials on rather than saving them turn it off, and it can be
+        # turned off with the `learn_account_aliases` directive.
+        self.learning = True
+
+    def get(self, account_ids: Iterable[str]) -> Dict[str, str]:
+        """Return the aliases known for any of `account_ids`"""
+
+        aliases = {}
+        static = self.static()
+        for account_id in set(account_ids):
+            alias = static.get(account_id)
+            if alias is None:
+                cached = self._cache.get(account_id)
+                alias = cached['alias'] if cached else None
+            if alias:
+                aliases[account_id] = alias
+        return aliases
+
+    def static(self) -> Dict[str, str]:
+        """Return the aliases from the static mapping file"""
+
+        if self._static is None:
+            self._static = {}
+            if self._static_file:
+                path = os.path.expanduser(self._static_file)
+                try:
+                    with open(path) as fp:
+                        self._static = {
+                            str(k): str(v) for k, v in json.load(fp).items()
+                        }
+                except (OSError, ValueError, AttributeError):
+                    print("Could not read account aliases from '{}'".format(
+                        self._static_file
+                    ))
+        return self._static
+
+    def learn(self, role_arn: str, response: dict) -> bool:
+        """
+        Look up the alias of the account a role belongs to in the
+        background, unless it is already known. At most `MAX_LOOKUPS`
+        accounts are looked up at once, and the rest wait their turn.
+
+        :param role_arn: The role which was assumed
+        :param response: The `assume_role_with_saml` response for the role
+        :return: Whether a look up was queued
+        """
+
+        if not self.learning:
+            return False
+
+        account_id, _ = RoleIndex.split_arn(role_arn)
+        if not account_id or account_id in self.static():
+            return False
+        with self._lock:
+            if account_id in self._pending or \
+                    self._cache.get(account_id) is not None:
+                return False
+            self._pending.add(account_id)
+            self._queue.append((account_id, response))
+            if self._workers >= MAX_LOOKUPS:
+                return True
+            self._workers += 1
+
+        # Never holds up the process exiting, see `wait`
+        threading.Thread(
+            target=self._work, name="account-alias", daemon=True,
+        ).start()
+        return True
+
+    def wait(self, timeout: float = LOOKUP_TIMEOUT):
+        """
+        Wait for the look ups queued to be remembered, for at most `timeout`
+        seconds in all
+        """
+
+        with self._done:
+            self._done.wait_for(lambda: not self._pending, timeout)
+
+    def _work(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._workers -= 1
+                    return
+                account_id, response = self._queue.popleft()
+
+            try:
+                self._learn(account_id, response)
+            finally:
+                with self._done:
+                    self._pending.discard(account_id)
+                    self._done.notify_all()
+
+    def _learn(self, account_id: str, response: dict):
+        try:
+            alias = self._lookup(response['Credentials'])
+        except Exception:
+            # Most likely the role may not list aliases
+            alias = None
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self._cache.set(
+            account_id,
+            dict(alias=alias or ''),
+            now + (ALIAS_TTL if alias else MISSING_TTL),
+        )
@@ -4,8 +4,14 @@ Argument Parser
 
 import argparse
 import os
+import re
+import sys
 
-import pkg_resources
+from onelogin_aws_cli.tracing import FORMATS, FORMAT_JSONL
+
+COMMANDS = ('login', 'status', 'serve')
+
+DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
 
 
 class OneLoginAWSArgumentParser(argparse.ArgumentParser):
@@ -14,11 +20,24 @@ class OneLoginAWSArgumentParser(argparse.ArgumentParser):
     def __init__(self):
         super().__init__(description='Login to AWS with OneLogin')
 
+        self.add_argument(
+            'command', nargs='?', choices=COMMANDS, default='login',
+            help='Log in, list how long each saved profile remains valid '
+                 'for, or serve credentials to SDKs and containers over HTTP'
+        )
+
         self.add_argument(
             '-C', '--config-name',
             action=EnvDefault, required=False,
             dest='config_name', default='defaults',
-            help='Switch configuration name within config file'
+            help='Switch configuration name within config file. Several '
+                 'comma separated names log in to each of them at once'
+        )
+
+        self.add_argument(
+            '--all-sections', dest='all_sections', action='store_true',
+            help='Log in to every configuration in the config file at once',
+            default=False,
         )
 
         self.add_argument(
@@ -55,10 +74,115 @@ class OneLoginAWSArgumentParser(argparse.ArgumentParser):
                  'stored in the OS keychain.', default=False,
         )
 
-        version = pkg_resources.get_distribution(__package__).version
+        output = self.add_mutually_exclusive_group()
+
+        output.add_argument(
+            '--credential-process', dest='credential_process',
+            action='store_true',
+            help='Print credentials for use as an AWS credential_process, '
+                 'instead of saving them to the credentials file',
+            default=False,
+        )
+
+        output.add_argument(
+            '--exec', dest='exec', action='store_true',
+            help='Run the command given after -- with the credentials in its '
+                 'environment, instead of saving them to the credentials file',
+            default=False,
+        )
+
+        output.add_argument(
+            '--env', dest='env', action='store_true',
+            help='Print export lines setting the credentials in the '
+                 'environment, instead of saving them to the credentials file',
+            default=False,
+        )
+
+        self.add_argument(
+            '--daemon', '--watch', dest='daemon', action='store_true',
+            help='Keep running, and renew the saved credentials before they '
+                 'expire',
+            default=False,
+        )
+
+        self.add_argument(
+            '--refresh-margin', type=int, dest='refresh_margin',
+            action=EnvDefault, required=False,
+            help='Assume the role again once cached or saved credentials '
+                 'have fewer than this many seconds left'
+        )
+
+        self.add_argument(
+            '--if-expiring-within', type=duration,
+            dest='if_expiring_within',
+            action=EnvDefault, required=False,
+            help='Only log in if the saved profile expires within this long, '
+                 'such as 15m or 1h'
+        )
+
+        self.add_argument(
+            '--no-saml-cache', dest='no_saml_cache', action='store_true',
+            help='Do not reuse, or cache, the SAML assertion from OneLogin',
+            default=False,
+        )
+
+        self.add_argument(
+            '--all-roles', dest='all_roles', action='store_true',
+            help='Assume every role available in the SAML assertion and save '
+                 'a profile for each of them', default=False,
+        )
+
+        self.add_argument(
+            '--role-filter', dest='role_filter',
+            action=EnvDefault, required=False,
+            help='Only assume roles whose ARN matches this glob when used '
+                 'with --all-roles'
+        )
+
+        self.add_argument(
+            '--agent', dest='agent', action='store_true',
+            help='Run a login agent, which keeps logins in memory and hands '
+                 'out credentials to later runs given its --agent-sock',
+            default=False,
+        )
+
+        self.add_argument(
+            '--agent-sock', dest='agent_sock',
+            action=EnvDefault, required=False,
+            help='Unix socket of the login agent to ask for credentials, or '
+                 'for --agent to listen on'
+        )
+
         self.add_argument(
-            '-v', '--version', action='version',
-            version="%(prog)s " + version
+            '--port', type=int, dest='port',
+            action=EnvDefault, required=False, default=0,
+            help='Port for serve to listen on. Defaults to any unused port'
+        )
+
+        self.add_argument(
+            '--timings', dest='timings', action='store_true',
+            help='Print how long each phase of the login took, and how much '
+                 'of it was spent waiting on the user or the network, to '
+                 'stderr', default=False,
+        )
+
+        self.add_argument(
+            '--trace', dest='trace',
+            action=EnvDefault, required=False,
+            help='Append the timing of each phase of the login to this file'
+        )
+
+        self.add_argument(
+            '--trace-format', dest='trace_format',
+            action=EnvDefault, required=False,
+            choices=FORMATS, default=FORMAT_JSONL,
+            help='Write a JSON line for each phase, or a line of '
+                 'OpenTelemetry OTLP/JSON for each login, to --trace'
+        )
+
+        self.add_argument(
+            '-v', '--version', action=LazyVersion,
+            help="show program's version number and exit"
         )
 
         self.add_argument(
@@ -66,6 +190,65 @@ class OneLoginAWSArgumentParser(argparse.ArgumentParser):
             help='Configure OneLogin and AWS settings', default=False
         )
 
+    def parse_known_args(self, args=None, namespace=None):
+        """
+        Parse the arguments, setting `exec_command` to those after `--`
+        """
+
+        args = list(sys.argv[1:] if args is None else args)
+        exec_command = None
+        if '--' in args:
+            split = args.index('--')
+            args, exec_command = args[:split], args[split + 1:]
+
+        namespace, extras = super().parse_known_args(args, namespace)
+        namespace.exec_command = exec_command
+
+        if namespace.exec and not exec_command:
+            self.error("--exec needs a command to run after --")
+        if exec_command is not None and not namespace.exec:
+            self.error("a command after -- is only run with --exec")
+
+        return namespace, extras
+
+
+class LazyVersion(argparse.Action):
+    """
+    Print the installed version. The version is only looked up when it is
+    asked for, so that building the parser stays cheap.
+    """
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, **kwargs):
+        super().__init__(
+            option_strings=option_strings, dest=dest,
+            default=argparse.SUPPRESS, nargs=0, **kwargs
+        )
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        sys.stdout.write("{} {}\n".format(parser.prog, get_version()))
+        parser.exit()
+
+
+def get_version() -> str:
+    """Return the installed version of this package"""
+    try:
+        from importlib.metadata import version
+    except ImportError:  # pragma: no cover - Python < 3.8
+        import pkg_resources
+        return pkg_resources.get_distribution(__package__).version
+    return version(__package__)
+
+
+def duration(value: str) -> int:
+    """Parse a duration such as `900`, `15m` or `1h` into seconds"""
+
+    match = re.match(r'^\s*(\d+)\s*([smhd]?)\s*$', str(value).lower())
+    if match is None:
+        raise argparse.ArgumentTypeError(
+            "Invalid duration '{}'".format(value)
+        )
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
 
 class EnvDefault(argparse.Action):
     """Allow argparse values to be pulled from environment variables"""
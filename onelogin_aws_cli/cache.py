@@ -0,0 +1,164 @@
+"""
+On-disk caches, which allow state to be shared between invocations
+"""
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Optional
+
+CACHE_DIR = os.environ.get(
+    'ONELOGIN_AWS_CLI_CACHE_DIR',
+    os.path.join(os.path.expanduser("~"), ".onelogin-aws-cache"),
+)
+
+
+class FileCache(object):
+    """
+    A namespaced directory of JSON entries, each of which is bounded by its
+    own expiry time. Expired entries are evicted as they are encountered.
+    """
+
+    def __init__(self, namespace: str, cache_dir: str = None):
+        self.path = os.path.join(cache_dir or CACHE_DIR, namespace)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Return the value stored for `key`, or `None` if there is no entry or
+        the entry has expired.
+        """
+
+        filename = self._filename(key)
+        try:
+            with open(filename) as fp:
+                entry = json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get('expires', 0) <= time.time():
+            self._remove(filename)
+            return None
+
+        return self._decode(entry['value'])
+
+    def set(self, key: str, value: dict, expires: datetime.datetime):
+        """
+        Store `value` under `key` until `expires`, and evict any other entries
+        which have expired in the meantime.
+        """
+
+        self.evict_expired()
+
+        encoded = self._encode(value)
+        if encoded is None:
+            return
+
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(dict(expires=expires.timestamp(), value=encoded), fp)
+        os.replace(tmp_name, self._filename(key))
+
+    def delete(self, key: str):
+        """Remove the entry stored for `key`, if any"""
+        self._remove(self._filename(key))
+
+    def evict_expired(self):
+        """Remove every entry in this namespace which has expired"""
+
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+
+        now = time.time()
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            filename = os.path.join(self.path, name)
+            try:
+                with open(filename) as fp:
+                    expires = json.load(fp).get('expires', 0)
+            except (OSError, ValueError):
+                expires = 0
+            if expires <= now:
+                self._remove(filename)
+
+    def _filename(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + '.json')
+
+    def _encode(self, value: dict):
+        return value
+
+    def _decode(self, value):
+        return value
+
+    @staticmethod
+    def _remove(filename: str):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+class EncryptedFileCache(FileCache):
+    """
+    A FileCache whose values are encrypted with a key held in the OS keychain.
+    If the keychain is unavailable, nothing is cached.
+    """
+
+    SERVICE_NAME = "onelogin-aws-cli"
+    KEY_NAME = "cache-encryption-key"
+
+    def __init__(self, namespace: str, cache_dir: str = None, key=None):
+        super().__init__(namespace, cache_dir)
+        self._key = key
+        self._fernet = None
+        self._key_unavailable = False
+
+    def _encode(self, value: dict):
+        fernet = self._load_fernet()
+        if fernet is None:
+            return None
+        return fernet.encrypt(json.dumps(value).encode('utf-8')).decode()
+
+    def _decode(self, value):
+        from cryptography.fernet import InvalidToken
+
+        fernet = self._load_fernet()
+        if fernet is None:
+            return None
+        try:
+            return json.loads(fernet.decrypt(value.encode('utf-8')).decode())
+        except InvalidToken:
+            return None
+
+    def _load_fernet(self):
+        # The key is only looked up once an entry has to be read or written,
+        # so runs which never touch the cache never touch the keychain.
+        if self._fernet is None and not self._key_unavailable:
+            from cryptography.fernet import Fernet
+
+            try:
+                key = self._key
+                if key is None:
+                    key = self._load_key()
+                self._fernet = Fernet(key)
+            except Exception:
+                self._key_unavailable = True
+        return self._fernet
+
+    def _load_key(self) -> str:
+        from cryptography.fernet import Fernet
+        from onelogin_aws_cli import keychain
+
+        # Every cache shares the key, so it is only read from the keychain
+        # once per process
+        key = keychain.get_password(self.SERVICE_NAME, self.KEY_NAME)
+        if key is None:
+            key = Fernet.generate_key().decode()
+            keychain.set_password(self.SERVICE_NAME, self.KEY_NAME, key)
+        return key
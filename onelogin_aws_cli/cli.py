@@ -1,17 +1,32 @@
 """
 Collections of entrypoints
 """
+import contextlib
+import json
+import os
+import shlex
 import sys
+import time
 
 from os import environ
 
-from onelogin_aws_cli import DEFAULT_CONFIG_PATH, OneloginAWS
+from onelogin_aws_cli import (
+    DEFAULT_CONFIG_PATH, DEFAULT_REFRESH_MARGIN, OneloginAWS
+)
+from onelogin_aws_cli.aliases import EXIT_WAIT
 from onelogin_aws_cli.argparse import OneLoginAWSArgumentParser
 from onelogin_aws_cli.configuration import ConfigurationFile
+from onelogin_aws_cli.daemon import RefreshScheduler
+from onelogin_aws_cli.sharedcredentials import SharedCredentialsFile, \
+    shared_credentials_path
+from onelogin_aws_cli.tracing import tracing
 
 
-def _load_config(parser, config_file: ConfigurationFile, args=sys.argv[1:]):
-    cli_args = parser.parse_args(args)
+def _load_configs(config_file: ConfigurationFile, cli_args):
+    config_names = [
+        name.strip() for name in cli_args.config_name.split(',')
+        if name.strip()
+    ]
 
     with open(DEFAULT_CONFIG_PATH, 'a+') as fp:
         fp.seek(0, 0)
@@ -19,19 +34,24 @@ def _load_config(parser, config_file: ConfigurationFile, args=sys.argv[1:]):
         config_file.load()
 
         if (cli_args.configure or not config_file.is_initialised):
-            config_file.initialise(cli_args.config_name)
+            config_file.initialise(config_names[0])
 
-    config_section = config_file.section(cli_args.config_name)
+    if cli_args.all_sections:
+        config_names = config_file.sections() or \
+            [config_file.default_section]
 
-    if config_section is None or not config_section.has_required:
-        sys.exit(
-            "Configuration '{}' not defined. "
-            "Please run 'onelogin-aws-login -c'".format(
-                cli_args.config_name
+    config_sections = []
+    for config_name in config_names:
+        config_section = config_file.section(config_name)
+
+        if config_section is None or not config_section.has_required:
+            sys.exit(
+                "Configuration '{}' not defined. "
+                "Please run 'onelogin-aws-login -c'".format(config_name)
             )
-        )
+        config_sections.append(config_section)
 
-    return config_section, cli_args
+    return config_sections
 
 
 def login(args=sys.argv[1:]):
@@ -43,14 +63,60 @@ def login(args=sys.argv[1:]):
     debug = environ.get('ONELOGIN_AWS_CLI_DEBUG', '0') == '1'
     try:
 
+        args = OneLoginAWSArgumentParser().parse_args(args)
+        if args.command == 'status':
+            _status()
+            return
+
+        skip_if_fresh = args.if_expiring_within is not None and \
+            not (args.credential_process or args.daemon or
+                 args.exec or args.env)
+        if not skip_if_fresh and _agent_login(args):
+            return
+
         cfg = ConfigurationFile()
-        parser = OneLoginAWSArgumentParser()
-        config_section, args = _load_config(parser, cfg, args)
+        config_sections = _load_configs(cfg, args)
+
+        if args.agent:
+            _agent(cfg, args.agent_sock)
+            return
+
+        apis = []
+        for config_section in config_sections:
+            config_section.set_overrides(vars(args))
+            apis.append(OneloginAWS(config_section))
+            if args.credential_process or args.exec or args.env:
+                # Nothing is left to wait for account aliases to be looked
+                # up, and they are only shown when picking a role
+                apis[-1].account_aliases.learning = False
+
+        if args.command == 'serve':
+            _serve(apis, args.port)
+            return
 
-        config_section.set_overrides(vars(args))
+        if skip_if_fresh:
+            if _still_fresh(apis, args.if_expiring_within) or \
+                    _agent_login(args):
+                return
 
-        api = OneloginAWS(config_section)
-        api.save_credentials()
+        if args.exec or args.env:
+            _inject_credentials(apis, args)
+            return
+
+        # Only the first login is timed, rather than the whole daemon
+        with tracing(args.trace, args.trace_format, args.timings):
+            saved = _save_credentials(apis, args)
+
+        if args.daemon and saved is not None:
+            _daemon(apis[0].config, *saved)
+        elif saved is not None:
+            # Briefly, so that the role prompt of the next login shows the
+            # aliases of accounts seen for the first time
+            deadline = time.monotonic() + EXIT_WAIT
+            for api in apis:
+                api.account_aliases.wait(
+                    max(deadline - time.monotonic(), 0)
+                )
 
     except Exception as e:
         if debug:
@@ -58,3 +124,323 @@ def login(args=sys.argv[1:]):
 
         print(str(e))
         sys.exit(1)
+
+
+def _save_credentials(apis: list, args):
+    """
+    Log in and save, or print, the credentials
+
+    :return: The function to refresh the saved profiles with, and the saved
+             profiles, or `None` if nothing was saved
+    """
+
+    if len(apis) > 1:
+        if args.credential_process:
+            raise Exception(
+                "--credential-process only supports a single "
+                "configuration"
+            )
+
+        from onelogin_aws_cli.multilogin import MultiSectionLogin
+        multi = MultiSectionLogin(apis)
+        return multi.refresh_profiles, multi.login(all_roles=args.all_roles)
+
+    api = apis[0]
+    if args.credential_process:
+        _credential_process(api)
+        return None
+
+    if args.all_roles:
+        return api.refresh_profiles, api.save_all_credentials()
+    return api.refresh_profiles, api.save_credentials()
+
+
+def _inject_credentials(apis: list, args):
+    """
+    Assume the role and run a command with, or print, the credentials as
+    environment variables, without touching the credentials file
+    """
+
+    if len(apis) > 1 or args.all_roles:
+        raise Exception(
+            "--exec and --env only support a single configuration and role"
+        )
+
+    api = apis[0]
+    with tracing(args.trace, args.trace_format, args.timings):
+        # Only the exported variables, or the command's output, may be
+        # written to stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            credentials = api.get_credentials(single_flight=False)
+
+    creds = credentials["Credentials"]
+    _run_with_credentials(args, _credential_environment(
+        creds, creds["Expiration"].isoformat(), api.config.get('region')
+    ))
+
+
+def _credential_environment(creds: dict, expiration: str,
+                            region: str = None) -> dict:
+    """Return the environment variables AWS SDKs read credentials from"""
+
+    environment = dict(
+        AWS_ACCESS_KEY_ID=creds["AccessKeyId"],
+        AWS_SECRET_ACCESS_KEY=creds["SecretAccessKey"],
+        AWS_SESSION_TOKEN=creds["SessionToken"],
+        AWS_CREDENTIAL_EXPIRATION=expiration,
+    )
+    if region:
+        environment['AWS_REGION'] = region
+        environment['AWS_DEFAULT_REGION'] = region
+    return environment
+
+
+def _run_with_credentials(args, environment: dict):
+    """
+    Print the environment as export lines for `--env`, or replace this
+    process with the `--exec` command. As the command takes over this
+    process, signals are delivered to it directly and its exit status is
+    the exit status of `onelogin-aws-login`.
+    """
+
+    if args.env:
+        for name, value in sorted(environment.items()):
+            print("export {}={}".format(name, shlex.quote(value)))
+        return
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        os.execvpe(
+            args.exec_command[0], args.exec_command,
+            dict(os.environ, **environment),
+        )
+    except OSError as e:
+        print("Could not run '{}': {}".format(
+            args.exec_command[0], e.strerror
+        ), file=sys.stderr)
+        # As shells do for commands which cannot be found or run
+        sys.exit(127 if isinstance(e, FileNotFoundError) else 126)
+
+
+def _still_fresh(apis: list, window: int) -> bool:
+    """
+    Check the expiry index for whether every profile to be saved remains
+    valid for longer than `window` seconds, without logging in
+
+    :return: True if there is no need to log in
+    """
+
+    saved = []
+    for api in apis:
+        # Every profile of the section, such as each saved with --all-roles
+        profiles = api.saved_profiles()
+        if not profiles or any(left <= window for _, left in profiles):
+            return False
+        saved.extend(profiles)
+
+    for name, remaining in saved:
+        print("Profile {} is valid for another {}".format(
+            name, _format_duration(remaining)
+        ))
+    return True
+
+
+def _status():
+    """
+    List how long each profile saved by this tool remains valid for
+    """
+
+    cred_file = shared_credentials_path()
+    expiry_index = SharedCredentialsFile(cred_file).expiry_index
+    index = expiry_index.load()
+    if not index['profiles']:
+        print("No profiles saved in '{}'".format(cred_file))
+        return
+
+    rows = [("PROFILE", "CONFIG", "EXPIRES", "REMAINING")]
+    for name, entry in sorted(index['profiles'].items()):
+        remaining = expiry_index.remaining(entry, index['clock_skew'])
+        rows.append((
+            name,
+            entry.get('config_name') or '',
+            entry['expiration'],
+            _format_duration(remaining) if remaining > 0 else "expired",
+        ))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(3)]
+    print("Profiles saved in '{}'".format(cred_file))
+    for row in rows:
+        print("  ".join(
+            value.ljust(width) for value, width in zip(row, widths)
+        ) + "  " + row[3])
+
+    if index['clock_skew']:
+        print("Corrected for this clock being {:.0f}s {} AWS".format(
+            abs(index['clock_skew']),
+            "behind" if index['clock_skew'] > 0 else "ahead of",
+        ))
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return "{}h {:02d}m".format(hours, minutes)
+    if minutes:
+        return "{}m {:02d}s".format(minutes, seconds)
+    return "{}s".format(seconds)
+
+
+def _agent_login(args) -> bool:
+    """
+    Ask the login agent for the credentials, if one has been given
+
+    :return: True if the agent answered
+    """
+
+    if not args.agent_sock or args.agent or args.command == 'serve' or \
+            args.configure or args.all_sections or \
+            ',' in args.config_name or \
+            args.all_roles or args.daemon or args.reset_password:
+        return False
+
+    from onelogin_aws_cli.agent import AgentClient, FORWARDED_OPTIONS
+
+    response = AgentClient(args.agent_sock).credentials(
+        args.config_name,
+        {
+            key: getattr(args, key) for key in FORWARDED_OPTIONS
+            if getattr(args, key) not in (None, False)
+        },
+    )
+    if response is None:
+        print("Could not reach the login agent at '{}', logging in without "
+              "it".format(args.agent_sock), file=sys.stderr)
+        return False
+
+    creds = response['credentials']['Credentials']
+    if args.credential_process:
+        _print_credential_process(creds, creds['Expiration'])
+        return True
+
+    if args.exec or args.env:
+        region = args.region or \
+            response['updates'][response['profile']].get('region')
+        _run_with_credentials(args, _credential_environment(
+            creds, creds['Expiration'], region
+        ))
+        return True
+
+    cred_file = shared_credentials_path()
+    SharedCredentialsFile(cred_file).update(
+        response['updates'],
+        expiry=response.get('expiry'),
+        clock_skew=response.get('clock_skew'),
+    )
+
+    print("Credentials cached in '{}'".format(cred_file))
+    print("Expires at {}".format(creds['Expiration']))
+    print("Use aws cli with --profile " + response['profile'])
+    return True
+
+
+def _agent(config_file: ConfigurationFile, path: str = None):
+    """
+    Run a login agent in the foreground until interrupted
+    """
+
+    from onelogin_aws_cli.agent import (
+        DEFAULT_SOCKET_PATH, SOCKET_ENV, AgentServer, LoginAgent
+    )
+
+    path = path or DEFAULT_SOCKET_PATH
+    server = AgentServer(path, LoginAgent(config_file))
+
+    print("{env}={path}; export {env};".format(env=SOCKET_ENV, path=path))
+    print("Login agent listening. Press Ctrl+C to stop.", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _serve(apis: list, port: int = 0):
+    """
+    Serve the credentials of a config section on a loopback HTTP endpoint
+    compatible with the ECS container credentials provider, until
+    interrupted
+    """
+
+    from onelogin_aws_cli.credentialserver import (
+        FULL_URI_ENV, TOKEN_ENV, CredentialServer, RefreshAheadCredentials
+    )
+
+    if len(apis) > 1:
+        raise Exception("serve only supports a single configuration")
+
+    credentials = RefreshAheadCredentials(apis[0])
+    with contextlib.redirect_stdout(sys.stderr):
+        credentials.start()
+
+    server = CredentialServer(credentials, port)
+    for env, value in ((FULL_URI_ENV, server.url), (TOKEN_ENV, server.token)):
+        print("{env}={value}; export {env};".format(env=env, value=value))
+    sys.stdout.flush()
+
+    print("Serving credentials. Press Ctrl+C to stop.", file=sys.stderr)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _daemon(config, refresh_profiles, profiles: dict):
+    """
+    Stay running, renewing the saved profiles shortly before they expire
+    """
+
+    refresh_margin = config.get('refresh_margin')
+    if refresh_margin is None:
+        refresh_margin = DEFAULT_REFRESH_MARGIN
+
+    scheduler = RefreshScheduler(refresh_profiles, int(refresh_margin))
+    scheduler.schedule(profiles)
+
+    print("Renewing credentials {} seconds before they expire. "
+          "Press Ctrl+C to stop.".format(refresh_margin))
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def _credential_process(api: OneloginAWS):
+    """
+    Print the credentials in the format expected by the AWS
+    `credential_process` setting, instead of writing them to disk
+    """
+
+    # Anything other than the credentials written to stdout breaks the
+    # consumer, so interactive prompts are sent to stderr instead.
+    with contextlib.redirect_stdout(sys.stderr):
+        credentials = api.get_credentials()
+
+    creds = credentials["Credentials"]
+    _print_credential_process(creds, creds["Expiration"].isoformat())
+
+
+def _print_credential_process(creds: dict, expiration: str):
+    print(json.dumps(dict(
+        Version=1,
+        AccessKeyId=creds["AccessKeyId"],
+        SecretAccessKey=creds["SecretAccessKey"],
+        SessionToken=creds["SessionToken"],
+        Expiration=expiration,
+    )))
@@ -3,14 +3,16 @@ Handles the saving and loading of username and password in a secure
 manner
 """
 import getpass
-from typing import List
-
-import keyring
-from onelogin.api.models.device import Device
+from typing import List, TYPE_CHECKING
 
+from onelogin_aws_cli import keychain
 from onelogin_aws_cli.configuration import Section
+from onelogin_aws_cli.tracing import USER, span, traced
 from onelogin_aws_cli.userquery import user_choice
 
+if TYPE_CHECKING:  # pragma: no cover
+    from onelogin.api.models.device import Device
+
 
 class MFACredentials(object):
     """
@@ -58,7 +60,25 @@ class MFACredentials(object):
 
         self._otp = None
 
-    def select_device(self, devices: List[Device]):
+    def keep_device(self, devices: List['Device']) -> bool:
+        """
+        Keep using the device selected for an earlier login, if it is one of
+        `devices`
+
+        :return: Whether the device was kept
+        """
+
+        if self.device is None:
+            return False
+        for device in devices:
+            if device.id == self.device.id:
+                self._devices = devices
+                self.device = device
+                return True
+        return False
+
+    @traced("select_mfa_device", USER)
+    def select_device(self, devices: List['Device']):
         """Given a list of MFA devices, select one for use"""
 
         self._devices = devices
@@ -70,6 +90,7 @@ class MFACredentials(object):
             saved_choice=self._config.get("otp_device"),
         )
 
+    @traced("prompt_mfa_token", USER)
     def prompt_token(self):
         """Ask the user for an OTP token"""
         self._otp = input("{device} Token: ".format(device=self.device.type))
@@ -100,6 +121,7 @@ class UserCredentials(object):
         return (self.password is not None) and \
                (self.password != "")
 
+    @traced("load_credentials")
     def load_credentials(self):
         """Load the username and password"""
 
@@ -117,9 +139,11 @@ class UserCredentials(object):
             if 'username' in self.configuration:
                 username = self.configuration['username']
             else:
-                username = input("Onelogin Username: ")
+                with span("prompt_username", USER):
+                    username = input("Onelogin Username: ")
             self.username = username
 
+    @traced("load_password")
     def load_password(self):
         """
         Load the password from keychain if we expect to be able to save the
@@ -161,11 +185,25 @@ class UserCredentials(object):
                 print("Saving password to keychain...")
                 self._save_password_to_keychain()
 
+    @traced("prompt_password", USER)
     def _prompt_user_password(self):
         self.password = getpass.getpass("Onelogin Password: ")
 
+    @traced("keyring_get_password")
     def _load_password_from_keychain(self):
-        self.password = keyring.get_password(self.SERVICE_NAME, self.username)
+        self.password = keychain.get_password(
+            self.SERVICE_NAME, self.username, ttl=self._password_cache_ttl()
+        )
 
+    @traced("keyring_set_password")
     def _save_password_to_keychain(self):
-        keyring.set_password(self.SERVICE_NAME, self.username, self.password)
+        keychain.set_password(
+            self.SERVICE_NAME, self.username, self.password,
+            ttl=self._password_cache_ttl(),
+        )
+
+    def _password_cache_ttl(self) -> float:
+        ttl = self.configuration.get('password_cache_ttl')
+        if ttl is None:
+            return keychain.DEFAULT_PASSWORD_CACHE_TTL
+        return float(ttl)
@@ -0,0 +1,192 @@
+"""
+A loopback HTTP endpoint serving credentials in the format of the ECS
+container credentials provider, for AWS SDKs and containers given
+`AWS_CONTAINER_CREDENTIALS_FULL_URI` and `AWS_CONTAINER_AUTHORIZATION_TOKEN`.
+"""
+import base64
+import datetime
+import hmac
+import json
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Optional
+
+from onelogin_aws_cli import DEFAULT_REFRESH_MARGIN, OneloginAWS
+from onelogin_aws_cli.daemon import RefreshScheduler
+from onelogin_aws_cli.userquery import RoleIndex
+
+FULL_URI_ENV = "AWS_CONTAINER_CREDENTIALS_FULL_URI"
+TOKEN_ENV = "AWS_CONTAINER_AUTHORIZATION_TOKEN"
+CREDENTIALS_PATH = "/credentials"
+
+# AWS SDKs only accept plain HTTP credential endpoints on loopback addresses
+HOST = "127.0.0.1"
+
+
+class RefreshAheadCredentials(object):
+    """
+    Holds the credentials for a config section in memory, and assumes the
+    role again in a background thread `refresh_margin` seconds before they
+    expire. Reads never wait for a refresh, and are answered with the
+    credentials held until the new ones replace them.
+    """
+
+    def __init__(self, api: OneloginAWS):
+        self.api = api
+        self._credentials = None
+        self._assumed_role = None
+
+        refresh_margin = api.config.get('refresh_margin')
+        if refresh_margin is None:
+            refresh_margin = DEFAULT_REFRESH_MARGIN
+        self._scheduler = RefreshScheduler(
+            lambda names: {name: self.refresh() for name in names},
+            int(refresh_margin),
+        )
+
+    def start(self):
+        """
+        Log in, reusing cached credentials if they are fresh, and start
+        renewing them in the background
+        """
+
+        self._credentials = self.api.get_credentials()
+        if not self.api.role_arn:
+            # Answered from the cache, so no role was picked. The role of the
+            # cached credentials is renewed, rather than prompting for one
+            # in the background.
+            self._assumed_role = \
+                self._credentials["AssumedRoleUser"]["Arn"]
+        self._scheduler.schedule(dict(credentials=self._credentials))
+        threading.Thread(
+            target=self._scheduler.run_forever, daemon=True,
+        ).start()
+
+    def refresh(self) -> dict:
+        """Assume the role again, and replace the credentials held"""
+
+        self.api._refresh_saml_assertion()
+        if not self.api.role_arn:
+            self.api.role_arn, self.api.principal_arn = self._cached_role()
+        self.api.assume_role()
+        credentials, self.api.credentials = self.api.credentials, None
+
+        self._credentials = credentials
+        return credentials
+
+    def _cached_role(self) -> tuple:
+        """
+        Return the (role, principal) pair in the SAML assertion which the
+        cached credentials were assumed from
+        """
+
+        # arn:aws:sts::123456789012:assumed-role/Admin/session
+        account_id, resource = self._assumed_role.split(':', 5)[4:]
+        name = resource.split('/')[1]
+
+        self.api.get_arns()
+        for role, principal in self.api.all_roles:
+            role_account, role_name = RoleIndex.split_arn(role)
+            if role_account == account_id and \
+                    role_name.split('/')[-1] == name:
+                return role, principal
+
+        raise Exception("The role of '{}' is not in the SAML assertion".format(
+            self._assumed_role
+        ))
+
+    def current(self) -> Optional[dict]:
+        """
+        Return the `assume_role_with_saml` response held, or `None` if it
+        has expired
+        """
+
+        credentials = self._credentials
+        if credentials is None:
+            return None
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if credentials["Credentials"]["Expiration"] <= now:
+            return None
+        return credentials
+
+
+class CredentialServer(socketserver.ThreadingMixIn, HTTPServer):
+    """Serves a `RefreshAheadCredentials` over HTTP on a loopback address"""
+
+    daemon_threads = True
+    # Hundreds of SDK clients may poll at once
+    request_queue_size = 128
+
+    def __init__(self, credentials: RefreshAheadCredentials, port: int = 0,
+                 token: str = None):
+        """
+        :param port: Port to listen on, or 0 for any unused port
+        :param token: Token which requests must send in their
+                      `Authorization` header, or `None` for a random one
+        """
+        self.credentials = credentials
+        self.token = token or base64.urlsafe_b64encode(
+            os.urandom(32)
+        ).rstrip(b'=').decode('ascii')
+        super().__init__((HOST, port), _Handler)
+
+    @property
+    def url(self) -> str:
+        """The URL to give SDKs as `AWS_CONTAINER_CREDENTIALS_FULL_URI`"""
+        return "http://{}:{}{}".format(
+            HOST, self.server_address[1], CREDENTIALS_PATH
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    # SDKs polling the endpoint keep their connection open
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path != CREDENTIALS_PATH:
+            self._respond(404, dict(
+                code="NotFound", message="Not found",
+            ))
+            return
+
+        token = self.headers.get('Authorization') or ''
+        if not hmac.compare_digest(token.encode('utf-8'),
+                                   self.server.token.encode('utf-8')):
+            self._respond(401, dict(
+                code="AccessDenied", message="Invalid authorization token",
+            ))
+            return
+
+        credentials = self.server.credentials.current()
+        if credentials is None:
+            self._respond(503, dict(
+                code="CredentialsExpired",
+                message="The credentials are being renewed",
+            ))
+            return
+
+        creds = credentials["Credentials"]
+        self._respond(200, dict(
+            AccessKeyId=creds["AccessKeyId"],
+            SecretAccessKey=creds["SecretAccessKey"],
+            Token=creds["SessionToken"],
+            Expiration=creds["Expiration"].astimezone(
+                datetime.timezone.utc
+            ).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            RoleArn=credentials["AssumedRoleUser"]["Arn"],
+        ))
+
+    def _respond(self, status: int, body: dict):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,113 @@
+"""
+Keeps saved credentials valid by renewing them ahead of their expiry
+"""
+import heapq
+import time
+from typing import Callable, Dict, List, Optional
+
+# Renewals falling due within this many seconds of each other are run together
+DEFAULT_COALESCE_WINDOW = 60
+
+# Seconds to wait before trying again after a renewal fails
+RETRY_DELAY = 60
+
+
+class RefreshScheduler(object):
+    """
+    A single timer wheel holding the next renewal time of every profile.
+    When the earliest renewal falls due, every other renewal due within the
+    coalescing window is run in the same batch, so several profiles are
+    renewed with a single SAML assertion.
+    """
+
+    def __init__(self,
+                 refresh: Callable[[List[str]], Dict[str, dict]],
+                 refresh_margin: int,
+                 coalesce_window: int = DEFAULT_COALESCE_WINDOW,
+                 clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        :param refresh: Callback renewing a list of profiles, and returning
+                        a mapping of each profile to its new credentials
+        :param refresh_margin: Seconds before expiry to renew a profile
+        """
+        self._refresh = refresh
+        self._refresh_margin = refresh_margin
+        self._coalesce_window = coalesce_window
+        self._clock = clock
+        self._sleep = sleep
+        self._queue = []
+        self._due = {}
+
+    def schedule(self, profiles: Dict[str, dict]):
+        """
+        Schedule the renewal of each profile ahead of its expiry
+
+        :param profiles: Mapping of profile name to `assume_role_with_saml`
+                         response
+        """
+
+        now = self._clock()
+        for name, credentials in profiles.items():
+            expiration = credentials["Credentials"]["Expiration"].timestamp()
+            # If the credentials last less than the margin, renew them half
+            # way through their lifetime rather than immediately
+            self._push(name, max(
+                expiration - self._refresh_margin,
+                now + (expiration - now) / 2,
+            ))
+
+    def run_pending(self) -> Optional[float]:
+        """
+        Run every renewal which is due, along with any due shortly after it
+
+        :return: Seconds until the next renewal is due, or `None` if there
+                 is nothing left to renew
+        """
+
+        now = self._clock()
+        if self._queue and self._queue[0][0] <= now:
+            batch = []
+            horizon = now + self._coalesce_window
+            while self._queue and self._queue[0][0] <= horizon:
+                due, name = heapq.heappop(self._queue)
+                # Skip entries superseded by a later call to schedule
+                if self._due.get(name) == due:
+                    del self._due[name]
+                    batch.append(name)
+
+            if batch:
+                self._run(batch)
+
+        if not self._queue:
+            return None
+        return max(0.0, self._queue[0][0] - self._clock())
+
+    def run_forever(self):
+        """Keep renewing profiles until there are none left to renew"""
+
+        while True:
+            delay = self.run_pending()
+            if delay is None:
+                return
+            self._sleep(delay)
+
+    def _run(self, names: List[str]):
+        try:
+            profiles = self._refresh(names)
+        except Exception as e:
+            print("Failed to renew {}: {}".format(", ".join(names), e))
+            retry_at = self._clock() + RETRY_DELAY
+            for name in names:
+                self._push(name, retry_at)
+            return
+
+        for name, credentials in profiles.items():
+            print("Renewed {}, expires at {}".format(
+                name, credentials["Credentials"]["Expiration"]
+            ))
+        self.schedule(profiles)
+
+    def _push(self, name: str, due: float):
+        self._due[name] = due
+        heapq.heappush(self._queue, (due, name))
@@ -0,0 +1,152 @@
+"""
+Access to the OS keychain, shared by everything in the process
+
+Finding a keyring backend walks every installed backend, which can take
+seconds when one of them waits on D-Bus, so the backend is resolved once and
+remembered between runs. A backend chosen through `PYTHON_KEYRING_BACKEND` or
+keyring's config file always takes precedence over the remembered one.
+Values read from the keychain are remembered in memory, so that each is only
+read once per process.
+"""
+import datetime
+import importlib
+import threading
+import time
+from typing import Optional
+
+from onelogin_aws_cli.cache import FileCache
+
+# How long the backend found by keyring is remembered for
+DEFAULT_BACKEND_TTL = 30 * 86400
+
+# How long a password read from the keychain is remembered in memory for
+DEFAULT_PASSWORD_CACHE_TTL = 300
+
+_lock = threading.RLock()
+_backend_name = None
+_backend = None
+_values = {}
+
+
+def use_backend(name: Optional[str]):
+    """
+    Use the named keyring backend, such as
+    `keyring.backends.SecretService.Keyring`, instead of searching for one.
+    Has no effect once a backend has been resolved.
+    """
+
+    global _backend_name
+
+    if name:
+        with _lock:
+            _backend_name = name
+
+
+def get_keyring(cache: FileCache = None):
+    """
+    Return the keyring backend, resolving it on first use.
+
+    The backend named by `use_backend` is used if there is one, then the one
+    configured for keyring, then the one found by a previous run, and
+    otherwise keyring searches for one.
+    """
+
+    global _backend
+
+    with _lock:
+        if _backend is not None:
+            return _backend
+
+        if _backend_name is not None:
+            _backend = _load_backend(_backend_name)
+        else:
+            if cache is None:
+                cache = FileCache("keyring-backend")
+            _backend = _resolve_backend(cache)
+        return _backend
+
+
+def _resolve_backend(cache: FileCache):
+    import keyring
+    import keyring.core
+
+    # Configured backends are loaded directly, and are checked every run so
+    # that changing them takes effect at once
+    configured = keyring.core.load_env() or keyring.core.load_config()
+    if configured is not None:
+        return configured
+
+    cached = cache.get("backend")
+    if cached is not None:
+        try:
+            return _load_backend(cached['name'])
+        except Exception:
+            cache.delete("backend")
+
+    backend = keyring.get_keyring()
+    cache.set(
+        "backend",
+        dict(name="{}.{}".format(
+            type(backend).__module__, type(backend).__qualname__
+        )),
+        datetime.datetime.now(datetime.timezone.utc) +
+        datetime.timedelta(seconds=DEFAULT_BACKEND_TTL),
+    )
+    return backend
+
+
+def _load_backend(name: str):
+    # Unlike `keyring.core.load_keyring`, the backend is not asked for its
+    # priority, which is what can block on D-Bus
+    module_name, _, class_name = name.rpartition('.')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def get_password(service: str, username: str,
+                 ttl: Optional[float] = None) -> Optional[str]:
+    """
+    Read a password from the keychain, or from memory if it was read or
+    written within the last `ttl` seconds
+
+    :param ttl: Seconds to remember the password in memory for. `None`
+                remembers it for the life of the process, and `0` not at all
+    """
+
+    key = (service, username)
+    with _lock:
+        remembered = _values.get(key)
+        if remembered is not None and remembered[1] > time.monotonic():
+            return remembered[0]
+
+        password = get_keyring().get_password(service, username)
+        _remember(key, password, ttl)
+        return password
+
+
+def set_password(service: str, username: str, password: str,
+                 ttl: Optional[float] = None):
+    """Write a password to the keychain, and remember it in memory"""
+
+    with _lock:
+        get_keyring().set_password(service, username, password)
+        _remember((service, username), password, ttl)
+
+
+def _remember(key: tuple, password: Optional[str], ttl: Optional[float]):
+    if password is None or ttl == 0:
+        _values.pop(key, None)
+        return
+
+    expires = float('inf') if ttl is None else time.monotonic() + ttl
+    _values[key] = (password, expires)
+
+
+def clear_keychain():
+    """Forget the resolved backend, and every value remembered in memory"""
+
+    global _backend, _backend_name
+
+    with _lock:
+        _backend = None
+        _backend_name = None
+        _values.clear()
@@ -0,0 +1,169 @@
+"""
+Logging in to several config sections at once
+"""
+import threading
+from typing import Dict, List
+
+from onelogin_aws_cli import OneloginAWS
+from onelogin_aws_cli.sharedcredentials import SharedCredentialsFile
+
+
+class MultiSectionLogin(object):
+    """
+    Logs in to several config sections concurrently.
+
+    Sections with the same OneLogin username and subdomain share a single
+    password prompt and MFA device choice, and those which are also for the
+    same AWS app share a single SAML assertion, and so a single MFA token.
+    Prompts are shown one at a time, and the credentials for every section
+    are saved in a single write.
+    """
+
+    def __init__(self, apis: List[OneloginAWS]):
+        """
+        :param apis: One instance for each config section
+        """
+        self.apis = []
+        self.profile_apis = {}
+        self.prompt_lock = threading.RLock()
+        self._lock = threading.Lock()
+        self._users = {}
+        self._saml_locks = {}
+        self._samls = {}
+
+        for api in apis:
+            self.add(api)
+
+    def add(self, api: OneloginAWS):
+        """
+        Log in to another config section alongside the others, sharing
+        prompts and SAML assertions with them
+        """
+
+        api.prompt_lock = self.prompt_lock
+        # Asked up front, as it decides who shares a password
+        with self.prompt_lock:
+            api.user_credentials.load_username()
+
+        key = (api.config.get('subdomain'), api.user_credentials.username)
+        with self._lock:
+            if key in self._users:
+                api.user_credentials, api.mfa = self._users[key]
+            else:
+                self._users[key] = (api.user_credentials, api.mfa)
+            self.apis.append(api)
+
+    def login(self, all_roles: bool = False) -> Dict[str, dict]:
+        """
+        Assume a role, or every matching role, for each section and save the
+        credentials to disk
+
+        :param all_roles: Assume every role matching each section's
+                          `role_filter`, rather than one role per section
+        :return: Mapping of each saved profile name to its credentials
+        """
+
+        results = self._map(lambda api: self._assume(api, all_roles))
+
+        profiles = {}
+        for api, result in zip(self.apis, results):
+            for name in result:
+                if name in self.profile_apis and \
+                        self.profile_apis[name] is not api:
+                    raise Exception(
+                        "Profile '{}' is saved by more than one config "
+                        "section".format(name)
+                    )
+                self.profile_apis[name] = api
+            profiles.update(result)
+
+        cred_file = self._write_credentials(self.apis, results)
+
+        print("Credentials cached in '{}'".format(cred_file))
+        for name, credentials in profiles.items():
+            print("Profile {} expires at {}".format(
+                name, credentials["Credentials"]["Expiration"]
+            ))
+
+        return profiles
+
+    def refresh_profiles(self, names: list) -> Dict[str, dict]:
+        """
+        Assume the roles behind previously saved profiles again, and save the
+        new credentials to disk in a single write
+
+        :param names: Names of profiles saved by `login`
+        :return: Mapping of each profile name to its new credentials
+        """
+
+        by_api = {}
+        for name in names:
+            by_api.setdefault(self.profile_apis[name], []).append(name)
+
+        def reassume(api):
+            self.load_saml_assertion(api, refresh=True)
+            roles = [api.profile_roles[name] for name in by_api[api]]
+            return dict(zip(by_api[api], api.assume_all_roles(roles)))
+
+        apis = list(by_api)
+        results = self._map(reassume, apis)
+        self._write_credentials(apis, results)
+
+        profiles = {}
+        for result in results:
+            profiles.update(result)
+        return profiles
+
+    def _assume(self, api: OneloginAWS, all_roles: bool) -> dict:
+        self.load_saml_assertion(api)
+        return api.assume_profiles(all_roles)
+
+    def load_saml_assertion(self, api: OneloginAWS, refresh: bool = False):
+        """
+        Give `api` the SAML assertion shared by sections with the same
+        username and app, fetching it if there is none yet
+
+        :param refresh: Fetch a new assertion if the shared one has expired
+        """
+
+        key = (
+            api.config.get('subdomain'),
+            api.user_credentials.username,
+            api.config.get('aws_app_id'),
+        )
+        with self._lock:
+            lock = self._saml_locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if key in self._samls:
+                api.saml = self._samls[key]
+                if refresh:
+                    # Only fetched again if it has expired
+                    api._refresh_saml_assertion()
+            else:
+                api.get_saml_assertion()
+            self._samls[key] = api.saml
+
+    def _map(self, fn, apis: List[OneloginAWS] = None) -> list:
+        from concurrent.futures import ThreadPoolExecutor
+
+        apis = self.apis if apis is None else apis
+        with ThreadPoolExecutor(max_workers=len(apis)) as executor:
+            return list(executor.map(fn, apis))
+
+    @staticmethod
+    def _write_credentials(apis: List[OneloginAWS], results: list) -> str:
+        updates = {}
+        expiry = {}
+        clock_skew = None
+        for api, profiles in zip(apis, results):
+            updates.update(api.credential_updates(profiles))
+            expiry.update(api.expiry_updates(profiles))
+            if api.clock_skew is not None:
+                clock_skew = api.clock_skew
+
+        cred_file = apis[0]._initialize_credentials()
+        SharedCredentialsFile(cred_file).update(
+            updates, expiry=expiry, clock_skew=clock_skew
+        )
+        return cred_file
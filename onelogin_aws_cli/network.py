@@ -0,0 +1,99 @@
+"""
+Information about the network this machine is currently connected to
+"""
+import hashlib
+import ipaddress
+import socket
+import urllib.request
+from typing import List, Optional
+
+# Services which respond with the public IP address of the caller
+DEFAULT_IP_ADDRESS_ENDPOINTS = [
+    "https://api.ipify.org",
+    "https://checkip.amazonaws.com",
+    "https://icanhazip.com",
+]
+
+DEFAULT_IP_ADDRESS_TIMEOUT = 3
+
+# An address from TEST-NET-1 (RFC 5737). Connecting a UDP socket to it only
+# selects a route, and never sends a packet.
+_ROUTE_PROBE_ADDRESS = ('192.0.2.1', 9)
+
+
+def default_route_address() -> Optional[str]:
+    """Return the local address of the interface with the default route"""
+
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(_ROUTE_PROBE_ADDRESS)
+            return sock.getsockname()[0]
+    except OSError:
+        return None
+
+
+def network_fingerprint() -> str:
+    """
+    Return a short identifier for the current network, which changes when the
+    set of network interfaces or the default route changes.
+    """
+
+    parts = []
+    try:
+        parts.extend(sorted(name for _, name in socket.if_nameindex()))
+    except (AttributeError, OSError):
+        pass
+    parts.append(default_route_address() or '')
+
+    return hashlib.sha256(
+        '\n'.join(parts).encode('utf-8')
+    ).hexdigest()[:16]
+
+
+def lookup_public_ip(endpoints: List[str],
+                     timeout: float = DEFAULT_IP_ADDRESS_TIMEOUT
+                     ) -> Optional[str]:
+    """
+    Ask every endpoint for our public IP address at the same time, and
+    return the first valid answer
+
+    :param endpoints: URLs which respond with the caller's IP address
+    :param timeout: Seconds to wait for an answer, in total
+    :return: The IP address, or `None` if no endpoint answered in time
+    """
+
+    import queue
+    import threading
+    import time
+
+    answers = queue.Queue()
+    for url in endpoints:
+        # Never holds up the process exiting once one endpoint has answered,
+        # unlike the non-daemon workers of a ThreadPoolExecutor
+        threading.Thread(
+            target=lambda url=url: answers.put(
+                _fetch_ip_address(url, timeout)
+            ),
+            name="public-ip", daemon=True,
+        ).start()
+
+    deadline = time.monotonic() + timeout
+    for _ in endpoints:
+        try:
+            ip_address = answers.get(
+                timeout=max(deadline - time.monotonic(), 0)
+            )
+        except queue.Empty:
+            break
+        if ip_address is not None:
+            return ip_address
+    return None
+
+
+def _fetch_ip_address(url: str, timeout: float) -> Optional[str]:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            text = response.read(64).decode('ascii').strip()
+        return str(ipaddress.ip_address(text))
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,148 @@
+"""
+Reuse of OneLogin API OAuth tokens between invocations
+"""
+import datetime
+import random
+import time
+from typing import Callable
+
+from onelogin_aws_cli.cache import FileCache
+from onelogin_aws_cli.saml import parse_saml_datetime
+
+# Refresh an access token once it has less than this long left
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+# Attempts made to get a token while OneLogin is rate limiting us
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+RATE_LIMITED = '429'
+UNAUTHORIZED = '401'
+# The description OneLogin gives a 401 for an invalid access token, as
+# opposed to one for the user's credentials
+INVALID_TOKEN = 'Unauthorized'
+
+
+class TokenStore(object):
+    """
+    Keeps the OneLogin API OAuth token in a cache, so that a single token
+    serves every login made during its lifetime, and refreshes it shortly
+    before it expires rather than after. A reused token which the API
+    rejects, such as one revoked before it expired, is forgotten.
+    """
+
+    def __init__(self, cache: FileCache, key: str,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        :param cache: Cache to keep the token in
+        :param key: Identifies the API credentials the token belongs to
+        """
+        self._cache = cache
+        self._key = key
+        self._sleep = sleep
+        self._reused = False
+
+    def prepare(self, client):
+        """
+        Make sure `client` holds an access token which will remain valid for
+        a while, loading it from the cache, refreshing it or requesting a new
+        one as needed.
+
+        :param client: A `onelogin.api.client.OneLoginClient`
+        """
+
+        if client.access_token is None:
+            self._load(client)
+
+        self._reused = client.access_token is not None and \
+            self._is_fresh(client)
+        if self._reused:
+            return
+
+        for attempt in range(MAX_ATTEMPTS):
+            if client.access_token is not None and client.refresh_token:
+                client.regenerate_token()
+                refreshing = True
+            else:
+                client.get_access_token()
+                refreshing = False
+
+            if client.error is None and client.access_token is not None:
+                self._save(client)
+                return
+
+            if client.error == RATE_LIMITED:
+                self._sleep(self._backoff(attempt))
+            elif refreshing:
+                # The refresh token was rejected, so start again from scratch
+                client.remove_stored_token()
+            else:
+                break
+
+        raise Exception("Onelogin Error: '{error}' '{desc}'".format(
+            error=client.error,
+            desc=client.error_description,
+        ))
+
+    def rejected(self, client) -> bool:
+        """
+        Return whether the last call made by `client` was rejected because
+        the token reused by `prepare` is no longer valid, in which case it is
+        forgotten so that the next `prepare` requests a new one.
+
+        A token requested by `prepare` itself is never considered rejected,
+        and neither is one refused with any other description than the one
+        OneLogin gives an invalid token, as the call was then refused for
+        another reason, such as the user's password.
+
+        :param client: A `onelogin.api.client.OneLoginClient`
+        """
+
+        if not self._reused or client.error != UNAUTHORIZED or \
+                client.error_description != INVALID_TOKEN:
+            return False
+
+        self._reused = False
+        self.clear()
+        client.remove_stored_token()
+        return True
+
+    def clear(self):
+        """Forget the cached token"""
+        self._cache.delete(self._key)
+
+    @staticmethod
+    def _is_fresh(client) -> bool:
+        if client.expiration is None:
+            return True
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return client.expiration - REFRESH_MARGIN > now
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+        # Spread retries out, so that everyone rate limited at the same time
+        # does not retry at the same time too
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _load(self, client):
+        cached = self._cache.get(self._key)
+        if cached is None:
+            return
+        client.access_token = cached['access_token']
+        client.refresh_token = cached['refresh_token']
+        client.expiration = parse_saml_datetime(cached['expiration'])
+
+    def _save(self, client):
+        if client.expiration is None:
+            return
+        self._cache.set(
+            self._key,
+            dict(
+                access_token=client.access_token,
+                refresh_token=client.refresh_token,
+                expiration=client.expiration.isoformat(),
+            ),
+            client.expiration,
+        )
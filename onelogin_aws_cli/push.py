@@ -0,0 +1,163 @@
+"""
+Approving MFA with a push notification, instead of typing an OTP
+"""
+import sys
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+# Device types which OneLogin can send a push notification to
+PUSH_DEVICE_TYPES = ("OneLogin Protect",)
+
+DEFAULT_PUSH_INTERVAL = 1.0
+MAX_PUSH_INTERVAL = 8.0
+DEFAULT_PUSH_TIMEOUT = 60.0
+
+
+def supports_push(device) -> bool:
+    """True if the MFA device can be approved with a push notification"""
+    return getattr(device, 'type', None) in PUSH_DEVICE_TYPES
+
+
+def read_line(prompt: str, stop: threading.Event) -> Optional[str]:
+    """
+    Ask the user for a line of input, giving up once `stop` is set
+
+    :return: The line, or `None` if input is not a terminal or `stop` was set
+             first
+    """
+
+    try:
+        import select
+        if not sys.stdin.isatty():
+            return None
+        fd = sys.stdin.fileno()
+    except (ImportError, AttributeError, ValueError, OSError):
+        return None
+
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    while not stop.is_set():
+        readable, _, _ = select.select([fd], [], [], 0.1)
+        if readable:
+            return sys.stdin.readline().strip() or None
+    sys.stdout.write("\n")
+    return None
+
+
+def backoff(interval: float, max_interval: float) -> Iterator[float]:
+    """Yield `interval`, doubling it each time up to `max_interval`"""
+    while True:
+        yield interval
+        interval = min(interval * 2, max_interval)
+
+
+class PushVerification(object):
+    """
+    Verifies an MFA device by push notification, polling OneLogin until the
+    user approves it, while optionally accepting a typed OTP instead.
+    Whichever is verified first wins.
+    """
+
+    def __init__(self, verify: Callable[..., object],
+                 interval: float = DEFAULT_PUSH_INTERVAL,
+                 max_interval: float = MAX_PUSH_INTERVAL,
+                 timeout: float = DEFAULT_PUSH_TIMEOUT,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param verify: Calls `get_saml_assertion_verifying` for the device,
+                       accepting `otp_token` and `do_not_notify` keyword
+                       arguments, and raising if OneLogin returns an error
+        :param interval: Seconds to wait before polling for the first time,
+                         doubling after every poll up to `max_interval`
+        :param timeout: Seconds to wait for the push to be approved
+        """
+        self._verify = verify
+        self._interval = interval
+        self._max_interval = max_interval
+        self._timeout = timeout
+        self._clock = clock
+
+        # OneLogin clients keep the error of the last call on themselves, so
+        # calls must not overlap
+        self._call_lock = threading.Lock()
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    def run(self, read_otp: Callable[[threading.Event], Optional[str]] = None):
+        """
+        Send the push notification and wait for it to be approved
+
+        :param read_otp: Asks the user for an OTP, giving up once the event
+                         is set
+        :return: The `SAMLEndpointResponse` holding the SAML assertion
+        """
+
+        response = self._call(do_not_notify=False)
+        if getattr(response, 'saml_response', None):
+            return response
+
+        if read_otp is not None:
+            threading.Thread(
+                target=self._otp_fallback, args=(read_otp,),
+                name="mfa-otp", daemon=True,
+            ).start()
+
+        try:
+            self._poll()
+        finally:
+            self._done.set()
+
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def _poll(self):
+        deadline = self._clock() + self._timeout
+        for interval in backoff(self._interval, self._max_interval):
+            remaining = max(deadline - self._clock(), 0)
+            if self._done.wait(min(interval, remaining)):
+                return
+            if self._clock() >= deadline:
+                self._finish(error=Exception(
+                    "Timed out waiting for the MFA push to be approved"
+                ))
+                return
+
+            try:
+                response = self._call(do_not_notify=True)
+            except Exception as e:
+                self._finish(error=e)
+                return
+
+            if getattr(response, 'saml_response', None):
+                self._finish(result=response)
+                return
+
+    def _otp_fallback(self, read_otp):
+        while True:
+            otp = read_otp(self._done)
+            if otp is None or self._done.is_set():
+                return
+            try:
+                response = self._call(otp_token=otp)
+            except Exception as e:
+                # Most likely mistyped, and the push may still be approved,
+                # so let the user try again
+                print("The token was not accepted: {}".format(e))
+                continue
+            self._finish(result=response)
+            return
+
+    def _call(self, **kwargs):
+        with self._call_lock:
+            return self._verify(**kwargs)
+
+    def _finish(self, result=None, error: Exception = None):
+        with self._call_lock:
+            if self._done.is_set():
+                return
+            self._result = result
+            self._error = error
+            self._done.set()
@@ -0,0 +1,172 @@
+"""
+Helpers for inspecting SAML assertions returned by OneLogin
+"""
+import binascii
+import datetime
+import re
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+from typing import Iterator, List, Optional, Tuple
+
+NAMESPACE = "{urn:oasis:names:tc:SAML:2.0:assertion}"
+DATETIME_PATTERN = re.compile(
+    r'^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:?\d\d)?$'
+)
+
+ROLE_ATTRIBUTE = "https://aws.amazon.com/SAML/Attributes/Role"
+SESSION_NAME_ATTRIBUTE = \
+    "https://aws.amazon.com/SAML/Attributes/RoleSessionName"
+SESSION_DURATION_ATTRIBUTE = \
+    "https://aws.amazon.com/SAML/Attributes/SessionDuration"
+
+# Base64 characters decoded and parsed at a time. Must be a multiple of 4.
+CHUNK_SIZE = 64 * 1024
+
+_ATTRIBUTE = NAMESPACE + "Attribute"
+_ATTRIBUTE_VALUE = NAMESPACE + "AttributeValue"
+_ATTRIBUTE_STATEMENT = NAMESPACE + "AttributeStatement"
+_EXPIRING = (NAMESPACE + "SubjectConfirmationData", NAMESPACE + "Conditions")
+_WANTED = (ROLE_ATTRIBUTE, SESSION_NAME_ATTRIBUTE, SESSION_DURATION_ATTRIBUTE)
+
+SAMLAttributes = namedtuple('SAMLAttributes', [
+    'roles',
+    'session_name',
+    'session_duration',
+    'expiry',
+])
+
+
+def parse_saml_datetime(value: str) -> datetime.datetime:
+    """Parse an xs:dateTime value, as used by SAML, into an aware datetime"""
+
+    match = DATETIME_PATTERN.match(value.strip())
+    if match is None:
+        raise ValueError("Invalid SAML datetime '{}'".format(value))
+
+    date, fraction, offset = match.groups()
+    result = datetime.datetime.strptime(date, '%Y-%m-%dT%H:%M:%S')
+    if fraction:
+        result = result.replace(microsecond=int(fraction[:6].ljust(6, '0')))
+
+    tzinfo = datetime.timezone.utc
+    if offset and offset != 'Z':
+        delta = datetime.timedelta(
+            hours=int(offset[1:3]), minutes=int(offset[-2:])
+        )
+        tzinfo = datetime.timezone(delta if offset[0] == '+' else -delta)
+
+    return result.replace(tzinfo=tzinfo)
+
+
+def parse_role(value: str) -> Tuple[str, str]:
+    """
+    Split an AWS Role attribute value into its role and principal ARNs.
+
+    The format should be `role_arn,principal_arn`, but lots of blogs list it
+    as `principal_arn,role_arn`, so either order is accepted.
+    """
+
+    first, second = [arn.strip() for arn in value.split(",")]
+    if ":saml-provider/" in first or ":role/" in second:
+        return second, first
+    return first, second
+
+
+def parse_assertion(saml_response, chunk_size: int = CHUNK_SIZE
+                    ) -> SAMLAttributes:
+    """
+    Extract the AWS attributes and expiry from a SAML response.
+
+    The response is decoded and parsed incrementally, and parsing stops as
+    soon as the AWS attributes have been read, so neither the decoded
+    response nor a tree of the whole document is kept in memory.
+
+    :param saml_response: Base64 encoded SAML response
+    :param chunk_size: Base64 characters to decode at a time
+    """
+
+    parser = ElementTree.XMLPullParser(events=('start', 'end'))
+    found = {}
+    expiries = []
+    ancestors = []
+
+    for chunk in _decoded_chunks(saml_response, chunk_size):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                ancestors.append(element)
+                continue
+
+            ancestors.pop()
+            if element.tag in _EXPIRING:
+                not_on_or_after = element.get("NotOnOrAfter")
+                if not_on_or_after:
+                    try:
+                        expiries.append(parse_saml_datetime(not_on_or_after))
+                    except ValueError:
+                        pass
+            elif element.tag == _ATTRIBUTE:
+                name = element.get("Name")
+                if name in _WANTED:
+                    found[name] = [
+                        (value.text or '').strip()
+                        for value in element.iter(_ATTRIBUTE_VALUE)
+                    ]
+            elif element.tag == _ATTRIBUTE_STATEMENT and \
+                    ROLE_ATTRIBUTE in found:
+                # Every attribute of interest lives in this statement
+                return _attributes(found, expiries)
+
+            if element.tag != _ATTRIBUTE_VALUE:
+                # Nothing below here is needed any more
+                element.clear()
+                if ancestors:
+                    ancestors[-1].remove(element)
+
+            if all(name in found for name in _WANTED):
+                return _attributes(found, expiries)
+
+    parser.close()
+    return _attributes(found, expiries)
+
+
+def assertion_expiry(saml_response) -> Optional[datetime.datetime]:
+    """
+    Return the time after which the assertion can no longer be used, being
+    the earliest `NotOnOrAfter` in either its `SubjectConfirmationData` or
+    `Conditions`.
+
+    :param saml_response: Base64 encoded SAML response
+    :return: The expiry time, or `None` if it could not be determined
+    """
+
+    try:
+        return parse_assertion(saml_response).expiry
+    except (ValueError, ElementTree.ParseError):
+        return None
+
+
+def _attributes(found: dict, expiries: List[datetime.datetime]
+                ) -> SAMLAttributes:
+    session_name = found.get(SESSION_NAME_ATTRIBUTE) or [None]
+    session_duration = found.get(SESSION_DURATION_ATTRIBUTE) or [None]
+    try:
+        session_duration = int(session_duration[0])
+    except (TypeError, ValueError):
+        # Not needed to log in, so a malformed value is not worth failing on
+        session_duration = None
+    return SAMLAttributes(
+        roles=[parse_role(value) for value in found.get(ROLE_ATTRIBUTE, [])],
+        session_name=session_name[0],
+        session_duration=session_duration,
+        expiry=min(expiries) if expiries else None,
+    )
+
+
+def _decoded_chunks(saml_response, chunk_size: int) -> Iterator[bytes]:
+    if isinstance(saml_response, str):
+        saml_response = saml_response.encode('ascii')
+    saml_response = re.sub(rb'[^A-Za-z0-9+/=]', b'', saml_response)
+
+    for start in range(0, len(saml_response), chunk_size):
+        yield binascii.a2b_base64(saml_response[start:start + chunk_size])
@@ -0,0 +1,178 @@
+"""
+Credentials for using the roles of a config section from within a Python
+process, which renew themselves rather than being read from the credentials
+file.
+
+    from onelogin_aws_cli.session import boto3_session
+
+    session = boto3_session('live-admin')
+    session.client('s3').list_buckets()
+"""
+import threading
+import time
+
+from botocore.credentials import CredentialProvider, RefreshableCredentials
+
+from onelogin_aws_cli import DEFAULT_CONFIG_PATH, DEFAULT_REFRESH_MARGIN, \
+    OneloginAWS
+from onelogin_aws_cli.configuration import ConfigurationFile, Section
+from onelogin_aws_cli.daemon import RETRY_DELAY
+
+METHOD = "onelogin-aws"
+
+
+def load_section(config_name: str = None, path: str = DEFAULT_CONFIG_PATH,
+                 **overrides) -> Section:
+    """
+    Load a section of the config file, without prompting to create it
+
+    :param config_name: Name of the section, or `None` for the defaults
+    :param overrides: Values overriding the directives in the section
+    """
+
+    with open(path) as fp:
+        config_file = ConfigurationFile(fp)
+
+    config_name = config_name or config_file.default_section
+    section = config_file.section(config_name)
+    if section is None or not section.has_required:
+        raise Exception("Configuration '{}' not defined".format(config_name))
+
+    section.set_overrides(overrides)
+    return section
+
+
+class CredentialFetcher(object):
+    """
+    The refresh callback of a botocore `RefreshableCredentials`, which
+    assumes the role of a `OneloginAWS` again. The SAML assertion held in
+    memory or in the cache is reused while it is valid, as is the STS client.
+    """
+
+    def __init__(self, api: OneloginAWS):
+        self.api = api
+        self.expiration = None
+        self._lock = threading.Lock()
+
+    def __call__(self) -> dict:
+        with self._lock:
+            if self.api.cached_credentials() is None:
+                self.api._refresh_saml_assertion()
+            credentials = self.api.get_credentials(single_flight=False)
+
+        creds = credentials["Credentials"]
+        self.expiration = creds["Expiration"]
+        return dict(
+            access_key=creds["AccessKeyId"],
+            secret_key=creds["SecretAccessKey"],
+            token=creds["SessionToken"],
+            expiry_time=creds["Expiration"].isoformat(),
+        )
+
+
+def refreshable_credentials(api: OneloginAWS,
+                            background: bool = True
+                            ) -> RefreshableCredentials:
+    """
+    Log in, and return credentials which assume the role again once they
+    have fewer than `refresh_margin` seconds left
+
+    :param api: The config section to assume the role of
+    :param background: Renew the credentials in a background thread, so that
+                       threads using them are not held up by a renewal
+    """
+
+    refresh_margin = api.config.get('refresh_margin')
+    if refresh_margin is None:
+        refresh_margin = DEFAULT_REFRESH_MARGIN
+    refresh_margin = int(refresh_margin)
+
+    fetcher = CredentialFetcher(api)
+    credentials = RefreshableCredentials.create_from_metadata(
+        fetcher(), fetcher, METHOD,
+        advisory_timeout=refresh_margin,
+        mandatory_timeout=refresh_margin // 2,
+    )
+
+    if background:
+        threading.Thread(
+            target=_renew_forever,
+            args=(credentials, fetcher, refresh_margin),
+            daemon=True,
+        ).start()
+    return credentials
+
+
+def _renew_forever(credentials: RefreshableCredentials,
+                   fetcher: CredentialFetcher, refresh_margin: int):
+    # Wakes just inside the advisory window, where botocore renews the
+    # credentials in this thread while others carry on with the old ones
+    while True:
+        expiration = fetcher.expiration.timestamp()
+        now = time.time()
+        # If the credentials last less than the margin, renew them half way
+        # through their lifetime rather than immediately. Once they have
+        # expired, as after failed renewals or a suspend, renew them now.
+        time.sleep(max(0, max(
+            expiration - refresh_margin + 1,
+            now + (expiration - now) / 2,
+        ) - now))
+
+        try:
+            credentials.get_frozen_credentials()
+        except Exception:
+            # botocore logs failed renewals, and raises them within the
+            # mandatory window
+            pass
+        if fetcher.expiration.timestamp() == expiration:
+            time.sleep(RETRY_DELAY)
+
+
+class OneloginCredentialProvider(CredentialProvider):
+    """
+    A botocore credential provider for the roles of a config section, tried
+    ahead of any other
+    """
+
+    METHOD = METHOD
+    CANONICAL_NAME = "OneloginAWS"
+
+    def __init__(self, api: OneloginAWS, background: bool = True):
+        super().__init__()
+        self.api = api
+        self.background = background
+
+    def load(self) -> RefreshableCredentials:
+        return refreshable_credentials(self.api, self.background)
+
+
+def boto3_session(config_name: str = None, api: OneloginAWS = None,
+                  region_name: str = None, background: bool = True,
+                  **overrides):
+    """
+    Return a boto3 Session whose clients use the renewing credentials of a
+    config section. The first client created logs in.
+
+    :param config_name: Name of the section, or `None` for the defaults
+    :param api: The config section to assume the role of, instead of loading
+                it from the config file
+    :param region_name: Region of the session, or `None` for the `region`
+                        directive
+    :param background: Renew the credentials in a background thread
+    :param overrides: Values overriding the directives in the section
+    """
+
+    import boto3
+    import botocore.session
+
+    if api is None:
+        api = OneloginAWS(load_section(config_name, **overrides))
+
+    botocore_session = botocore.session.get_session()
+    botocore_session.get_component('credential_provider').insert_before(
+        'env', OneloginCredentialProvider(api, background),
+    )
+    return boto3.Session(
+        botocore_session=botocore_session,
+        region_name=region_name or api.config.get('region'),
+    )
@@ -0,0 +1,321 @@
+"""
+Updates to the AWS CLI shared credentials file, which are safe to make from
+several processes at once
+"""
+import contextlib
+import json
+import os
+import re
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from onelogin_aws_cli.saml import parse_saml_datetime
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+SECTION = re.compile(r'^\s*\[(?P<name>[^\]]+)\]')
+OPTION = re.compile(r'^(?P<key>[^\s=:;#\[][^=:]*?)\s*[=:]')
+
+
+def shared_credentials_path() -> str:
+    """
+    Return the path to the AWS CLI shared credentials file, creating the
+    `~/.aws` directory if it is the default location and does not exist yet
+    """
+
+    cred_file = os.environ.get('AWS_SHARED_CREDENTIALS_FILE', None)
+
+    if cred_file is None:
+        cred_file = os.path.expanduser("~/.aws/credentials")
+        cred_dir = os.path.expanduser("~/.aws/")
+        if not os.path.exists(cred_dir):
+            os.makedirs(cred_dir)
+
+    return cred_file
+
+
+@contextlib.contextmanager
+def exclusive_lock(path: str):
+    """
+    Hold an exclusive lock on a lock file, which is removed again when the
+    lock is released so that none are left behind
+    """
+
+    while True:
+        lock_file = open(path, "a")
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if _is_current(lock_file, path):
+            break
+        # Removed by the process which held it before, so anyone locking it
+        # now would not exclude anyone locking its replacement
+        lock_file.close()
+
+    try:
+        yield
+    finally:
+        with contextlib.suppress(OSError):
+            os.remove(path)
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def _is_current(lock_file, path: str) -> bool:
+    try:
+        current = os.stat(path)
+    except OSError:
+        return False
+    opened = os.fstat(lock_file.fileno())
+    return (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino)
+
+
+class _Section(object):
+    """The lines of a single profile, kept verbatim unless updated"""
+
+    def __init__(self, name: Optional[str], header: List[str]):
+        self.name = name
+        self.header = header
+        self.body = []
+
+    def lines(self) -> List[str]:
+        return self.header + self.body
+
+    def update(self, values: Dict[str, str]) -> bool:
+        """
+        Set each option to its new value, in place where it already exists
+
+        :return: True if anything changed
+        """
+
+        changed = False
+        for key, value in values.items():
+            line = "{} = {}\n".format(key, value)
+            index = self._find(key)
+            if index is None:
+                self.body.insert(self._append_at(), line)
+                changed = True
+            elif self.body[index] != line:
+                end = index + 1
+                # Drop any continuation lines of the old value
+                while end < len(self.body) and \
+                        self.body[end][:1] in (' ', '\t') and \
+                        self.body[end].strip():
+                    end += 1
+                self.body[index:end] = [line]
+                changed = True
+        return changed
+
+    def _find(self, key: str) -> Optional[int]:
+        for i, line in enumerate(self.body):
+            match = OPTION.match(line)
+            if match and match.group('key').strip().lower() == key.lower():
+                return i
+        return None
+
+    def _append_at(self) -> int:
+        # New options go after the last non-blank line, so that blank lines
+        # separating this profile from the next one stay where they are.
+        for i in range(len(self.body), 0, -1):
+            if self.body[i - 1].strip():
+                return i
+        return 0
+
+
+class SharedCredentialsFile(object):
+    """
+    The AWS CLI shared credentials file.
+
+    Updates hold an exclusive lock for the whole read-modify-write, only touch
+    the profiles and options being changed, keeping every other line
+    (including comments and ordering) byte for byte, and replace the file
+    atomically so readers never see a partially written file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.expiry_index = ExpiryIndex(path + ".expiry.json")
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Hold an exclusive lock on the credentials file"""
+
+        with exclusive_lock(self.lock_path):
+            yield
+
+    def update(self, profiles: Dict[str, Dict[str, str]],
+               expiry: Dict[str, dict] = None,
+               clock_skew: Optional[float] = None) -> bool:
+        """
+        Apply updates to several profiles in a single transaction
+
+        :param profiles: Mapping of profile name to the options to set in it
+        :param expiry: Mapping of profile name to its entry in the expiry
+                       index, which is updated in the same transaction
+        :param clock_skew: Seconds the clock of AWS is ahead of this one
+        :return: True if the file was changed
+        """
+
+        with self.lock():
+            sections = self._read()
+
+            changed = False
+            by_name = {s.name: s for s in sections if s.name is not None}
+            for name, values in profiles.items():
+                section = by_name.get(name)
+                if section is None:
+                    section = self._append_section(sections, name)
+                    by_name[name] = section
+                changed = section.update(values) or changed
+
+            if changed:
+                self._write(sections)
+
+            if expiry:
+                self.expiry_index.update(expiry, clock_skew)
+
+        return changed
+
+    def _read(self) -> List[_Section]:
+        try:
+            with open(self.path) as fp:
+                lines = fp.readlines()
+        except FileNotFoundError:
+            lines = []
+
+        if lines and not lines[-1].endswith('\n'):
+            lines[-1] += '\n'
+
+        sections = [_Section(None, [])]
+        for line in lines:
+            match = SECTION.match(line)
+            if match:
+                sections.append(_Section(match.group('name').strip(), [line]))
+            else:
+                sections[-1].body.append(line)
+        return sections
+
+    @staticmethod
+    def _append_section(sections: List[_Section], name: str) -> _Section:
+        last = sections[-1]
+        if last.lines() and last.lines()[-1].strip():
+            last.body.append("\n")
+        section = _Section(name, ["[{}]\n".format(name)])
+        sections.append(section)
+        return section
+
+    def _write(self, sections: List[_Section]):
+        # Replace the file a symlink points to, as in dotfile setups, rather
+        # than the symlink itself
+        path = os.path.realpath(self.path)
+        directory = os.path.dirname(path)
+        fd, tmp_name = tempfile.mkstemp(
+            dir=directory, prefix=".credentials-", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as fp:
+                for section in sections:
+                    fp.writelines(section.lines())
+                fp.flush()
+                os.fsync(fp.fileno())
+            try:
+                os.chmod(tmp_name, os.stat(path).st_mode & 0o777)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_name, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_name)
+            raise
+
+
+class ExpiryIndex(object):
+    """
+    Records when each profile saved by this tool expires, in a file next to
+    the credentials file rather than inside it, along with the difference
+    between the clocks of AWS and this machine last seen.
+
+    Updates must be made while holding the lock of the credentials file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> dict:
+        """Return the whole index"""
+
+        try:
+            with open(self.path) as fp:
+                index = json.load(fp)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault('profiles', {})
+        index.setdefault('clock_skew', 0.0)
+        return index
+
+    def update(self, profiles: Dict[str, dict],
+               clock_skew: Optional[float] = None):
+        """
+        :param profiles: Mapping of profile name to its `expiration` as an
+                         ISO 8601 string, and anything else to record
+        :param clock_skew: Seconds the clock of AWS is ahead of this one, or
+                           `None` to keep the last value
+        """
+
+        index = self.load()
+        for name, entry in profiles.items():
+            index['profiles'][name] = dict(entry, saved_at=time.time())
+        if clock_skew is not None:
+            index['clock_skew'] = clock_skew
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_name = tempfile.mkstemp(
+            dir=directory, prefix=".expiry-", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(index, fp, indent=2, sort_keys=True)
+            os.replace(tmp_name, self.path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_name)
+            raise
+
+    def find(self, profile: Optional[str] = None,
+             config_name: Optional[str] = None) -> List[tuple]:
+        """
+        Look up a profile by name, or else every profile saved for a config
+        section, such as each of those saved with `--all-roles`
+
+        :return: The names of the profiles found and their entries
+        """
+
+        profiles = self.load()['profiles']
+        if profile:
+            entry = profiles.get(profile)
+            return [] if entry is None else [(profile, entry)]
+
+        return sorted(
+            (name, entry) for name, entry in profiles.items()
+            if entry.get('config_name') == config_name
+        )
+
+    def remaining(self, entry: dict, clock_skew: float = None,
+                  now: float = None) -> float:
+        """
+        Return the seconds left before a profile expires, according to the
+        clock of AWS
+        """
+
+        if clock_skew is None:
+            clock_skew = self.load()['clock_skew']
+        if now is None:
+            now = time.time()
+
+        expiration = parse_saml_datetime(entry['expiration'])
+        return expiration.timestamp() - (now + clock_skew)
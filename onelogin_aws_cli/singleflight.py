@@ -0,0 +1,109 @@
+"""
+Deduplication of the same refresh made by several processes at once
+"""
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Optional
+
+from onelogin_aws_cli.sharedcredentials import exclusive_lock
+
+PREFIX = ".onelogin-aws-"
+# Longest a process is expected to wait for the lock, after which a marker is
+# of no use to anyone and is removed
+MARKER_TTL = 600
+
+
+class SingleFlight(object):
+    """
+    Lets one process at a time make a refresh, such as logging in and
+    assuming a role for a config section, and records its result in a
+    completion marker. Processes which queued up behind it read the result
+    instead of repeating the refresh, so a burst of identical logins becomes
+    a single login. A refresh completed before a process started waiting is
+    never reused by it.
+
+    The lock and marker are kept next to the credentials file, and the
+    marker must not hold anything secret. Neither outlives its use for long.
+    """
+
+    def __init__(self, directory: str, key: str):
+        """
+        :param directory: Directory to keep the lock and marker in
+        :param key: Identifies the refresh
+        """
+        name = PREFIX + hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        self.directory = directory
+        self.lock_path = os.path.join(directory, name + ".lock")
+        self.marker_path = os.path.join(directory, name + ".done")
+        self.waiting_since = None
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Wait for, then hold, the exclusive lock on the refresh. The lock file
+        is removed again when released, and stale markers along with it, so
+        that nothing is left behind next to the credentials file.
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.waiting_since = time.time()
+        with exclusive_lock(self.lock_path):
+            self._remove_stale_markers()
+            yield
+
+    def completed(self, since: float = None) -> Optional[dict]:
+        """
+        Return the result of the last refresh, if it completed after `since`
+
+        :param since: Unix timestamp, or `None` for when this process last
+                      started waiting for `lock`
+        """
+
+        if since is None:
+            since = self.waiting_since
+        if since is None:
+            return None
+
+        try:
+            with open(self.marker_path) as fp:
+                marker = json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+        if marker.get('completed_at', 0) <= since:
+            return None
+        return marker.get('result')
+
+    def complete(self, result: dict):
+        """Record the result of a refresh, which must be held by `lock`"""
+
+        fd, tmp_name = tempfile.mkstemp(
+            dir=self.directory, prefix=PREFIX, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(dict(completed_at=time.time(), result=result), fp)
+            os.replace(tmp_name, self.marker_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_name)
+            raise
+
+    def _remove_stale_markers(self):
+        """
+        Remove the markers of every refresh in the directory which completed
+        too long ago for anyone still waiting to reuse them
+        """
+
+        cutoff = time.time() - MARKER_TTL
+        with contextlib.suppress(OSError):
+            for entry in os.scandir(self.directory):
+                if entry.name.startswith(PREFIX) and \
+                        entry.name.endswith(".done"):
+                    with contextlib.suppress(OSError):
+                        if entry.stat().st_mtime < cutoff:
+                            os.remove(entry.path)
@@ -0,0 +1,590 @@
+"""
+AWS STS clients, shared by every role assumption in the process.
+
+`AssumeRoleWithSAML` is an unsigned call, so by default it is made by a small
+built-in client rather than boto3, which takes far longer to import and set
+up than the call itself takes.
+"""
+import datetime
+import http.client
+import os
+import random
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
+from typing import Dict, Optional, Tuple
+
+from onelogin_aws_cli.cache import FileCache
+from onelogin_aws_cli.network import network_fingerprint
+from onelogin_aws_cli.saml import parse_saml_datetime
+
+# Enough connections for every concurrent role assumption to keep its own
+MAX_POOL_CONNECTIONS = 16
+
+GLOBAL_ENDPOINT = "https://sts.amazonaws.com"
+GLOBAL_REGION = "us-east-1"
+REGIONAL_ENDPOINT = "https://sts.{region}.amazonaws.com"
+
+# Regions probed by `sts_endpoint = auto` unless others are configured
+DEFAULT_CANDIDATES = [
+    "us-east-1",
+    "us-west-2",
+    "eu-west-1",
+    "eu-central-1",
+    "ap-southeast-2",
+    "ap-northeast-1",
+]
+
+# How long the fastest endpoint found for a network is remembered for
+DEFAULT_PROBE_TTL = 86400
+
+PROBE_TIMEOUT = 2
+
+# Values of the `sts_client` directive
+BUILTIN_CLIENT = "builtin"
+BOTO3_CLIENT = "boto3"
+
+API_VERSION = "2011-06-15"
+# botocore's read timeout, while an endpoint which cannot be reached is given
+# up on sooner
+REQUEST_TIMEOUT = 60
+CONNECT_TIMEOUT = 10
+# Longest a role assumption takes, however many attempts it needs
+MAX_WAIT = 90
+
+# As many attempts as boto3 makes by default, backing off exponentially
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 0.1
+RETRY_STATUSES = (500, 502, 503, 504)
+THROTTLING_CODES = (
+    "Throttling",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+    "IDPCommunicationError",
+)
+
+# Environment variables and AWS config file settings which change the
+# endpoint boto3 picks, so that only boto3 can be trusted to pick it
+ENDPOINT_ENVIRONMENT = (
+    "AWS_ENDPOINT_URL",
+    "AWS_ENDPOINT_URL_STS",
+    "AWS_STS_REGIONAL_ENDPOINTS",
+    "AWS_USE_FIPS_ENDPOINT",
+    "AWS_USE_DUALSTACK_ENDPOINT",
+)
+ENDPOINT_SETTINGS = (
+    "endpoint_url",
+    "services",
+    "sts_regional_endpoints",
+    "use_fips_endpoint",
+    "use_dualstack_endpoint",
+)
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_saml_clients = {}
+
+
+def get_sts_client(region: Optional[str] = None,
+                   endpoint_url: Optional[str] = None):
+    """
+    Return the STS client for a region and endpoint, creating it on first use.
+
+    Clients share a single boto3 Session, so the service model is only loaded
+    once, and each client keeps a pool of keep-alive connections which are
+    reused across calls.
+
+    :param region: AWS region, or `None` for the default region
+    :param endpoint_url: STS endpoint URL, or `None` for the region default
+    """
+
+    global _session
+
+    key = (region, endpoint_url)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            import boto3
+            from botocore.config import Config
+
+            if _session is None:
+                _session = boto3.session.Session()
+
+            options = dict(max_pool_connections=MAX_POOL_CONNECTIONS)
+            # Only known to recent versions of botocore
+            if 'tcp_keepalive' in getattr(Config, 'OPTION_DEFAULTS', ()):
+                options['tcp_keepalive'] = True
+
+            client = _session.client(
+                "sts",
+                region_name=region,
+                endpoint_url=endpoint_url,
+                config=Config(**options),
+            )
+            _clients[key] = client
+    return client
+
+
+def get_saml_client(region: Optional[str] = None,
+                    endpoint_url: Optional[str] = None
+                    ) -> Optional['SamlStsClient']:
+    """
+    Return the built-in `AssumeRoleWithSAML` client for a region and
+    endpoint, creating it on first use.
+
+    :param region: AWS region, or `None` for the default region
+    :param endpoint_url: STS endpoint URL, or `None` for the region default
+    :return: The client, or `None` if the endpoint needs boto3, as it must be
+             reached through a proxy, is in a partition whose endpoints are
+             not known here, or is chosen by AWS settings which only
+             botocore understands
+    """
+
+    if endpoint_url is None:
+        profile = _shared_config_profile()
+        if any(os.environ.get(name) for name in ENDPOINT_ENVIRONMENT) or \
+                any(name in profile for name in ENDPOINT_SETTINGS):
+            return None
+
+        region = region or os.environ.get('AWS_REGION') or \
+            os.environ.get('AWS_DEFAULT_REGION') or profile.get('region')
+        endpoint_url = regional_endpoint(region)
+        if endpoint_url is None:
+            return None
+
+    if _uses_proxy(endpoint_url):
+        return None
+
+    with _lock:
+        client = _saml_clients.get(endpoint_url)
+        if client is None:
+            client = SamlStsClient(endpoint_url)
+            _saml_clients[endpoint_url] = client
+    return client
+
+
+def regional_endpoint(region: Optional[str]) -> Optional[str]:
+    """
+    Return the STS endpoint of a region, or `None` if it is not known here
+
+    :param region: AWS region, or `None` for the global endpoint
+    """
+
+    if not region:
+        return GLOBAL_ENDPOINT
+    if region.startswith('cn-'):
+        return REGIONAL_ENDPOINT.format(region=region) + ".cn"
+    if '-iso' in region:
+        return None
+    return REGIONAL_ENDPOINT.format(region=region)
+
+
+def _shared_config_profile() -> Dict[str, str]:
+    """
+    Return the settings of the profile boto3 would use from the AWS config
+    file, or nothing if it cannot be read
+    """
+
+    import configparser
+
+    path = os.path.expanduser(
+        os.environ.get('AWS_CONFIG_FILE') or
+        os.path.join('~', '.aws', 'config')
+    )
+    name = os.environ.get('AWS_PROFILE') or \
+        os.environ.get('AWS_DEFAULT_PROFILE') or 'default'
+
+    config = configparser.ConfigParser(interpolation=None)
+    try:
+        config.read(path)
+    except configparser.Error:
+        return {}
+    for section in ('profile ' + name, name):
+        if config.has_section(section):
+            return dict(config.items(section))
+    return {}
+
+
+def _uses_proxy(url: str) -> bool:
+    from urllib.request import getproxies_environment, \
+        proxy_bypass_environment
+
+    parsed = urllib.parse.urlsplit(url)
+    proxies = getproxies_environment()
+    return parsed.scheme in proxies and \
+        not proxy_bypass_environment(parsed.hostname, proxies)
+
+
+def clear_sts_clients():
+    """Discard every cached client, and the session they share"""
+
+    global _session
+
+    with _lock:
+        for client in _saml_clients.values():
+            client.close()
+        _saml_clients.clear()
+        _clients.clear()
+        _session = None
+
+
+class SamlStsClient(object):
+    """
+    Makes the STS `AssumeRoleWithSAML` call as a form encoded POST, over a
+    pool of keep-alive connections, and parses the XML response as it
+    arrives into the same dictionary as boto3 returns.
+
+    Throttling, server errors and dropped connections are retried as boto3
+    retries them, for at most `max_wait` seconds in all.
+    """
+
+    def __init__(self, endpoint_url: str, timeout: float = REQUEST_TIMEOUT,
+                 max_connections: int = MAX_POOL_CONNECTIONS,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 max_wait: float = MAX_WAIT):
+        """
+        :param endpoint_url: STS endpoint URL
+        :param timeout: Seconds to wait for each response
+        :param max_connections: Idle connections kept for reuse
+        :param connect_timeout: Seconds to wait for each connection
+        :param max_wait: Seconds to keep retrying for, in total
+        """
+        parsed = urllib.parse.urlsplit(endpoint_url)
+        self.endpoint_url = endpoint_url
+        self.path = parsed.path or "/"
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_wait = max_wait
+        self._scheme = parsed.scheme
+        self._netloc = parsed.netloc
+        self._max_connections = max_connections
+        self._idle = []
+        self._pool_lock = threading.Lock()
+        self._ssl_context = None
+
+    def assume_role_with_saml(self, RoleArn: str, PrincipalArn: str,
+                              SAMLAssertion: str,
+                              DurationSeconds: int = None) -> dict:
+        """
+        Assume a role, with the arguments boto3 takes
+
+        :return: The `Credentials`, `AssumedRoleUser` and other values of
+                 the result, with `Expiration` as an aware datetime
+        """
+
+        params = dict(
+            Action="AssumeRoleWithSAML",
+            Version=API_VERSION,
+            RoleArn=RoleArn,
+            PrincipalArn=PrincipalArn,
+            SAMLAssertion=SAMLAssertion,
+        )
+        if DurationSeconds is not None:
+            params['DurationSeconds'] = str(DurationSeconds)
+        body = urllib.parse.urlencode(params).encode('utf-8')
+
+        deadline = time.monotonic() + self.max_wait
+        for attempt in range(MAX_ATTEMPTS):
+            backoff = random.random() * RETRY_BACKOFF * 2 ** attempt
+            try:
+                status, headers, parsed = self._post(body, deadline)
+            except (OSError, http.client.HTTPException):
+                if _out_of_attempts(attempt, backoff, deadline):
+                    raise
+            else:
+                error = parsed.pop('Error', None)
+                if error is None and status == 200 and \
+                        'Credentials' in parsed:
+                    parsed['ResponseMetadata'].update(
+                        HTTPStatusCode=status,
+                        HTTPHeaders=headers,
+                        RetryAttempts=attempt,
+                    )
+                    return parsed
+
+                code = (error or {}).get('Code') or str(status)
+                retryable = status in RETRY_STATUSES or \
+                    code in THROTTLING_CODES
+                if not retryable or \
+                        _out_of_attempts(attempt, backoff, deadline):
+                    raise Exception(
+                        "An error occurred ({}) when calling the "
+                        "AssumeRoleWithSAML operation: {}".format(
+                            code, (error or {}).get('Message') or
+                            http.client.responses.get(status, '')
+                        )
+                    )
+
+            time.sleep(backoff)
+
+    def close(self):
+        """Close every idle connection"""
+
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _post(self, body: bytes, deadline: float) -> tuple:
+        remaining = max(deadline - time.monotonic(), 0.001)
+        connection = self._connection(min(self.connect_timeout, remaining))
+        try:
+            # Reconnecting a dropped idle connection is not told apart from
+            # reading the response, as http.client does it with this too
+            connection.timeout = min(self.timeout, remaining)
+            if connection.sock is not None:
+                connection.sock.settimeout(connection.timeout)
+            connection.request("POST", self.path, body=body, headers={
+                'Content-Type':
+                    'application/x-www-form-urlencoded; charset=utf-8',
+                'Accept-Encoding': 'identity',
+                'User-Agent': 'onelogin-aws-cli',
+            })
+            response = connection.getresponse()
+            headers = {
+                name.lower(): value for name, value in response.getheaders()
+            }
+            parsed = _parse_response(response)
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        return response.status, headers, parsed
+
+    def _connection(self, timeout: float) -> http.client.HTTPConnection:
+        """
+        Return an idle connection, or else open one within `timeout` seconds
+        """
+
+        with self._pool_lock:
+            if self._idle:
+                return self._idle.pop()
+
+        if self._scheme == 'https':
+            connection = http.client.HTTPSConnection(
+                self._netloc, timeout=timeout, context=self._context(),
+            )
+        else:
+            connection = http.client.HTTPConnection(
+                self._netloc, timeout=timeout
+            )
+        try:
+            connection.connect()
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def _release(self, connection: http.client.HTTPConnection):
+        with self._pool_lock:
+            if len(self._idle) < self._max_connections:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def _context(self):
+        import ssl
+
+        if self._ssl_context is None:
+            # Trust the same certificates as boto3 does
+            cafile = os.environ.get('AWS_CA_BUNDLE')
+            if not cafile:
+                try:
+                    import certifi
+                    cafile = certifi.where()
+                except ImportError:  # pragma: no cover
+                    cafile = None
+            self._ssl_context = ssl.create_default_context(cafile=cafile)
+        return self._ssl_context
+
+
+def _out_of_attempts(attempt: int, backoff: float, deadline: float) -> bool:
+    """Return whether an attempt which failed should be the last"""
+    return attempt == MAX_ATTEMPTS - 1 or \
+        time.monotonic() + backoff >= deadline
+
+
+def _parse_response(response, chunk_size: int = 16384) -> dict:
+    """
+    Parse an STS response as it is read, into the `AssumeRoleWithSAMLResult`
+    values along with the `ResponseMetadata`, or the `Error`
+    """
+
+    parser = ElementTree.XMLPullParser(events=('start', 'end'))
+    result = dict(ResponseMetadata={})
+    path = []
+
+    def handle_events():
+        for event, element in parser.read_events():
+            name = element.tag.rpartition('}')[2]
+            if event == 'start':
+                path.append(name)
+                continue
+
+            path.pop()
+            parent = path[-1] if path else None
+            text = (element.text or '').strip()
+            if parent in ('Credentials', 'AssumedRoleUser', 'Error'):
+                result.setdefault(parent, {})[name] = text
+            elif parent == 'AssumeRoleWithSAMLResult' and len(element) == 0:
+                result[name] = text
+            elif name == 'RequestId':
+                result['ResponseMetadata']['RequestId'] = text
+            element.clear()
+
+    try:
+        while True:
+            chunk = response.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            handle_events()
+        parser.close()
+        handle_events()
+    except ElementTree.ParseError:
+        # Not an STS response, such as an error page from a load balancer
+        response.read()
+        return dict(ResponseMetadata={}, Error={})
+
+    if 'Credentials' in result:
+        result['Credentials']['Expiration'] = parse_saml_datetime(
+            result['Credentials']['Expiration']
+        )
+    if 'PackedPolicySize' in result:
+        result['PackedPolicySize'] = int(result['PackedPolicySize'])
+    return result
+
+
+def parse_candidates(candidates: Optional[str]) -> Dict[str, str]:
+    """
+    Parse a comma separated list of regions into a mapping of each region to
+    its regional STS endpoint
+
+    :param candidates: Comma separated regions, or `None` for the defaults
+    """
+
+    regions = DEFAULT_CANDIDATES
+    if candidates:
+        regions = [r.strip() for r in candidates.split(',') if r.strip()]
+
+    endpoints = {}
+    for region in regions:
+        endpoint_url = regional_endpoint(region)
+        # The endpoints of ISO regions are left to botocore, so they are
+        # never probed
+        if endpoint_url is not None:
+            endpoints[region] = endpoint_url
+    return endpoints
+
+
+def resolve_sts_endpoint(sts_endpoint: Optional[str],
+                         region: Optional[str] = None,
+                         candidates: Dict[str, str] = None,
+                         ttl: int = DEFAULT_PROBE_TTL,
+                         cache: FileCache = None
+                         ) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Work out which STS endpoint to use
+
+    :param sts_endpoint: One of `auto`, `global`, a region name, a URL, or
+                         `None` to use the AWS default for `region`
+    :param region: The region configured for the profile
+    :param candidates: Mapping of region to endpoint URL, probed by `auto`
+    :param ttl: Seconds to remember the result of probing for
+    :param cache: Cache for the result of probing
+    :return: The region and endpoint URL for the STS client
+    """
+
+    if not sts_endpoint:
+        return region, None
+
+    if sts_endpoint == 'global':
+        return GLOBAL_REGION, GLOBAL_ENDPOINT
+
+    if '://' in sts_endpoint:
+        return region or GLOBAL_REGION, sts_endpoint
+
+    if sts_endpoint != 'auto':
+        # `None` for ISO regions, leaving the endpoint to botocore
+        return sts_endpoint, regional_endpoint(sts_endpoint)
+
+    if candidates is None:
+        candidates = parse_candidates(None)
+    if cache is None:
+        cache = FileCache("sts-endpoint")
+
+    key = "{network}:{candidates}".format(
+        network=network_fingerprint(),
+        candidates=",".join(
+            "{}={}".format(r, u) for r, u in sorted(candidates.items())
+        ),
+    )
+    cached = cache.get(key)
+    if cached is not None and cached['region'] in candidates:
+        fastest = cached['region']
+    else:
+        fastest = probe_endpoints(candidates)
+        if fastest is None:
+            # Nothing answered, so leave it to the AWS defaults
+            return region, None
+        cache.set(
+            key,
+            dict(region=fastest),
+            datetime.datetime.now(datetime.timezone.utc) +
+            datetime.timedelta(seconds=ttl),
+        )
+
+    return fastest, candidates[fastest]
+
+
+def probe_endpoints(endpoints: Dict[str, str],
+                    timeout: float = PROBE_TIMEOUT) -> Optional[str]:
+    """
+    Measure the round trip time to each endpoint concurrently
+
+    :param endpoints: Mapping of name to endpoint URL
+    :param timeout: Seconds to wait for each endpoint
+    :return: The name of the endpoint which answered fastest, or `None` if
+             none of them answered
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    names = list(endpoints)
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        timings = list(executor.map(
+            lambda name: _round_trip(endpoints[name], timeout), names
+        ))
+
+    answered = [(t, name) for t, name in zip(timings, names) if t is not None]
+    if not answered:
+        return None
+    return min(answered)[1]
+
+
+def _round_trip(url: str, timeout: float) -> Optional[float]:
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme == 'https':
+        connection_class = http.client.HTTPSConnection
+    else:
+        connection_class = http.client.HTTPConnection
+
+    connection = connection_class(parsed.netloc, timeout=timeout)
+    started = time.monotonic()
+    try:
+        # Any response at all means the endpoint is reachable, so the time
+        # to get one is what is being measured
+        connection.request('GET', '/')
+        connection.getresponse().read()
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+    return time.monotonic() - started
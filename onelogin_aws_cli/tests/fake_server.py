@@ -0,0 +1,404 @@
+"""
+A local stand-in for the OneLogin API and AWS STS, serving the endpoints used
+to log in over real HTTP, with injectable latency and errors.
+
+    with FakeServer(roles=3, mfa='otp') as server:
+        api = server.client(cache_dir, username='user@example.com')
+        api.save_credentials()
+"""
+import base64
+import datetime
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler
+from typing import Callable, List, Union
+
+from onelogin.api.util.urlbuilder import UrlBuilder
+
+from onelogin_aws_cli import OneloginAWS
+from onelogin_aws_cli.aliases import AccountAliases
+from onelogin_aws_cli.cache import FileCache
+from onelogin_aws_cli.oauth import TokenStore
+from onelogin_aws_cli.saml import parse_assertion
+from onelogin_aws_cli.tests.helper import ThreadingHTTPServer
+
+ACCOUNT_ID = "123456789012"
+PRINCIPAL_ARN = "arn:aws:iam::{}:saml-provider/OneLogin".format(ACCOUNT_ID)
+PASSWORD = "fake-password"
+OTP = "123456"
+
+SAML_TEMPLATE = """<?xml version="1.0"?>
+<samlp:Response xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion"
+                xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol">
+  <saml:Assertion>
+    <saml:Subject>
+      <saml:NameID>{username}</saml:NameID>
+      <saml:SubjectConfirmation>
+        <saml:SubjectConfirmationData NotOnOrAfter="{expiry}"/>
+      </saml:SubjectConfirmation>
+    </saml:Subject>
+    <saml:Conditions NotOnOrAfter="{expiry}"/>
+    <saml:AttributeStatement>
+      <saml:Attribute Name="https://aws.amazon.com/SAML/Attributes/Role">
+{values}
+      </saml:Attribute>
+      <saml:Attribute
+          Name="https://aws.amazon.com/SAML/Attributes/RoleSessionName">
+        <saml:AttributeValue>{username}</saml:AttributeValue>
+      </saml:Attribute>
+    </saml:AttributeStatement>
+  </saml:Assertion>
+</samlp:Response>"""
+
+STS_RESPONSE = """<AssumeRoleWithSAMLResponse
+    xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleWithSAMLResult>
+    <Credentials>
+      <AccessKeyId>ASIA{key}</AccessKeyId>
+      <SecretAccessKey>{secret}</SecretAccessKey>
+      <SessionToken>{token}</SessionToken>
+      <Expiration>{expiry}</Expiration>
+    </Credentials>
+    <AssumedRoleUser>
+      <AssumedRoleId>AROA{key}:{username}</AssumedRoleId>
+      <Arn>arn:aws:sts::{account}:assumed-role/{role}/{username}</Arn>
+    </AssumedRoleUser>
+    <Subject>{username}</Subject>
+    <SubjectType>persistent</SubjectType>
+    <Audience>https://signin.aws.amazon.com/saml</Audience>
+  </AssumeRoleWithSAMLResult>
+  <ResponseMetadata><RequestId>{request_id}</RequestId></ResponseMetadata>
+</AssumeRoleWithSAMLResponse>"""
+
+STS_ERROR = """<ErrorResponse
+    xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <Error>
+    <Type>{type}</Type>
+    <Code>{code}</Code>
+    <Message>{message}</Message>
+  </Error>
+  <RequestId>{request_id}</RequestId>
+</ErrorResponse>"""
+
+
+def role_arns(count: int) -> List[str]:
+    """The ARNs of the roles the fake server puts in its assertions"""
+    return [
+        "arn:aws:iam::{}:role/Role{}".format(ACCOUNT_ID, i)
+        for i in range(count)
+    ]
+
+
+class _UrlBuilder(UrlBuilder):
+    """Sends every OneLogin API call to the fake server instead"""
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+
+    def get_url(self, *args, **kwargs):
+        url = super().get_url(*args, **kwargs)
+        return re.sub(r'^https://[^/]+', self.base_url, url)
+
+
+class FakeServer(object):
+    """
+    Serves the OneLogin token, SAML assertion and verify factor endpoints,
+    and the STS `AssumeRoleWithSAML` action, from one local HTTP server.
+    """
+
+    def __init__(self, roles: int = 1, mfa: str = None,
+                 push_polls: int = 2,
+                 latency: Union[float, Callable[[], float]] = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500,
+                 seed: int = None):
+        """
+        :param roles: Number of roles in each assertion
+        :param mfa: `None`, `'otp'` or `'push'`
+        :param push_polls: Polls before a push notification is approved
+        :param latency: Seconds to wait before answering each request, or a
+                        function returning them
+        :param error_rate: Fraction of requests answered with `error_status`
+        :param seed: Seed for choosing which requests fail
+        """
+        self.roles = role_arns(roles)
+        self.mfa = mfa
+        self.push_polls = push_polls
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = []
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._state_tokens = {}
+        self._access_tokens = set()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}".format(self._server.server_address[1])
+
+    def start(self) -> 'FakeServer':
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.fake = self
+        threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True,
+        ).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def client(self, cache_dir: str, username: str = "user@example.com",
+               **config) -> OneloginAWS:
+        """
+        Return an `OneloginAWS` which logs in through this server, keeping
+        its caches in `cache_dir`
+
+        :param config: Directives overriding the defaults
+        """
+        return self.wire(
+            OneloginAWS(self.settings(username, **config)), cache_dir
+        )
+
+    def settings(self, username: str = "user@example.com", **config) -> dict:
+        """Return the directives for logging in through this server"""
+        settings = dict(
+            base_uri="https://api.us.onelogin.com/",
+            client_id="fake-client-id",
+            client_secret="fake-client-secret",
+            aws_app_id="1",
+            subdomain="example",
+            username=username,
+            duration_seconds=3600,
+            ip_address="127.0.0.1",
+            auto_determine_ip_address=False,
+            region="us-east-1",
+            sts_endpoint=self.url,
+            otp_device="Google Authenticator",
+            mfa_push_interval=0.01,
+            no_saml_cache=True,
+        )
+        settings.update(config)
+        return settings
+
+    def wire(self, api: OneloginAWS, cache_dir: str) -> OneloginAWS:
+        """
+        Point `api` at this server, keeping its caches in `cache_dir`. It must
+        have been configured with `settings`.
+        """
+        api.user_credentials.password = PASSWORD
+        api.ol_client.url_builder = _UrlBuilder(self.url)
+        api.saml_cache = FileCache("saml", cache_dir)
+        api.credentials_cache = FileCache("credentials", cache_dir)
+        api.ip_address_cache = FileCache("ip-address", cache_dir)
+        api.account_aliases = AccountAliases(
+            FileCache("account-alias", cache_dir), lookup=lambda c: None,
+        )
+        api.token_store = TokenStore(
+            FileCache("oauth-token", cache_dir),
+            "fake:" + api.user_credentials.username,
+        )
+        return api
+
+    def handle(self, method: str, path: str, headers, body: bytes):
+        """
+        Answer a request
+
+        :return: The status, content type and body of the response
+        """
+        with self._lock:
+            self.requests.append(path)
+            fail = self._random.random() < self.error_rate
+
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+
+        if method == 'POST' and path == '/':
+            return self._sts(urllib.parse.parse_qs(body.decode()), fail)
+
+        if fail:
+            return self.error_status, 'application/json', json.dumps(
+                dict(statusCode=self.error_status, name="Error",
+                     message="Injected error")
+            )
+
+        data = json.loads((body or b'{}').decode('utf-8'))
+        if path == '/auth/oauth2/v2/token':
+            return self._token()
+        bearer = (headers.get('Authorization') or '').split(' ')[-1]
+        with self._lock:
+            authorized = bearer in self._access_tokens
+        if not authorized:
+            return 401, 'application/json', json.dumps(dict(
+                statusCode=401, name="Unauthorized", message="Unauthorized",
+            ))
+        if path == '/api/2/saml_assertion':
+            return self._saml_assertion(data)
+        if path == '/api/2/saml_assertion/verify_factor':
+            return self._verify_factor(data)
+        return 404, 'application/json', json.dumps(dict(message="Not Found"))
+
+    def revoke_tokens(self):
+        """Reject every OAuth token issued so far"""
+        with self._lock:
+            self._access_tokens.clear()
+
+    def _token(self):
+        access_token = uuid.uuid4().hex
+        with self._lock:
+            self._access_tokens.add(access_token)
+        return 200, 'application/json', json.dumps(dict(
+            access_token=access_token,
+            refresh_token=uuid.uuid4().hex,
+            token_type="bearer",
+            account_id=1,
+            expires_in=36000,
+            created_at=_now().isoformat(),
+        ))
+
+    def _saml_assertion(self, data: dict):
+        if data.get('password') != PASSWORD:
+            return 401, 'application/json', json.dumps(dict(
+                statusCode=401, name="Unauthorized",
+                message="Authentication Failed: Invalid user credentials",
+            ))
+
+        username = data['username_or_email']
+        if self.mfa is None:
+            return self._saml_success(username)
+
+        state_token = uuid.uuid4().hex
+        with self._lock:
+            self._state_tokens[state_token] = [username, 0]
+        device_type = "OneLogin Protect" if self.mfa == 'push' \
+            else "Google Authenticator"
+        return 200, 'application/json', json.dumps(dict(
+            message="MFA is required for this user",
+            state_token=state_token,
+            devices=[dict(device_id=1, device_type=device_type)],
+            callback_url="",
+            user=dict(id=1, username=username, email=username),
+        ))
+
+    def _verify_factor(self, data: dict):
+        with self._lock:
+            state = self._state_tokens.get(data.get('state_token'))
+            if state is not None and data.get('do_not_notify'):
+                state[1] += 1
+        if state is None:
+            return 401, 'application/json', json.dumps(dict(
+                statusCode=401, name="Unauthorized",
+                message="Invalid state_token",
+            ))
+
+        username, polls = state
+        if data.get('otp_token') == OTP or \
+                (self.mfa == 'push' and polls >= self.push_polls):
+            return self._saml_success(username)
+        if self.mfa == 'push' and 'otp_token' not in data:
+            return 200, 'application/json', json.dumps(dict(
+                message="Authentication pending on OL Protect",
+            ))
+        return 401, 'application/json', json.dumps(dict(
+            statusCode=401, name="Unauthorized",
+            message="Failed authentication with this factor",
+        ))
+
+    def _saml_success(self, username: str):
+        return 200, 'application/json', json.dumps(dict(
+            message="Success", data=self.saml_assertion(username),
+        ))
+
+    def saml_assertion(self, username: str) -> str:
+        """Return a base64 encoded assertion granting every role"""
+        expiry = _now() + datetime.timedelta(minutes=5)
+        values = "\n".join(
+            "        <saml:AttributeValue>{},{}</saml:AttributeValue>".format(
+                role, PRINCIPAL_ARN
+            ) for role in self.roles
+        )
+        return base64.b64encode(SAML_TEMPLATE.format(
+            username=username,
+            expiry=expiry.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            values=values,
+        ).encode()).decode()
+
+    def _sts(self, params: dict, fail: bool):
+        request_id = str(uuid.uuid4())
+
+        def error(status, code, message):
+            return status, 'text/xml', STS_ERROR.format(
+                type="Receiver" if status >= 500 else "Sender",
+                code=code, message=message, request_id=request_id,
+            )
+
+        if fail:
+            return error(self.error_status, "InternalFailure",
+                         "Injected error")
+        if params.get('Action') != ['AssumeRoleWithSAML']:
+            return error(400, "InvalidAction", "Unsupported action")
+
+        role_arn = params['RoleArn'][0]
+        attributes = parse_assertion(params['SAMLAssertion'][0])
+        if (role_arn, params['PrincipalArn'][0]) not in attributes.roles:
+            return error(400, "AccessDenied", "Role not in assertion")
+        if attributes.expiry < _now():
+            return error(400, "ExpiredTokenException", "Assertion expired")
+
+        duration = int(params.get('DurationSeconds', ['3600'])[0])
+        return 200, 'text/xml', STS_RESPONSE.format(
+            key=uuid.uuid4().hex[:16].upper(),
+            secret=uuid.uuid4().hex,
+            token=uuid.uuid4().hex,
+            expiry=(_now() + datetime.timedelta(seconds=duration))
+            .strftime('%Y-%m-%dT%H:%M:%SZ'),
+            username=attributes.session_name,
+            account=ACCOUNT_ID,
+            role=role_arn.split('/')[-1],
+            request_id=request_id,
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def _respond(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        status, content_type, payload = self.server.fake.handle(
+            method, self.path, self.headers, body
+        )
+        payload = payload.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
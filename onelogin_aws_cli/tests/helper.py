@@ -1,8 +1,47 @@
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from io import StringIO
 
 from onelogin_aws_cli.configuration import ConfigurationFile
 
 
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """`http.server.ThreadingHTTPServer`, which needs Python 3.7"""
+
+    daemon_threads = True
+
+
+def stand_in_endpoint(body: bytes = b'', status: int = 200,
+                      delay: float = 0) -> ThreadingHTTPServer:
+    """
+    Start a local endpoint which answers every request with `status` and
+    `body`, after `delay` seconds
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(
+        target=server.serve_forever, args=(0.05,), daemon=True,
+    ).start()
+    return server
+
+
+def endpoint_url(server: HTTPServer, path: str = '') -> str:
+    return 'http://127.0.0.1:{}{}'.format(server.server_address[1], path)
+
+
 def build_config(config_content: str):
     str = StringIO()
     str.write(config_content)
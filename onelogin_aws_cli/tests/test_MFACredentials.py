@@ -88,6 +88,25 @@ class TestMFACredentials(TestCase):
 
         del self.mfa._config["otp_device"]
 
+    def test_keep_device(self):
+        devices = [
+            Device(dict(device_id='1', device_type='DeviceType1')),
+            Device(dict(device_id='2', device_type='DeviceType2')),
+        ]
+        self.assertFalse(self.mfa.keep_device(devices))
+
+        with patch('builtins.input', side_effect=['2']), \
+                contextlib.redirect_stdout(StringIO()):
+            self.mfa.select_device(devices)
+
+        again = [
+            Device(dict(device_id='1', device_type='DeviceType1')),
+            Device(dict(device_id='2', device_type='DeviceType2')),
+        ]
+        self.assertTrue(self.mfa.keep_device(again))
+        self.assertIs(again[1], self.mfa.device)
+        self.assertFalse(self.mfa.keep_device(again[:1]))
+
     def test_prompt_token(self):
         self.mfa.select_device([
             Device(dict(device_id='1', device_type='mock_device'))
@@ -0,0 +1,133 @@
+import contextlib
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from onelogin_aws_cli.aliases import MAX_LOOKUPS, AccountAliases
+from onelogin_aws_cli.cache import FileCache
+
+ROLE_ARN = "arn:aws:iam::123456789012:role/Admin"
+RESPONSE = {'Credentials': {'AccessKeyId': 'mock-key'}}
+
+
+class TestAccountAliases(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = FileCache('account-alias', self.tmp.name)
+
+    def test_learn(self):
+        lookup = MagicMock(return_value='production')
+        aliases = AccountAliases(self.cache, lookup=lookup)
+
+        self.assertEqual({}, aliases.get(['123456789012']))
+        self.assertTrue(aliases.learn(ROLE_ARN, RESPONSE))
+        aliases.wait()
+
+        lookup.assert_called_once_with(RESPONSE['Credentials'])
+        self.assertEqual(
+            {'123456789012': 'production'},
+            aliases.get(['123456789012', '210987654321']),
+        )
+        # Known accounts are not looked up again
+        self.assertFalse(aliases.learn(ROLE_ARN, RESPONSE))
+        self.assertFalse(
+            AccountAliases(self.cache, lookup=lookup).learn(ROLE_ARN, RESPONSE)
+        )
+        self.assertEqual(1, lookup.call_count)
+
+    def test_not_learning(self):
+        lookup = MagicMock(return_value='production')
+        aliases = AccountAliases(self.cache, lookup=lookup)
+        aliases.learning = False
+
+        self.assertFalse(aliases.learn(ROLE_ARN, RESPONSE))
+        lookup.assert_not_called()
+
+    def test_wait(self):
+        started = threading.Event()
+        finish = threading.Event()
+        threads = []
+
+        def lookup(credentials):
+            threads.append(threading.current_thread())
+            started.set()
+            finish.wait(5)
+            return 'production'
+
+        aliases = AccountAliases(self.cache, lookup=lookup)
+        aliases.learn(ROLE_ARN, RESPONSE)
+        started.wait(5)
+        # Never holds up the process exiting
+        self.assertTrue(threads[0].daemon)
+
+        aliases.wait(0.05)
+        self.assertEqual({}, aliases.get(['123456789012']))
+
+        finish.set()
+        aliases.wait()
+        self.assertEqual({'123456789012': 'production'},
+                         aliases.get(['123456789012']))
+
+    def test_bounded(self):
+        lock = threading.Lock()
+        running = []
+        most = []
+
+        def lookup(credentials):
+            with lock:
+                running.append(credentials)
+                most.append(len(running))
+            threading.Event().wait(0.02)
+            with lock:
+                running.remove(credentials)
+            return credentials['AccessKeyId']
+
+        aliases = AccountAliases(self.cache, lookup=lookup)
+        account_ids = [str(100000000000 + i) for i in range(6)]
+        for account_id in account_ids:
+            self.assertTrue(aliases.learn(
+                "arn:aws:iam::{}:role/Admin".format(account_id),
+                {'Credentials': {'AccessKeyId': account_id}},
+            ))
+        aliases.wait()
+
+        self.assertEqual({a: a for a in account_ids}, aliases.get(account_ids))
+        self.assertEqual(6, len(most))
+        self.assertLessEqual(max(most), MAX_LOOKUPS)
+
+    def test_learn_failure(self):
+        lookup = MagicMock(side_effect=Exception("AccessDenied"))
+        aliases = AccountAliases(self.cache, lookup=lookup)
+
+        aliases.learn(ROLE_ARN, RESPONSE)
+        aliases.wait()
+
+        self.assertEqual({}, aliases.get(['123456789012']))
+        self.assertFalse(aliases.learn(ROLE_ARN, RESPONSE))
+
+    def test_static_file(self):
+        static_file = os.path.join(self.tmp.name, 'aliases.json')
+        with open(static_file, 'w') as fp:
+            json.dump({'123456789012': 'static'}, fp)
+        lookup = MagicMock(return_value='production')
+        aliases = AccountAliases(self.cache, static_file, lookup=lookup)
+
+        self.assertFalse(aliases.learn(ROLE_ARN, RESPONSE))
+        self.assertEqual({'123456789012': 'static'},
+                         aliases.get(['123456789012']))
+        lookup.assert_not_called()
+
+    def test_static_file_invalid(self):
+        mock_stdout = StringIO()
+        aliases = AccountAliases(self.cache, os.path.join(self.tmp.name, 'x'))
+
+        with contextlib.redirect_stdout(mock_stdout):
+            self.assertEqual({}, aliases.get(['123456789012']))
+
+        self.assertIn("Could not read account aliases", mock_stdout.getvalue())
@@ -0,0 +1,106 @@
+import contextlib
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from onelogin_aws_cli import cli
+from onelogin_aws_cli.argparse import OneLoginAWSArgumentParser
+from onelogin_aws_cli.tests.fake_server import FakeServer
+
+
+class TestCredentialEnvironment(TestCase):
+    """Credentials handed to a command, rather than saved to disk"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        self.cred_dir = os.path.join(self.tmp.name, 'aws')
+        self.cred_file = os.path.join(self.cred_dir, 'credentials')
+
+        env = patch.dict(
+            os.environ, AWS_SHARED_CREDENTIALS_FILE=self.cred_file
+        )
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.server = FakeServer().start()
+        self.addCleanup(self.server.stop)
+
+    def _inject(self, *args):
+        args = OneLoginAWSArgumentParser().parse_args(list(args))
+        api = self.server.client(self.cache_dir)
+        with contextlib.redirect_stdout(StringIO()) as stdout, \
+                contextlib.redirect_stderr(StringIO()):
+            cli._inject_credentials([api], args)
+        return stdout.getvalue()
+
+    def test_env(self):
+        output = self._inject('--env')
+
+        variables = dict(
+            shlex.split(line)[1].split('=', 1)
+            for line in output.splitlines()
+        )
+        self.assertEqual([
+            'AWS_ACCESS_KEY_ID',
+            'AWS_CREDENTIAL_EXPIRATION',
+            'AWS_DEFAULT_REGION',
+            'AWS_REGION',
+            'AWS_SECRET_ACCESS_KEY',
+            'AWS_SESSION_TOKEN',
+        ], sorted(variables))
+        self.assertTrue(variables['AWS_ACCESS_KEY_ID'].startswith('ASIA'))
+        self.assertEqual('us-east-1', variables['AWS_REGION'])
+
+        # Nothing is written next to the credentials file, or to it
+        self.assertFalse(os.path.exists(self.cred_dir))
+
+    def test_exec(self):
+        with patch('onelogin_aws_cli.cli.os.execvpe') as execvpe:
+            output = self._inject('--exec', '--', 'aws', 's3', 'ls')
+
+        self.assertEqual('', output)
+        file, argv, environment = execvpe.call_args[0]
+        self.assertEqual('aws', file)
+        self.assertEqual(['aws', 's3', 'ls'], argv)
+        self.assertTrue(environment['AWS_ACCESS_KEY_ID'].startswith('ASIA'))
+        # The rest of the environment is passed on
+        self.assertEqual(self.cred_file,
+                         environment['AWS_SHARED_CREDENTIALS_FILE'])
+        self.assertFalse(os.path.exists(self.cred_dir))
+
+    def test_exec_not_found(self):
+        with self.assertRaises(SystemExit) as cm:
+            self._inject('--exec', '--', os.path.join(self.tmp.name, 'none'))
+
+        self.assertEqual(127, cm.exception.code)
+
+    def test_exec_exit_status(self):
+        # The command replaces the process, so its exit status is returned
+        script = (
+            "import sys\n"
+            "from onelogin_aws_cli import cli\n"
+            "from onelogin_aws_cli.argparse import OneLoginAWSArgumentParser\n"
+            "args = OneLoginAWSArgumentParser().parse_args(sys.argv[1:])\n"
+            "cli._run_with_credentials(args, dict(AWS_ACCESS_KEY_ID='ASIA'))\n"
+        )
+        child = (
+            "import os, sys\n"
+            "sys.exit(7 if os.environ['AWS_ACCESS_KEY_ID'] == 'ASIA' else 1)"
+        )
+
+        result = subprocess.run([
+            sys.executable, '-c', script,
+            '--exec', '--', sys.executable, '-c', child,
+        ])
+        self.assertEqual(7, result.returncode)
+
+    def test_several_roles(self):
+        with self.assertRaisesRegex(Exception, "single configuration"):
+            self._inject('--env', '--all-roles')
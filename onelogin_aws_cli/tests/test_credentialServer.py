@@ -0,0 +1,152 @@
+import contextlib
+import datetime
+import http.client
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from botocore.credentials import ContainerProvider
+
+from onelogin_aws_cli.credentialserver import CREDENTIALS_PATH, \
+    FULL_URI_ENV, TOKEN_ENV, CredentialServer, RefreshAheadCredentials
+from onelogin_aws_cli.tests.fake_server import FakeServer, role_arns
+
+
+class TestCredentialServer(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+        env = patch.dict(os.environ, AWS_SHARED_CREDENTIALS_FILE=os.path.join(
+            self.tmp.name, 'credentials'
+        ))
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.server = FakeServer().start()
+        self.addCleanup(self.server.stop)
+
+        self.api = self.server.client(os.path.join(self.tmp.name, 'cache'))
+        self.credentials = RefreshAheadCredentials(self.api)
+        with contextlib.redirect_stdout(StringIO()):
+            self.credentials.start()
+
+        self.endpoint = CredentialServer(self.credentials, token='secret')
+        threading.Thread(
+            target=self.endpoint.serve_forever, args=(0.05,), daemon=True,
+        ).start()
+        self.addCleanup(self.endpoint.server_close)
+        self.addCleanup(self.endpoint.shutdown)
+
+    def _get(self, path: str = CREDENTIALS_PATH, token: str = 'secret'):
+        connection = http.client.HTTPConnection(
+            *self.endpoint.server_address, timeout=5
+        )
+        try:
+            connection.request('GET', path, headers=dict(Authorization=token))
+            response = connection.getresponse()
+            return response.status, json.loads(response.read().decode('utf-8'))
+        finally:
+            connection.close()
+
+    def test_credentials(self):
+        status, body = self._get()
+
+        self.assertEqual(200, status)
+        creds = self.credentials.current()["Credentials"]
+        self.assertEqual(creds["AccessKeyId"], body["AccessKeyId"])
+        self.assertEqual(creds["SessionToken"], body["Token"])
+        self.assertRegex(body["Expiration"], r'^\d{4}-.*T.*Z$')
+        self.assertIn(':assumed-role/', body["RoleArn"])
+
+    def test_unauthorized(self):
+        self.assertEqual(401, self._get(token='wrong')[0])
+        self.assertEqual(401, self._get(token='')[0])
+        self.assertEqual(404, self._get('/other')[0])
+
+    def test_botocore_container_provider(self):
+        provider = ContainerProvider(environ={
+            FULL_URI_ENV: self.endpoint.url,
+            TOKEN_ENV: self.endpoint.token,
+        })
+
+        loaded = provider.load().get_frozen_credentials()
+        self.assertEqual(
+            self.credentials.current()["Credentials"]["AccessKeyId"],
+            loaded.access_key,
+        )
+
+    def test_refresh(self):
+        before = self._get()[1]["AccessKeyId"]
+        self.credentials.refresh()
+
+        self.assertNotEqual(before, self._get()[1]["AccessKeyId"])
+        self.assertEqual(2, self.server.requests.count('/'))
+
+    def test_reads_during_refresh(self):
+        release = threading.Event()
+        assume_role = self.api.assume_role
+
+        def slow_assume_role():
+            release.wait(5)
+            assume_role()
+
+        before = self._get()[1]["AccessKeyId"]
+        with patch.object(self.api, 'assume_role', slow_assume_role):
+            refresh = threading.Thread(target=self.credentials.refresh)
+            refresh.start()
+
+            # Answered with the credentials held, without waiting
+            results = []
+            readers = [
+                threading.Thread(target=lambda: results.append(self._get()))
+                for _ in range(100)
+            ]
+            for reader in readers:
+                reader.start()
+            for reader in readers:
+                reader.join(5)
+            self.assertTrue(refresh.is_alive())
+
+            release.set()
+            refresh.join()
+
+        self.assertEqual(100, len(results))
+        self.assertEqual({(200, before)},
+                         {(s, body["AccessKeyId"]) for s, body in results})
+        self.assertNotEqual(before, self._get()[1]["AccessKeyId"])
+
+    def test_refresh_cached_role(self):
+        server = FakeServer(roles=3).start()
+        self.addCleanup(server.stop)
+        cache_dir = os.path.join(self.tmp.name, 'shared-cache')
+        role_arn = role_arns(3)[2]
+
+        # The role was assumed by an earlier login
+        server.client(cache_dir, role_arn=role_arn).get_credentials()
+
+        api = server.client(cache_dir, role_arn=role_arn)
+        credentials = RefreshAheadCredentials(api)
+        prompt = patch('builtins.input', side_effect=AssertionError("Prompt"))
+        with contextlib.redirect_stdout(StringIO()), prompt:
+            credentials.start()
+            credentials.refresh()
+
+        self.assertEqual(role_arn, api.role_arn)
+        self.assertIn('/Role2/',
+                      credentials.current()["AssumedRoleUser"]["Arn"])
+
+    def test_expired(self):
+        expired = dict(self.credentials.current())
+        expired["Credentials"] = dict(
+            expired["Credentials"],
+            Expiration=datetime.datetime.now(datetime.timezone.utc),
+        )
+        self.credentials._credentials = expired
+
+        self.assertEqual(503, self._get()[0])
@@ -0,0 +1,117 @@
+import contextlib
+import os
+import tempfile
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from onelogin_aws_cli.tests.fake_server import FakeServer, OTP, role_arns
+
+
+class TestEndToEnd(TestCase):
+    """Log in over HTTP against the local OneLogin and STS stand-in"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        self.cred_file = os.path.join(self.tmp.name, 'credentials')
+
+        env = patch.dict(
+            os.environ, AWS_SHARED_CREDENTIALS_FILE=self.cred_file
+        )
+        env.start()
+        self.addCleanup(env.stop)
+
+    def _serve(self, **kwargs) -> FakeServer:
+        server = FakeServer(**kwargs).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def test_single_role(self):
+        server = self._serve()
+        api = server.client(self.cache_dir, profile='fake')
+
+        with contextlib.redirect_stdout(StringIO()):
+            profiles = api.save_credentials()
+
+        credentials = profiles['fake']['Credentials']
+        self.assertTrue(credentials['AccessKeyId'].startswith('ASIA'))
+        with open(self.cred_file) as fp:
+            self.assertIn(credentials['SessionToken'], fp.read())
+
+    def test_otp(self):
+        server = self._serve(mfa='otp')
+        api = server.client(self.cache_dir)
+
+        with patch('builtins.input', return_value=OTP):
+            api.get_saml_assertion()
+
+        self.assertIsNotNone(api.saml.saml_response)
+
+    def test_push(self):
+        server = self._serve(mfa='push', push_polls=2)
+        api = server.client(self.cache_dir)
+
+        with contextlib.redirect_stdout(StringIO()):
+            api.get_saml_assertion()
+
+        self.assertIsNotNone(api.saml.saml_response)
+        self.assertEqual(
+            3, server.requests.count('/api/2/saml_assertion/verify_factor')
+        )
+
+    def test_many_roles(self):
+        server = self._serve(roles=20)
+        api = server.client(self.cache_dir)
+
+        with contextlib.redirect_stdout(StringIO()):
+            profiles = api.save_all_credentials()
+
+        self.assertEqual(
+            sorted(arn.split('/')[-1] for arn in role_arns(20)),
+            sorted(name.split('/')[1] for name in profiles)
+        )
+
+    def test_token_reused(self):
+        server = self._serve()
+
+        for _ in range(2):
+            server.client(self.cache_dir).get_saml_assertion()
+
+        self.assertEqual(1, server.requests.count('/auth/oauth2/v2/token'))
+
+    def test_token_revoked(self):
+        server = self._serve()
+        server.client(self.cache_dir).get_saml_assertion()
+        server.revoke_tokens()
+
+        api = server.client(self.cache_dir)
+        api.get_saml_assertion()
+        self.assertIsNotNone(api.saml.saml_response)
+
+        # The new token replaced the revoked one in the cache
+        tokens = server.requests.count('/auth/oauth2/v2/token')
+        server.client(self.cache_dir).get_saml_assertion()
+        self.assertEqual(
+            tokens, server.requests.count('/auth/oauth2/v2/token')
+        )
+
+    def test_wrong_password_with_cached_token(self):
+        server = self._serve()
+        server.client(self.cache_dir).get_saml_assertion()
+
+        api = server.client(self.cache_dir)
+        api.user_credentials.password = 'wrong-password'
+        with self.assertRaisesRegex(Exception, "Onelogin Error: '401'"):
+            api.get_saml_assertion()
+
+        # The password was only submitted once, and the token kept
+        self.assertEqual(2, server.requests.count('/api/2/saml_assertion'))
+        self.assertEqual(1, server.requests.count('/auth/oauth2/v2/token'))
+
+    def test_injected_errors(self):
+        server = self._serve(error_rate=1.0)
+
+        with self.assertRaisesRegex(Exception, "Onelogin Error: '500'"):
+            server.client(self.cache_dir).get_saml_assertion()
@@ -0,0 +1,189 @@
+import contextlib
+import json
+import os
+import tempfile
+import time
+from email.utils import formatdate
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from onelogin_aws_cli import cli
+from onelogin_aws_cli.sharedcredentials import ExpiryIndex, \
+    SharedCredentialsFile
+from onelogin_aws_cli.tests.fake_server import FakeServer, role_arns
+
+
+class TestExpiryIndex(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.index = ExpiryIndex(os.path.join(self.tmp.name, 'expiry.json'))
+
+    def test_update(self):
+        self.assertEqual(
+            dict(profiles={}, clock_skew=0.0), self.index.load()
+        )
+
+        self.index.update(dict(
+            first=dict(expiration='2026-10-18T12:00:00+00:00',
+                       config_name='dev'),
+        ), clock_skew=5.0)
+        self.index.update(dict(
+            second=dict(expiration='2026-10-18T13:00:00+00:00',
+                        config_name='dev'),
+        ))
+
+        index = self.index.load()
+        self.assertEqual(['first', 'second'], sorted(index['profiles']))
+        # Kept until measured again
+        self.assertEqual(5.0, index['clock_skew'])
+
+    def test_find(self):
+        self.index.update(dict(
+            first=dict(expiration='2026-10-18T12:00:00Z', config_name='dev'),
+        ))
+        self.index.update(dict(
+            second=dict(expiration='2026-10-18T12:00:00Z', config_name='dev'),
+        ))
+
+        self.assertEqual(
+            ['first'], [n for n, _ in self.index.find(profile='first')]
+        )
+        self.assertEqual([], self.index.find(profile='missing'))
+        # Every profile saved for the section
+        self.assertEqual(
+            ['first', 'second'],
+            [n for n, _ in self.index.find(config_name='dev')],
+        )
+        self.assertEqual([], self.index.find(config_name='prod'))
+
+    def test_remaining(self):
+        entry = dict(expiration='2026-10-18T12:00:00+00:00')
+        now = 1792324800 - 600  # Ten minutes before expiry
+
+        self.assertEqual(600, self.index.remaining(entry, 0, now))
+        # The clock of AWS is a minute ahead of this one
+        self.assertEqual(540, self.index.remaining(entry, 60, now))
+
+    def test_corrupt(self):
+        with open(self.index.path, 'w') as fp:
+            fp.write('{')
+
+        self.assertEqual({}, self.index.load()['profiles'])
+
+
+class TestExpiryIndexLogin(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        self.cred_file = os.path.join(self.tmp.name, 'credentials')
+
+        env = patch.dict(
+            os.environ, AWS_SHARED_CREDENTIALS_FILE=self.cred_file
+        )
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.server = FakeServer().start()
+        self.addCleanup(self.server.stop)
+
+    def _save(self, **config) -> dict:
+        with contextlib.redirect_stdout(StringIO()):
+            return self.server.client(self.cache_dir, **config) \
+                .save_credentials()
+
+    def test_save_credentials(self):
+        profiles = self._save(profile='fake')
+
+        with open(self.cred_file + '.expiry.json') as fp:
+            index = json.load(fp)
+        entry = index['profiles']['fake']
+        self.assertEqual(
+            profiles['fake']['Credentials']['Expiration'].isoformat(),
+            entry['expiration'],
+        )
+        self.assertTrue(entry['role_arn'].startswith('arn:aws:iam::'))
+        # The local stand-in shares this clock
+        self.assertEqual(0.0, index['clock_skew'])
+
+        # Nothing is added to the credentials file itself
+        with open(self.cred_file) as fp:
+            self.assertNotIn('expiration', fp.read().lower())
+
+    def test_clock_skew(self):
+        api = self.server.client(self.cache_dir)
+        api._measure_clock_skew(dict(ResponseMetadata=dict(
+            HTTPHeaders=dict(date=formatdate(time.time() + 120, usegmt=True))
+        )))
+        self.assertAlmostEqual(120, api.clock_skew, delta=2)
+
+        api._measure_clock_skew(dict(ResponseMetadata={}))
+        self.assertAlmostEqual(120, api.clock_skew, delta=2)
+
+    def test_if_expiring_within(self):
+        self._save(profile='fake')
+        requests = len(self.server.requests)
+        api = self.server.client(self.cache_dir, profile='fake')
+
+        with contextlib.redirect_stdout(StringIO()) as stdout:
+            self.assertTrue(cli._still_fresh([api], 15 * 60))
+        self.assertIn("Profile fake is valid for another 59m",
+                      stdout.getvalue())
+        self.assertEqual(requests, len(self.server.requests))
+
+        # Expiring within the window, or never saved
+        self.assertFalse(cli._still_fresh([api], 2 * 3600))
+        self.assertFalse(cli._still_fresh(
+            [self.server.client(self.cache_dir, profile='other')], 15 * 60
+        ))
+
+    def test_if_expiring_within_all_roles(self):
+        self.server.roles = role_arns(2)
+        with contextlib.redirect_stdout(StringIO()):
+            self.server.client(self.cache_dir).save_all_credentials()
+        index = SharedCredentialsFile(self.cred_file).expiry_index
+        names = [name for name, _ in index.find(config_name=None)]
+        self.assertEqual(2, len(names))
+
+        api = self.server.client(self.cache_dir)
+        with contextlib.redirect_stdout(StringIO()):
+            self.assertTrue(cli._still_fresh([api], 15 * 60))
+
+        # One of the section's profiles has expired, though another was
+        # saved after it
+        profiles = index.load()['profiles']
+        index.update({names[0]: dict(
+            profiles[names[0]], expiration='2020-01-01T00:00:00+00:00',
+        )})
+        index.update({names[1]: profiles[names[1]]})
+        self.assertFalse(cli._still_fresh([api], 15 * 60))
+
+    def test_status(self):
+        self._save(profile='fake')
+        SharedCredentialsFile(self.cred_file).expiry_index.update(dict(
+            old=dict(expiration='2020-01-01T00:00:00+00:00'),
+        ), clock_skew=30.0)
+
+        with contextlib.redirect_stdout(StringIO()) as stdout:
+            cli._status()
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(
+            "Profiles saved in '{}'".format(self.cred_file), lines[0]
+        )
+        self.assertRegex(lines[1], r'^PROFILE +CONFIG +EXPIRES +REMAINING$')
+        self.assertRegex(lines[2], r'^fake .* 5\dm \d\ds$')
+        self.assertRegex(lines[3], r'^old .* expired$')
+        self.assertEqual(
+            "Corrected for this clock being 30s behind AWS", lines[4]
+        )
+
+    def test_status_empty(self):
+        with contextlib.redirect_stdout(StringIO()) as stdout:
+            cli._status()
+
+        self.assertIn("No profiles saved", stdout.getvalue())
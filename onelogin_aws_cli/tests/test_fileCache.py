@@ -0,0 +1,90 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from cryptography.fernet import Fernet
+
+from onelogin_aws_cli.cache import EncryptedFileCache, FileCache
+
+
+class TestFileCache(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = FileCache('mock', cache_dir=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _in(self, seconds):
+        return datetime.datetime.now(datetime.timezone.utc) + \
+            datetime.timedelta(seconds=seconds)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.cache.get('missing'))
+
+    def test_set_get(self):
+        self.cache.set('key', dict(foo='bar'), self._in(60))
+        self.assertEqual(dict(foo='bar'), self.cache.get('key'))
+
+    def test_get_expired(self):
+        self.cache.set('key', dict(foo='bar'), self._in(-1))
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual([], os.listdir(self.cache.path))
+
+    def test_evict_expired(self):
+        self.cache.set('old', dict(foo='bar'), self._in(-1))
+        self.cache.set('new', dict(foo='baz'), self._in(60))
+
+        self.assertEqual(1, len(os.listdir(self.cache.path)))
+        self.assertEqual(dict(foo='baz'), self.cache.get('new'))
+
+    def test_delete(self):
+        self.cache.set('key', dict(foo='bar'), self._in(60))
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+
+class TestEncryptedFileCache(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.expires = datetime.datetime.now(datetime.timezone.utc) + \
+            datetime.timedelta(seconds=60)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_encrypted_at_rest(self):
+        cache = EncryptedFileCache(
+            'mock', cache_dir=self.tmp.name, key=Fernet.generate_key(),
+        )
+        cache.set('key', dict(secret='hunter2'), self.expires)
+
+        for name in os.listdir(cache.path):
+            with open(os.path.join(cache.path, name)) as fp:
+                self.assertNotIn('hunter2', fp.read())
+
+        self.assertEqual(dict(secret='hunter2'), cache.get('key'))
+
+    def test_wrong_key(self):
+        EncryptedFileCache(
+            'mock', cache_dir=self.tmp.name, key=Fernet.generate_key(),
+        ).set('key', dict(secret='hunter2'), self.expires)
+
+        cache = EncryptedFileCache(
+            'mock', cache_dir=self.tmp.name, key=Fernet.generate_key(),
+        )
+        self.assertIsNone(cache.get('key'))
+
+    @patch('onelogin_aws_cli.keychain.get_password',
+           side_effect=RuntimeError('no keyring'))
+    def test_keyring_unavailable(self, get_password):
+        cache = EncryptedFileCache('mock', cache_dir=self.tmp.name)
+        cache.set('key', dict(secret='hunter2'), self.expires)
+
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(os.path.exists(cache.path) and
+                         os.listdir(cache.path))
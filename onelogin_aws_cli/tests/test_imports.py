@@ -0,0 +1,103 @@
+import json
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+HEAVY_MODULES = [
+    'boto3',
+    'botocore',
+    'cryptography',
+    'keyring',
+    'onelogin.api.client',
+    'pkg_resources',
+    'requests',
+]
+
+
+# A `--credential-process` run answered from the credentials cache
+CREDENTIAL_PROCESS_CACHE_HIT = (
+    'import base64, datetime, tempfile\n'
+    'from onelogin_aws_cli import OneloginAWS\n'
+    'from onelogin_aws_cli.cache import EncryptedFileCache\n'
+    'from onelogin_aws_cli.cli import _credential_process\n'
+    'api = OneloginAWS(dict(base_uri="https://api.us.onelogin.com/",\n'
+    '                       client_id="id", client_secret="secret",\n'
+    '                       aws_app_id="1", username="user",\n'
+    '                       role_arn="arn:aws:iam::1:role/Role",\n'
+    '                       duration_seconds=3600))\n'
+    'with tempfile.TemporaryDirectory() as tmp:\n'
+    '    api.credentials_cache = EncryptedFileCache(\n'
+    '        "credentials", tmp,\n'
+    '        key=base64.urlsafe_b64encode(b"0" * 32))\n'
+    '    api._cache_credentials(dict(\n'
+    '        Credentials=dict(\n'
+    '            AccessKeyId="ASIA", SecretAccessKey="secret",\n'
+    '            SessionToken="token",\n'
+    '            Expiration=datetime.datetime.now(datetime.timezone.utc)\n'
+    '            + datetime.timedelta(hours=1)),\n'
+    '        AssumedRoleUser=dict(\n'
+    '            Arn="arn:aws:sts::1:assumed-role/Role/user",\n'
+    '            AssumedRoleId="ROLE:user")))\n'
+    '    # Read back from disk, as by the next credential_process run\n'
+    '    api._cached_credentials.clear()\n'
+    '    _credential_process(api)\n'
+)
+
+
+def _imported_modules(code: str) -> set:
+    output = subprocess.check_output([
+        sys.executable, '-c',
+        code + '\nimport json, sys\nprint(json.dumps(list(sys.modules)))',
+    ])
+    return set(json.loads(output.decode().splitlines()[-1]))
+
+
+class TestImports(TestCase):
+
+    def assertNotImported(self, modules: set):
+        self.assertEqual(
+            [], [m for m in HEAVY_MODULES if m in modules]
+        )
+
+    def test_import_cli(self):
+        self.assertNotImported(_imported_modules(
+            'import onelogin_aws_cli.cli'
+        ))
+
+    def test_version(self):
+        self.assertNotImported(_imported_modules(
+            'from onelogin_aws_cli.cli import login\n'
+            'try:\n'
+            '    login(["--version"])\n'
+            'except SystemExit:\n'
+            '    pass'
+        ))
+
+    def test_construct(self):
+        self.assertNotImported(_imported_modules(
+            'from onelogin_aws_cli import OneloginAWS\n'
+            'OneloginAWS(dict(base_uri="https://api.us.onelogin.com/",\n'
+            '                 client_id="id", client_secret="secret",\n'
+            '                 duration_seconds=3600))'
+        ))
+
+    def test_credential_process_cache_hit(self):
+        modules = _imported_modules(CREDENTIAL_PROCESS_CACHE_HIT)
+
+        self.assertEqual([], [
+            m for m in ('boto3', 'botocore', 'onelogin.api.client', 'requests')
+            if m in modules
+        ])
+
+    def test_assume_role(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            modules = _imported_modules(
+                'from onelogin_aws_cli.tests.fake_server import FakeServer\n'
+                'with FakeServer() as server:\n'
+                '    server.client({!r}).assume_role()'.format(tmp)
+            )
+
+        self.assertEqual(
+            [], [m for m in ('boto3', 'botocore') if m in modules]
+        )
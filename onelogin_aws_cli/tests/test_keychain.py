@@ -0,0 +1,192 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from keyring.backend import KeyringBackend
+
+from onelogin_aws_cli import keychain
+from onelogin_aws_cli.cache import FileCache
+from onelogin_aws_cli.credentials import UserCredentials
+from onelogin_aws_cli.tests import helper
+
+BACKEND_NAME = __name__ + ".MemoryKeyring"
+
+
+class MemoryKeyring(KeyringBackend):
+    priority = 1
+    calls = []
+
+    def __init__(self):
+        super().__init__()
+        self.passwords = {}
+
+    def get_password(self, service, username):
+        MemoryKeyring.calls.append(('get', service, username))
+        return self.passwords.get((service, username))
+
+    def set_password(self, service, username, password):
+        MemoryKeyring.calls.append(('set', service, username))
+        self.passwords[(service, username)] = password
+
+    def delete_password(self, service, username):
+        del self.passwords[(service, username)]
+
+
+class TestKeychain(TestCase):
+
+    def setUp(self):
+        keychain.clear_keychain()
+        self.addCleanup(keychain.clear_keychain)
+        MemoryKeyring.calls = []
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = FileCache('keyring-backend', self.tmp.name)
+
+        discover = patch('keyring.get_keyring', return_value=MemoryKeyring())
+        self.discover = discover.start()
+        self.addCleanup(discover.stop)
+
+        environ = patch.dict('os.environ')
+        environ.start()
+        self.addCleanup(environ.stop)
+        os.environ.pop('PYTHON_KEYRING_BACKEND', None)
+        config = patch('keyring.core.load_config', return_value=None)
+        self.load_config = config.start()
+        self.addCleanup(config.stop)
+
+    def test_use_backend(self):
+        keychain.use_backend(BACKEND_NAME)
+
+        backend = keychain.get_keyring(self.cache)
+
+        self.assertIsInstance(backend, MemoryKeyring)
+        self.assertIs(backend, keychain.get_keyring(self.cache))
+        self.discover.assert_not_called()
+        self.assertIsNone(self.cache.get('backend'))
+
+    def test_backend_remembered(self):
+        keychain.get_keyring(self.cache)
+        self.discover.assert_called_once_with()
+        self.assertEqual(dict(name=BACKEND_NAME), self.cache.get('backend'))
+
+        # A later run loads the backend found by the first one
+        keychain.clear_keychain()
+        self.assertIsInstance(keychain.get_keyring(self.cache), MemoryKeyring)
+        self.discover.assert_called_once_with()
+
+    def test_remembered_backend_missing(self):
+        self.cache.set(
+            'backend', dict(name='missing.Keyring'),
+            datetime.datetime.now(datetime.timezone.utc) +
+            datetime.timedelta(hours=1),
+        )
+
+        self.assertIsInstance(keychain.get_keyring(self.cache), MemoryKeyring)
+        self.discover.assert_called_once_with()
+        self.assertEqual(dict(name=BACKEND_NAME), self.cache.get('backend'))
+
+    def test_configured_backend(self):
+        self.cache.set(
+            'backend', dict(name='keyring.backends.fail.Keyring'),
+            datetime.datetime.now(datetime.timezone.utc) +
+            datetime.timedelta(hours=1),
+        )
+        os.environ['PYTHON_KEYRING_BACKEND'] = BACKEND_NAME
+
+        # Rather than the backend remembered by an earlier run
+        self.assertIsInstance(keychain.get_keyring(self.cache), MemoryKeyring)
+        self.discover.assert_not_called()
+        self.assertEqual(dict(name='keyring.backends.fail.Keyring'),
+                         self.cache.get('backend'))
+
+    def test_config_file_backend(self):
+        keychain.get_keyring(self.cache)
+        keychain.clear_keychain()
+        self.load_config.return_value = configured = MemoryKeyring()
+
+        self.assertIs(configured, keychain.get_keyring(self.cache))
+        self.discover.assert_called_once_with()
+
+    def test_get_password(self):
+        keychain.use_backend(BACKEND_NAME)
+        keychain.set_password('service', 'user', 'hunter2', ttl=0)
+
+        self.assertEqual(
+            'hunter2', keychain.get_password('service', 'user', ttl=60)
+        )
+        self.assertEqual(
+            'hunter2', keychain.get_password('service', 'user', ttl=60)
+        )
+        self.assertEqual([
+            ('set', 'service', 'user'),
+            ('get', 'service', 'user'),
+        ], MemoryKeyring.calls)
+
+    def test_get_password_expired(self):
+        keychain.use_backend(BACKEND_NAME)
+        keychain.get_keyring().set_password('service', 'user', 'hunter2')
+
+        with patch('time.monotonic', return_value=1000):
+            keychain.get_password('service', 'user', ttl=60)
+        with patch('time.monotonic', return_value=1059):
+            keychain.get_password('service', 'user', ttl=60)
+        with patch('time.monotonic', return_value=1060):
+            keychain.get_password('service', 'user', ttl=60)
+
+        self.assertEqual(2, MemoryKeyring.calls.count(
+            ('get', 'service', 'user')
+        ))
+
+    def test_not_remembered(self):
+        keychain.use_backend(BACKEND_NAME)
+
+        keychain.get_password('service', 'user', ttl=0)
+        keychain.get_password('service', 'user', ttl=0)
+        # Missing passwords are never remembered
+        keychain.get_password('service', 'other')
+        keychain.get_password('service', 'other')
+
+        self.assertEqual(4, len(MemoryKeyring.calls))
+
+    def test_user_credentials(self):
+        cfg = helper.build_config("""[defaults]
+keyring_backend = {}
+save_password = true
+username = mock_user
+""".format(BACKEND_NAME))
+        keychain.use_backend(cfg.section('defaults').get('keyring_backend'))
+        keychain.get_keyring().set_password(
+            UserCredentials.SERVICE_NAME, 'mock_user', 'hunter2'
+        )
+
+        for _ in range(3):
+            creds = UserCredentials(cfg.section('defaults'))
+            creds.load_password()
+            self.assertEqual('hunter2', creds.password)
+
+        self.assertEqual(1, MemoryKeyring.calls.count(
+            ('get', UserCredentials.SERVICE_NAME, 'mock_user')
+        ))
+
+    def test_user_credentials_no_cache(self):
+        cfg = helper.build_config("""[defaults]
+password_cache_ttl = 0
+save_password = true
+username = mock_user
+""")
+        keychain.use_backend(BACKEND_NAME)
+        keychain.get_keyring().set_password(
+            UserCredentials.SERVICE_NAME, 'mock_user', 'hunter2'
+        )
+
+        for _ in range(2):
+            creds = UserCredentials(cfg.section('defaults'))
+            creds._prompt_user_password = MagicMock()
+            creds.load_password()
+
+        self.assertEqual(2, MemoryKeyring.calls.count(
+            ('get', UserCredentials.SERVICE_NAME, 'mock_user')
+        ))
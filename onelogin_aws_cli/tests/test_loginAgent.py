@@ -0,0 +1,242 @@
+import configparser
+import contextlib
+import json
+import os
+import socket
+import tempfile
+import threading
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from onelogin_aws_cli import OneloginAWS, cli
+from onelogin_aws_cli.agent import AgentClient, AgentServer, LoginAgent
+from onelogin_aws_cli.argparse import OneLoginAWSArgumentParser
+from onelogin_aws_cli.tests import helper
+from onelogin_aws_cli.tests.fake_server import FakeServer
+
+
+class TestLoginAgent(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        self.cred_file = os.path.join(self.tmp.name, 'credentials')
+        self.path = os.path.join(self.tmp.name, 'agent.sock')
+
+        env = patch.dict(
+            os.environ, AWS_SHARED_CREDENTIALS_FILE=self.cred_file
+        )
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.server = FakeServer(roles=1).start()
+        self.addCleanup(self.server.stop)
+
+        self.config = helper.build_config("[fake]\n" + "".join(
+            "{} = {}\n".format(key, value)
+            for key, value in self.server.settings().items()
+        ))
+        self.agent = LoginAgent(
+            self.config,
+            create=lambda section: self.server.wire(
+                OneloginAWS(section), self.cache_dir
+            ),
+        )
+
+        self.agent_server = AgentServer(self.path, self.agent)
+        threading.Thread(
+            target=self.agent_server.serve_forever, args=(0.05,),
+            daemon=True,
+        ).start()
+        self.addCleanup(self.agent_server.server_close)
+        self.addCleanup(self.agent_server.shutdown)
+
+    def _credentials(self, **options):
+        with contextlib.redirect_stdout(StringIO()):
+            return AgentClient(self.path).credentials('fake', options)
+
+    def test_credentials(self):
+        response = self._credentials()
+
+        self.assertEqual(
+            '123456789012/Role0/user@example.com', response['profile']
+        )
+        creds = response['credentials']['Credentials']
+        self.assertTrue(creds['AccessKeyId'].startswith('ASIA'))
+        self.assertEqual(
+            {response['profile']: {
+                'aws_access_key_id': creds['AccessKeyId'],
+                'aws_secret_access_key': creds['SecretAccessKey'],
+                'aws_session_token': creds['SessionToken'],
+                'region': 'us-east-1',
+            }},
+            response['updates'],
+        )
+
+        # Served from memory the second time
+        self.assertEqual(response, self._credentials())
+        self.assertEqual(1, self.server.requests.count('/'))
+        self.assertEqual(
+            1, self.server.requests.count('/api/2/saml_assertion')
+        )
+
+    def test_concurrent_requests(self):
+        responses = []
+        threads = [
+            threading.Thread(
+                target=lambda: responses.append(self._credentials())
+            )
+            for _ in range(32)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(32, len(responses))
+        self.assertEqual(
+            1, len({r['credentials']['Credentials']['AccessKeyId']
+                    for r in responses})
+        )
+        self.assertEqual(1, self.server.requests.count('/'))
+
+    def test_options(self):
+        default = self._credentials()
+        named = self._credentials(profile='named')
+
+        self.assertEqual('named', named['profile'])
+        self.assertNotEqual(default['updates'][default['profile']],
+                            named['updates']['named'])
+        # The same role is assumed again for the other profile, reusing the
+        # SAML assertion
+        self.assertEqual(2, self.server.requests.count('/'))
+        self.assertEqual(
+            1, self.server.requests.count('/api/2/saml_assertion')
+        )
+
+    def test_unknown_section(self):
+        with self.assertRaisesRegex(Exception, "'missing' not defined"):
+            AgentClient(self.path).credentials('missing', {})
+
+    def test_ping(self):
+        self.assertEqual(
+            dict(ok=True, pid=os.getpid()),
+            AgentClient(self.path).request(dict(command='ping')),
+        )
+
+    def test_not_listening(self):
+        self.assertIsNone(AgentClient(
+            os.path.join(self.tmp.name, 'missing.sock')
+        ).credentials('fake', {}))
+
+    def test_stale_socket(self):
+        path = os.path.join(self.tmp.name, 'stale.sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(path)
+
+        self.assertIsNone(AgentClient(path).credentials('fake', {}))
+
+    def test_full_backlog(self):
+        path = os.path.join(self.tmp.name, 'busy.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(listener.close)
+        listener.bind(path)
+        listener.listen(0)
+
+        # Fill the backlog of a listener which is not accepting yet
+        queued = []
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.addCleanup(sock.close)
+            sock.setblocking(False)
+            try:
+                sock.connect(path)
+            except BlockingIOError:
+                break
+            queued.append(sock)
+
+        def accept():
+            for _ in range(len(queued) + 1):
+                conn, _ = listener.accept()
+                with conn, conn.makefile('rwb') as fp:
+                    if fp.readline():
+                        fp.write(b'{"ok": true}\n')
+                        fp.flush()
+
+        for sock in queued:
+            sock.shutdown(socket.SHUT_WR)
+        thread = threading.Thread(target=accept, daemon=True)
+        threading.Timer(0.2, thread.start).start()
+
+        self.assertEqual(
+            dict(ok=True),
+            AgentClient(path, timeout=5).request(dict(command='ping')),
+        )
+        thread.join(5)
+
+    def test_socket_permissions(self):
+        self.assertEqual(0o600, os.stat(self.path).st_mode & 0o777)
+
+    def test_other_user(self):
+        if not hasattr(socket, 'SO_PEERCRED'):
+            self.skipTest("SO_PEERCRED is not available")
+
+        with patch('os.getuid', return_value=os.getuid() + 1):
+            # Closed before or after the request was sent
+            with self.assertRaises(Exception):
+                AgentClient(self.path).request(dict(command='ping'))
+
+    def test_already_listening(self):
+        with self.assertRaisesRegex(Exception, "already listening"):
+            AgentServer(self.path, self.agent)
+
+    def _login(self, *args) -> str:
+        args = OneLoginAWSArgumentParser().parse_args(
+            ['-C', 'fake', '--agent-sock', self.path] + list(args)
+        )
+        with contextlib.redirect_stdout(StringIO()) as stdout:
+            self.assertTrue(cli._agent_login(args))
+        return stdout.getvalue()
+
+    def test_cli_save_credentials(self):
+        output = self._login('--profile', 'agent')
+
+        self.assertIn("Use aws cli with --profile agent", output)
+        cred_config = configparser.ConfigParser()
+        cred_config.read(self.cred_file)
+        self.assertTrue(
+            cred_config['agent']['aws_access_key_id'].startswith('ASIA')
+        )
+
+    def test_cli_credential_process(self):
+        output = json.loads(self._login('--credential-process'))
+
+        self.assertEqual(1, output['Version'])
+        self.assertTrue(output['AccessKeyId'].startswith('ASIA'))
+        self.assertFalse(os.path.exists(self.cred_file))
+
+    def test_cli_env(self):
+        output = self._login('--env', '--region', 'eu-west-1')
+
+        self.assertIn("export AWS_ACCESS_KEY_ID=ASIA", output)
+        self.assertIn("export AWS_REGION=eu-west-1", output)
+        self.assertFalse(os.path.exists(self.cred_file))
+
+    def test_cli_without_agent(self):
+        args = OneLoginAWSArgumentParser().parse_args([
+            '-C', 'fake', '--agent-sock',
+            os.path.join(self.tmp.name, 'missing.sock'),
+        ])
+
+        with contextlib.redirect_stderr(StringIO()) as stderr:
+            self.assertFalse(cli._agent_login(args))
+        self.assertIn("Could not reach the login agent", stderr.getvalue())
+
+        # Options the agent does not handle log in directly
+        args = OneLoginAWSArgumentParser().parse_args([
+            '-C', 'fake', '--agent-sock', self.path, '--all-roles',
+        ])
+        self.assertFalse(cli._agent_login(args))
+        self.assertEqual([], self.server.requests)
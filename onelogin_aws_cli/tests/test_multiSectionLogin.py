@@ -0,0 +1,195 @@
+import base64
+import configparser
+import contextlib
+import datetime
+import os
+import tempfile
+from argparse import Namespace
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from onelogin_aws_cli import OneloginAWS
+from onelogin_aws_cli.aliases import AccountAliases
+from onelogin_aws_cli.cache import FileCache
+from onelogin_aws_cli.multilogin import MultiSectionLogin
+from onelogin_aws_cli.sharedcredentials import SharedCredentialsFile
+from onelogin_aws_cli.tests import helper
+
+TEST_ROOT = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class TestMultiSectionLogin(TestCase):
+
+    def setUp(self):
+        with open(os.path.join(TEST_ROOT, 'saml_single_role.xml'), 'rb') as fp:
+            self.saml = base64.b64encode(fp.read())
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cred_file = os.path.join(self.tmp.name, 'credentials')
+        cache_dir = os.path.join(self.tmp.name, 'cache')
+
+        config = helper.build_config("""[defaults]
+base_uri = https://api.us.onelogin.com/
+client_id = mock-id
+client_secret = mock-secret
+subdomain = example
+username = user1
+duration_seconds = 3600
+auto_determine_ip_address = false
+
+[first]
+aws_app_id = app1
+profile = first
+
+[second]
+aws_app_id = app1
+profile = second
+
+[other-app]
+aws_app_id = app2
+profile = other-app
+
+[other-user]
+aws_app_id = app1
+username = user2
+profile = other-user
+""")
+
+        self.get_saml_assertion = MagicMock(return_value=Namespace(
+            mfa=Namespace(
+                devices=[Namespace(type='mock-device', id='mock-device')],
+                state_token='mock-state-token',
+            ),
+        ))
+        self.get_saml_assertion_verifying = MagicMock(
+            return_value=Namespace(mfa=None, saml_response=self.saml)
+        )
+
+        self.apis = []
+        for name in config.sections():
+            section = config.section(name)
+            section.set_overrides(dict(no_saml_cache=True))
+            api = OneloginAWS(section)
+            api.ol_client = Namespace(
+                get_saml_assertion=self.get_saml_assertion,
+                get_saml_assertion_verifying=(
+                    self.get_saml_assertion_verifying
+                ),
+                error=None,
+                access_token='mock-access-token',
+                expiration=None,
+            )
+            api.sts_client = MagicMock()
+            api.sts_client.assume_role_with_saml.side_effect = \
+                self._assume_role_with_saml
+            api.credentials_cache = FileCache('credentials', cache_dir)
+            api.account_aliases = AccountAliases(
+                FileCache('account-alias', cache_dir),
+                lookup=MagicMock(return_value=None),
+            )
+            self.apis.append(api)
+
+    @staticmethod
+    def _assume_role_with_saml(RoleArn, **kwargs):
+        return dict(
+            Credentials=dict(
+                AccessKeyId='mock-key',
+                SecretAccessKey='mock-secret',
+                SessionToken='mock-token',
+                Expiration=datetime.datetime.now(datetime.timezone.utc) +
+                datetime.timedelta(hours=1),
+            ),
+            AssumedRoleUser=dict(
+                Arn='arn:aws:sts::123456789012:assumed-role/MyRole/user',
+            ),
+        )
+
+    def _login(self, answer=None):
+        with patch.dict(os.environ,
+                        AWS_SHARED_CREDENTIALS_FILE=self.cred_file):
+            with patch('getpass.getpass',
+                       return_value='mock-password') as getpass, \
+                    patch('builtins.input', return_value='123456',
+                          side_effect=answer) as otp, \
+                    patch.object(SharedCredentialsFile, 'update',
+                                 autospec=True,
+                                 side_effect=SharedCredentialsFile.update
+                                 ) as update, \
+                    contextlib.redirect_stdout(StringIO()):
+                multi = MultiSectionLogin(self.apis)
+                profiles = multi.login()
+        return multi, profiles, getpass, otp, update
+
+    def test_login(self):
+        multi, profiles, getpass, otp, update = self._login()
+
+        self.assertEqual(
+            {'first', 'second', 'other-app', 'other-user'}, set(profiles)
+        )
+
+        # One password for each user, and one MFA token for each user and app
+        self.assertEqual(2, getpass.call_count)
+        self.assertEqual(3, otp.call_count)
+        self.assertEqual(3, self.get_saml_assertion.call_count)
+        self.assertIs(self.apis[0].saml, self.apis[1].saml)
+
+        # Written in one go
+        update.assert_called_once()
+        cred_config = configparser.ConfigParser()
+        cred_config.read(self.cred_file)
+        self.assertEqual(
+            ['first', 'other-app', 'other-user', 'second'],
+            sorted(cred_config.sections())
+        )
+
+    def test_device_choice_shared(self):
+        self.get_saml_assertion.return_value.mfa.devices = [
+            Namespace(type='first-device', id='first-device'),
+            Namespace(type='second-device', id='second-device'),
+        ]
+
+        prompts = []
+
+        def answer(prompt):
+            prompts.append(prompt)
+            return '2' if prompt == '? ' else '123456'
+
+        self._login(answer)
+
+        # One device choice for each user, even across apps
+        self.assertEqual(2, prompts.count('? '))
+        self.assertEqual(3, prompts.count('second-device Token: '))
+        for call in self.get_saml_assertion_verifying.call_args_list:
+            self.assertEqual('second-device', call[0][1])
+
+    def test_refresh_profiles(self):
+        multi, profiles, _, _, _ = self._login()
+
+        with patch.dict(os.environ,
+                        AWS_SHARED_CREDENTIALS_FILE=self.cred_file):
+            with patch('builtins.input', return_value='123456'), \
+                    patch.object(SharedCredentialsFile, 'update',
+                                 autospec=True,
+                                 side_effect=SharedCredentialsFile.update
+                                 ) as update:
+                refreshed = multi.refresh_profiles(['first', 'other-user'])
+
+        self.assertEqual({'first', 'other-user'}, set(refreshed))
+        update.assert_called_once()
+        # The test assertion has no expiry, so is fetched again once for each
+        # user rather than reused
+        self.assertEqual(5, self.get_saml_assertion.call_count)
+        self.apis[0].sts_client.assume_role_with_saml.assert_called()
+        self.assertEqual(
+            1, self.apis[1].sts_client.assume_role_with_saml.call_count
+        )
+
+    def test_duplicate_profile(self):
+        self.apis[1].config.set_overrides(dict(
+            no_saml_cache=True, profile='first'
+        ))
+
+        with self.assertRaisesRegex(Exception, "more than one config"):
+            self._login()
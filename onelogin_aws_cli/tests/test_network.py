@@ -0,0 +1,72 @@
+import subprocess
+import sys
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from onelogin_aws_cli.network import lookup_public_ip, network_fingerprint
+from onelogin_aws_cli.tests.helper import endpoint_url, stand_in_endpoint
+
+
+class TestNetwork(TestCase):
+
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def _endpoint(self, body: bytes, delay: float = 0) -> str:
+        server = stand_in_endpoint(body, delay=delay)
+        self.servers.append(server)
+        return endpoint_url(server, '/')
+
+    def test_network_fingerprint(self):
+        fingerprint = network_fingerprint()
+        self.assertEqual(fingerprint, network_fingerprint())
+
+        with patch('onelogin_aws_cli.network.default_route_address',
+                   return_value='10.1.2.3'):
+            self.assertNotEqual(fingerprint, network_fingerprint())
+
+    def test_lookup_public_ip_first_answer_wins(self):
+        started = time.monotonic()
+        ip_address = lookup_public_ip([
+            self._endpoint(b'203.0.113.1\n', delay=1),
+            self._endpoint(b'203.0.113.2\n'),
+        ], timeout=2)
+
+        self.assertEqual('203.0.113.2', ip_address)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_lookup_public_ip_ignores_bad_answers(self):
+        self.assertEqual('203.0.113.1', lookup_public_ip([
+            self._endpoint(b'<html>nope</html>'),
+            'http://127.0.0.1:9/',
+            self._endpoint(b'203.0.113.1', delay=0.1),
+        ], timeout=2))
+
+    def test_lookup_public_ip_timeout(self):
+        started = time.monotonic()
+        self.assertIsNone(lookup_public_ip([
+            self._endpoint(b'203.0.113.1', delay=1),
+        ], timeout=0.2))
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_lookup_public_ip_does_not_hold_up_exit(self):
+        slow = self._endpoint(b'203.0.113.1', delay=2)
+        fast = self._endpoint(b'203.0.113.2')
+
+        started = time.monotonic()
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            "import sys\n"
+            "from onelogin_aws_cli.network import lookup_public_ip\n"
+            "print(lookup_public_ip(sys.argv[1:], timeout=3))\n",
+            slow, fast,
+        ], timeout=10)
+
+        self.assertEqual(b'203.0.113.2', output.strip())
+        self.assertLess(time.monotonic() - started, 1.5)
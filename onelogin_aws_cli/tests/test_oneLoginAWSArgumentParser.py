@@ -52,6 +52,13 @@ class TestOneLoginAWSArgumentParser(TestCase):
             '-u', 'my_username',
             '-c',
             '-d', '43200',
+            '--all-roles',
+            '--role-filter', '*:role/Admin*',
+            '--all-sections',
+            '--timings',
+            '--trace', 'trace.jsonl',
+            '--trace-format', 'otlp',
+            '--if-expiring-within', '15m',
         ])
 
         self.assertEqual(args.config_name, 'my_config')
@@ -59,12 +66,62 @@ class TestOneLoginAWSArgumentParser(TestCase):
         self.assertEqual(args.username, 'my_username')
         self.assertTrue(args.configure)
         self.assertEqual(args.duration_seconds, 43200)
+        self.assertTrue(args.all_roles)
+        self.assertEqual(args.role_filter, '*:role/Admin*')
+        self.assertTrue(args.all_sections)
+        self.assertTrue(args.timings)
+        self.assertEqual(args.trace, 'trace.jsonl')
+        self.assertEqual(args.trace_format, 'otlp')
+        self.assertEqual(args.if_expiring_within, 900)
+        self.assertEqual(args.command, 'login')
+
+    def test_exec(self):
+        parser = OneLoginAWSArgumentParser()
+        args = parser.parse_args(['--profile', 'dev', '--exec', '--',
+                                  'aws', '--profile', 'other', 's3', 'ls'])
+
+        self.assertTrue(args.exec)
+        self.assertEqual('dev', args.profile)
+        self.assertEqual(['aws', '--profile', 'other', 's3', 'ls'],
+                         args.exec_command)
+        self.assertIsNone(parser.parse_args(['--env']).exec_command)
+
+        for invalid in (['--exec'], ['--', 'aws'],
+                        ['--exec', '--credential-process', '--', 'aws'],
+                        ['--env', '--credential-process']):
+            with self.assertRaises(SystemExit):
+                with contextlib.redirect_stderr(StringIO()):
+                    parser.parse_args(invalid)
+
+    def test_status_command(self):
+        args = OneLoginAWSArgumentParser().parse_args(['status'])
+
+        self.assertEqual('status', args.command)
+        self.assertIsNone(args.if_expiring_within)
+
+        args = OneLoginAWSArgumentParser().parse_args([
+            'serve', '-C', 'my_config', '--port', '9911',
+        ])
+        self.assertEqual('serve', args.command)
+        self.assertEqual(9911, args.port)
+
+    def test_duration(self):
+        parser = OneLoginAWSArgumentParser()
+        for value, seconds in (('90', 90), ('30s', 30), ('1h', 3600),
+                               ('2d', 172800)):
+            args = parser.parse_args(['--if-expiring-within', value])
+            self.assertEqual(seconds, args.if_expiring_within)
+
+        with self.assertRaises(SystemExit):
+            with contextlib.redirect_stderr(StringIO()):
+                parser.parse_args(['--if-expiring-within', '15 minutes'])
 
     def test_environment_variable(self):
         environ['ONELOGIN_AWS_CLI_CONFIG_NAME'] = 'mock-config'
         environ['ONELOGIN_AWS_CLI_PROFILE'] = 'mock-profile'
         environ['ONELOGIN_AWS_CLI_USERNAME'] = 'mock-username'
         environ['ONELOGIN_AWS_CLI_DURATION_SECONDS'] = '10'
+        environ['ONELOGIN_AWS_CLI_TRACE'] = 'trace.jsonl'
 
         parser = OneLoginAWSArgumentParser()
 
@@ -74,8 +131,11 @@ class TestOneLoginAWSArgumentParser(TestCase):
         self.assertEqual('mock-profile', args.profile)
         self.assertEqual('mock-username', args.username)
         self.assertEqual(10, args.duration_seconds)
+        self.assertEqual('trace.jsonl', args.trace)
+        self.assertEqual('jsonl', args.trace_format)
 
         del environ['ONELOGIN_AWS_CLI_CONFIG_NAME']
         del environ['ONELOGIN_AWS_CLI_PROFILE']
         del environ['ONELOGIN_AWS_CLI_USERNAME']
         del environ['ONELOGIN_AWS_CLI_DURATION_SECONDS']
+        del environ['ONELOGIN_AWS_CLI_TRACE']
@@ -1,10 +1,18 @@
 import base64
+import configparser
+import contextlib
+import datetime
 import os
+import tempfile
+import threading
 from argparse import Namespace
+from io import StringIO
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
 from onelogin_aws_cli import OneloginAWS
+from onelogin_aws_cli.aliases import AccountAliases
+from onelogin_aws_cli.cache import FileCache
 
 TEST_ROOT = os.path.join(os.path.dirname(__file__), "fixtures")
 
@@ -40,6 +48,17 @@ class TestOneloginAWS(TestCase):
             role_arn='arn:aws:iam::123456789012:role/OneLogin-MyRole1',
         ))
 
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.alias_lookup = MagicMock(return_value='mock-alias')
+        for ol in (self.ol, self.ol_with_role):
+            ol.account_aliases = AccountAliases(
+                FileCache('account-alias', cache_dir.name),
+                lookup=self.alias_lookup,
+            )
+            # Before the cache is removed
+            self.addCleanup(ol.account_aliases.wait)
+
     def test_init(self):
         mock_config = dict(
             base_uri="https://api.us.onelogin.com/",
@@ -53,12 +72,64 @@ class TestOneloginAWS(TestCase):
         self.assertEqual(mock_config, ol.config)
         self.assertEqual('mock-username', ol.user_credentials.username)
 
+    def test_sts_endpoint_resolved_once(self):
+        resolved = threading.Event()
+
+        def resolve():
+            resolved.wait(5)
+            return 'eu-west-1', None
+
+        self.ol._resolve_sts_endpoint = MagicMock(side_effect=resolve)
+        threads = [
+            threading.Thread(target=lambda: self.ol.sts_client)
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        # Once every thread has had the chance to ask for the client
+        threading.Timer(0.1, resolved.set).start()
+        for thread in threads:
+            thread.join(5)
+
+        self.ol._resolve_sts_endpoint.assert_called_once_with()
+
+    def test_init_learn_account_aliases(self):
+        config = dict(
+            base_uri="https://api.us.onelogin.com/",
+            client_id='mock-id',
+            client_secret='mock-secret',
+            duration_seconds=2600
+        )
+        self.assertTrue(OneloginAWS(config).account_aliases.learning)
+
+        config['learn_account_aliases'] = 'false'
+        self.assertFalse(OneloginAWS(config).account_aliases.learning)
+
     def test_get_ip_address(self):
         self.ol.saml = Namespace(saml_response=self.SAML_SINGLE_ROLE)
         ip_address = self.ol.get_ip_address()
 
         self.assertEqual('1.2.3.4', ip_address)
 
+    def test_get_ip_address_auto(self):
+        ol = self.ol
+        ol.config = MagicMock(auto_determine_ip_address=True)
+        ol.config.get.return_value = None
+
+        with tempfile.TemporaryDirectory() as tmp:
+            ol.ip_address_cache = FileCache('ip-address', tmp)
+            with patch('onelogin_aws_cli.network.lookup_public_ip',
+                       return_value='203.0.113.1') as lookup:
+                self.assertEqual('203.0.113.1', ol.get_ip_address())
+                self.assertEqual('203.0.113.1', ol.get_ip_address())
+                lookup.assert_called_once()
+
+            with patch('onelogin_aws_cli.network.network_fingerprint',
+                       return_value='other-network'):
+                with patch('onelogin_aws_cli.network.lookup_public_ip',
+                           return_value='203.0.113.2'):
+                    self.assertEqual('203.0.113.2', ol.get_ip_address())
+
     def test_get_arns(self):
         self.ol.saml = Namespace(saml_response=self.SAML_SINGLE_ROLE)
         self.ol.get_arns()
@@ -121,12 +192,173 @@ class TestOneloginAWS(TestCase):
             self.ol_with_role.principal_arn,
         )
 
+    def test_get_role_multi_alias_preselected(self):
+        self.ol.config['role_arn'] = 'mock-alias:role/OneLogin-MyRole2'
+        self.ol.saml = Namespace(saml_response=self.SAML_MULTI_ROLE)
+        self.ol.account_aliases.learn(
+            self.ROLE_PREFIX + "1", {'Credentials': 'mock-credentials'}
+        )
+        self.ol.account_aliases.wait()
+
+        self.ol.get_role()
+
+        self.assertEqual(self.ROLE_PREFIX + "2", self.ol.role_arn)
+        self.alias_lookup.assert_called_once_with('mock-credentials')
+
     def test_get_role_fail(self):
         self.ol.all_roles = []
         self.ol.get_arns = MagicMock()
         with self.assertRaisesRegex(Exception, r'^No roles found$'):
             self.ol.get_role()
 
+    def test_get_matching_roles(self):
+        self.ol.saml = Namespace(saml_response=self.SAML_MULTI_ROLE)
+        self.assertEqual(3, len(self.ol.get_matching_roles()))
+
+        self.ol.config['role_filter'] = '*MyRole[12]'
+        self.assertEqual(
+            [
+                (self.ROLE_PREFIX + '1', self.PRVD_PREFIX + '1'),
+                (self.ROLE_PREFIX + '2', self.PRVD_PREFIX + '1'),
+            ],
+            self.ol.get_matching_roles()
+        )
+
+        self.ol.config['role_filter'] = '*Missing*'
+        with self.assertRaisesRegex(Exception, r'^No roles found$'):
+            self.ol.get_matching_roles()
+
+    def test_save_all_credentials(self):
+        self.ol.saml = Namespace(saml_response=self.SAML_MULTI_ROLE)
+        self.ol.config['region'] = None
+
+        def assume_role_with_saml(RoleArn, **kwargs):
+            role_name = RoleArn.split('/')[-1]
+            return dict(
+                Credentials=dict(
+                    AccessKeyId='key-' + role_name,
+                    SecretAccessKey='secret',
+                    SessionToken='token',
+                    Expiration=datetime.datetime(2018, 5, 24, 15, 15, 41),
+                ),
+                AssumedRoleUser=dict(
+                    Arn='arn:aws:sts::123456789012:assumed-role/' +
+                        role_name + '/mock-username',
+                ),
+            )
+
+        self.ol.sts_client = MagicMock()
+        self.ol.sts_client.assume_role_with_saml.side_effect = \
+            assume_role_with_saml
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cred_file = os.path.join(tmp, 'credentials')
+            with open(cred_file, 'w') as fp:
+                fp.write("[other]\naws_access_key_id = untouched\n")
+
+            with patch.dict(os.environ,
+                            AWS_SHARED_CREDENTIALS_FILE=cred_file):
+                with contextlib.redirect_stdout(StringIO()):
+                    self.ol.save_all_credentials()
+
+            cred_config = configparser.ConfigParser()
+            cred_config.read(cred_file)
+
+        self.assertEqual(
+            3, self.ol.sts_client.assume_role_with_saml.call_count
+        )
+        self.assertEqual(
+            'untouched', cred_config['other']['aws_access_key_id']
+        )
+        for i in range(3):
+            name = '123456789012/OneLogin-MyRole{}/mock-username'.format(i)
+            self.assertEqual(
+                'key-OneLogin-MyRole{}'.format(i),
+                cred_config[name]['aws_access_key_id']
+            )
+
+    def test_get_credentials(self):
+        expiration = datetime.datetime.now(datetime.timezone.utc) + \
+            datetime.timedelta(hours=1)
+        response = dict(
+            Credentials=dict(
+                AccessKeyId='mock-key',
+                SecretAccessKey='mock-secret',
+                SessionToken='mock-token',
+                Expiration=expiration,
+            ),
+            AssumedRoleUser=dict(
+                Arn='arn:aws:sts::123456789012:assumed-role/OneLogin-MyRole'
+                    '/mock-username',
+            ),
+        )
+        self.ol.config.update(aws_app_id='mock-app', region=None)
+        self.ol.saml = Namespace(saml_response=self.SAML_SINGLE_ROLE)
+        self.ol.sts_client = MagicMock()
+        self.ol.sts_client.assume_role_with_saml.return_value = response
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.dict(os.environ, AWS_SHARED_CREDENTIALS_FILE=(
+                    os.path.join(tmp, 'credentials')
+                )):
+            self.ol.credentials_cache = FileCache('credentials', tmp)
+
+            self.assertEqual(response, self.ol.get_credentials())
+            self.assertEqual(response, self.ol.get_credentials())
+            self.ol.sts_client.assume_role_with_saml.assert_called_once()
+
+            # A new instance only picks the credentials up from disk for a
+            # configured role, rather than one picked at a prompt
+            ol = OneloginAWS(self.ol.config)
+            ol.credentials_cache = self.ol.credentials_cache
+            self.assertIsNone(ol.cached_credentials())
+            ol.config['role_arn'] = self.ol.role_arn
+            self.assertEqual(response, ol.get_credentials())
+
+            # Nor for another duration
+            other = OneloginAWS(dict(self.ol.config, duration_seconds=900))
+            other.credentials_cache = self.ol.credentials_cache
+            self.assertIsNone(other.cached_credentials())
+
+            # Credentials within the refresh margin are assumed again
+            self.ol.config['refresh_margin'] = 7200
+            self.ol.get_credentials()
+            self.assertEqual(
+                2, self.ol.sts_client.assume_role_with_saml.call_count
+            )
+
+    def test_refresh_profiles(self):
+        expiry = datetime.datetime.now(datetime.timezone.utc) + \
+            datetime.timedelta(minutes=5)
+        self.ol.saml = Namespace(saml_response=base64.b64encode(
+            b'<saml:Conditions '
+            b'xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion" '
+            b'NotOnOrAfter="' +
+            expiry.strftime('%Y-%m-%dT%H:%M:%SZ').encode() +
+            b'"/>'
+        ))
+        self.ol.config['region'] = None
+        self.ol.profile_roles = dict(
+            mock_profile=(self.ROLE_PREFIX, self.PRVD_PREFIX),
+        )
+        self.ol.get_saml_assertion = MagicMock()
+        self.ol.sts_client = MagicMock()
+        self.ol.sts_client.assume_role_with_saml.return_value = 'mock-creds'
+        self.ol._write_credentials = MagicMock()
+
+        profiles = self.ol.refresh_profiles(['mock_profile'])
+
+        self.assertEqual(dict(mock_profile='mock-creds'), profiles)
+        self.ol._write_credentials.assert_called_once_with(profiles)
+        self.ol.sts_client.assume_role_with_saml.assert_called_once_with(
+            RoleArn=self.ROLE_PREFIX,
+            PrincipalArn=self.PRVD_PREFIX,
+            SAMLAssertion=self.ol.saml.saml_response,
+            DurationSeconds=2600,
+        )
+        # The assertion is still valid, so OneLogin is not asked for another
+        self.ol.get_saml_assertion.assert_not_called()
+
     def test__initialize_credentials(self):
         with patch('os.path.expanduser', side_effect=[
                 '/home/.aws/credentials', '/home/.aws/']):
@@ -1,8 +1,14 @@
+import base64
+import contextlib
+import datetime
+import tempfile
 from argparse import Namespace
+from io import StringIO
 from unittest import TestCase, mock
 from unittest.mock import MagicMock, patch
 
 from onelogin_aws_cli import OneloginAWS
+from onelogin_aws_cli.cache import FileCache
 
 
 class _MockSection(Namespace):
@@ -35,6 +41,7 @@ class TestOneloginSAML(TestCase):
                 username='mock-username',
                 duration_seconds=2600,
                 auto_determine_ip_address=False,
+                no_saml_cache=True,
             ),
         )
 
@@ -55,6 +62,8 @@ class TestOneloginSAML(TestCase):
                 self.get_saml_assertion_verifying_mock
             ),
             error=None,
+            access_token='mock-access-token',
+            expiration=None,
         )
 
     @mock.patch('getpass.getpass')
@@ -112,6 +121,39 @@ class TestOneloginSAML(TestCase):
             'mock-token', '123456'
         )
 
+    @mock.patch('getpass.getpass')
+    def test_get_saml_assertion_push(self, getpw):
+        getpw.return_value = 'mock-password'
+        self.ol.config.mfa_push_interval = 0.001
+        self.ol.ol_client.get_saml_assertion = MagicMock(
+            return_value=Namespace(
+                mfa=Namespace(
+                    devices=[Namespace(type='OneLogin Protect', id='mock-id')],
+                    state_token='mock-token'
+                ),
+            )
+        )
+        self.get_saml_assertion_verifying_mock.side_effect = [
+            Namespace(type='pending', saml_response=None),
+            Namespace(type='pending', saml_response=None),
+            Namespace(type='success', saml_response='mock-saml-response'),
+        ]
+
+        with patch('builtins.input') as otp:
+            with contextlib.redirect_stdout(StringIO()):
+                self.ol.get_saml_assertion()
+
+        otp.assert_not_called()
+        self.assertEqual('mock-saml-response', self.ol.saml.saml_response)
+        self.assertEqual([
+            mock.call('mock-app-id', 'mock-id', 'mock-token',
+                      otp_token=None, do_not_notify=False),
+            mock.call('mock-app-id', 'mock-id', 'mock-token',
+                      otp_token=None, do_not_notify=True),
+            mock.call('mock-app-id', 'mock-id', 'mock-token',
+                      otp_token=None, do_not_notify=True),
+        ], self.get_saml_assertion_verifying_mock.call_args_list)
+
     @patch('builtins.input', side_effect=['123456'])
     @mock.patch('getpass.getpass')
     def test_username_prompt(self, getpw, input):
@@ -137,6 +179,44 @@ class TestOneloginSAML(TestCase):
         )
         self.assertIsNone(ol.user_credentials.username)
 
+    @mock.patch('getpass.getpass')
+    def test_get_saml_assertion_cached(self, getpw):
+        getpw.return_value = 'mock-password'
+        self.ol.config.no_saml_cache = False
+        self.ol.config.section_name = 'mock-section'
+
+        expiry = datetime.datetime.now(datetime.timezone.utc) + \
+            datetime.timedelta(minutes=5)
+        saml_response = base64.b64encode(
+            b'<saml:Conditions '
+            b'xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion" '
+            b'NotOnOrAfter="' +
+            expiry.strftime('%Y-%m-%dT%H:%M:%SZ').encode() +
+            b'"/>'
+        ).decode()
+        self.get_saml_assertion_verifying_mock.return_value = Namespace(
+            saml_response=saml_response,
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            self.ol.saml_cache = FileCache('saml', cache_dir=tmp)
+            with patch('builtins.input', side_effect=['123456']):
+                self.ol.get_saml_assertion()
+
+            second = OneloginAWS(self.ol.config)
+            second.saml_cache = self.ol.saml_cache
+            second.ol_client = self.ol.ol_client
+            second.get_saml_assertion()
+
+            self.assertEqual(saml_response, second.saml.saml_response)
+            self.get_saml_assertion_mock.assert_called_once()
+
+            # Bypassing the cache logs in again
+            second.config.no_saml_cache = True
+            with patch('builtins.input', side_effect=['123456']):
+                second.get_saml_assertion()
+            self.assertEqual(2, self.get_saml_assertion_mock.call_count)
+
     def tearDown(self):
         """
         Reset MagicMocks
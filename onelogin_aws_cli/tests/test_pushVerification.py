@@ -0,0 +1,118 @@
+import contextlib
+import itertools
+import threading
+from argparse import Namespace
+from io import StringIO
+from unittest import TestCase
+
+from onelogin_aws_cli.push import PushVerification, backoff, supports_push
+
+
+class _FakeClient(object):
+    """Stands in for `get_saml_assertion_verifying` on a OneLogin client"""
+
+    def __init__(self, approve_after: int = None, otp: str = None,
+                 deny_after: int = None):
+        self.calls = []
+        self.approve_after = approve_after
+        self.otp = otp
+        self.deny_after = deny_after
+
+    def verify(self, otp_token=None, do_not_notify=False):
+        self.calls.append((otp_token, do_not_notify))
+        polls = len([c for c in self.calls if c[1]])
+
+        if otp_token is not None:
+            if otp_token != self.otp:
+                raise Exception("Onelogin Error: '401' 'Invalid OTP'")
+            return Namespace(type='success', saml_response='otp-saml')
+        if self.deny_after is not None and polls >= self.deny_after:
+            raise Exception("Onelogin Error: '401' 'Denied'")
+        if self.approve_after is not None and polls >= self.approve_after:
+            return Namespace(type='success', saml_response='push-saml')
+        return Namespace(type='pending', saml_response=None)
+
+
+class TestPushVerification(TestCase):
+
+    def test_supports_push(self):
+        self.assertTrue(supports_push(Namespace(type='OneLogin Protect')))
+        self.assertFalse(supports_push(Namespace(type='Google Authenticator')))
+
+    def test_push_approved(self):
+        client = _FakeClient(approve_after=3)
+
+        response = PushVerification(
+            client.verify, interval=0.001, max_interval=0.004
+        ).run()
+
+        self.assertEqual('push-saml', response.saml_response)
+        # Notified once, then polled without notifying again
+        self.assertEqual(
+            [(None, False), (None, True), (None, True), (None, True)],
+            client.calls
+        )
+
+    def test_backoff(self):
+        self.assertEqual(
+            [1, 2, 4, 4], list(itertools.islice(backoff(1, 4), 4))
+        )
+
+    def test_timeout(self):
+        client = _FakeClient()
+
+        with self.assertRaisesRegex(Exception, "Timed out"):
+            PushVerification(
+                client.verify, interval=0.001, max_interval=0.002,
+                timeout=0.02
+            ).run()
+
+    def test_push_denied(self):
+        client = _FakeClient(deny_after=1)
+
+        with self.assertRaisesRegex(Exception, "Denied"):
+            PushVerification(client.verify, interval=0.001).run()
+
+    def test_otp_wins(self):
+        client = _FakeClient(otp='123456')
+
+        response = PushVerification(
+            client.verify, interval=0.01, timeout=5
+        ).run(lambda stop: '123456')
+
+        self.assertEqual('otp-saml', response.saml_response)
+        self.assertIn(('123456', False), client.calls)
+
+    def test_mistyped_otp(self):
+        client = _FakeClient(otp='123456')
+        typed = iter(['654321', '123456'])
+
+        with contextlib.redirect_stdout(StringIO()) as stdout:
+            response = PushVerification(
+                client.verify, interval=0.01, timeout=5
+            ).run(lambda stop: next(typed))
+
+        self.assertEqual('otp-saml', response.saml_response)
+        self.assertIn("The token was not accepted", stdout.getvalue())
+        self.assertEqual(
+            ['654321', '123456'],
+            [c[0] for c in client.calls if c[0] is not None],
+        )
+
+    def test_push_wins(self):
+        client = _FakeClient(approve_after=1)
+        gave_up = threading.Event()
+
+        def read_otp(stop):
+            # Waits for input which never arrives, until told to stop
+            stop.wait()
+            gave_up.set()
+            return None
+
+        response = PushVerification(
+            client.verify, interval=0.001
+        ).run(read_otp)
+
+        self.assertEqual('push-saml', response.saml_response)
+        self.assertTrue(gave_up.wait(1))
+        self.assertNotIn('123456', [c[0] for c in client.calls])
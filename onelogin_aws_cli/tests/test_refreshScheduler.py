@@ -0,0 +1,74 @@
+import contextlib
+import datetime
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from onelogin_aws_cli.daemon import RETRY_DELAY, RefreshScheduler
+
+
+def _credentials(expires_at: float):
+    return dict(Credentials=dict(
+        Expiration=datetime.datetime.fromtimestamp(
+            expires_at, datetime.timezone.utc,
+        ),
+    ))
+
+
+class TestRefreshScheduler(TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.refresh = MagicMock(side_effect=lambda names: {
+            name: _credentials(self.now + 3600) for name in names
+        })
+        self.scheduler = RefreshScheduler(
+            self.refresh, refresh_margin=300, coalesce_window=60,
+            clock=lambda: self.now,
+        )
+
+    def run_pending(self):
+        with contextlib.redirect_stdout(StringIO()):
+            return self.scheduler.run_pending()
+
+    def test_nothing_scheduled(self):
+        self.assertIsNone(self.run_pending())
+
+    def test_renews_before_expiry(self):
+        self.scheduler.schedule(dict(a=_credentials(self.now + 3600)))
+
+        self.assertEqual(3300, self.run_pending())
+        self.refresh.assert_not_called()
+
+        self.now += 3300
+        self.assertEqual(3300, self.run_pending())
+        self.refresh.assert_called_once_with(['a'])
+
+    def test_coalesces_renewals(self):
+        self.scheduler.schedule(dict(
+            a=_credentials(self.now + 3600),
+            b=_credentials(self.now + 3630),
+            c=_credentials(self.now + 7200),
+        ))
+
+        self.now += 3300
+        self.run_pending()
+        self.refresh.assert_called_once_with(['a', 'b'])
+
+        # The renewed a and b are now due after c, and are caught up with it
+        self.now = 7900
+        self.run_pending()
+        self.assertEqual(2, self.refresh.call_count)
+        self.assertEqual(['a', 'b', 'c'], sorted(self.refresh.call_args[0][0]))
+
+    def test_short_lived_credentials(self):
+        self.scheduler.schedule(dict(a=_credentials(self.now + 200)))
+        self.assertEqual(100, self.run_pending())
+
+    def test_retries_failures(self):
+        self.refresh.side_effect = Exception('mock-error')
+        self.scheduler.schedule(dict(a=_credentials(self.now + 600)))
+
+        self.now += 300
+        self.assertEqual(RETRY_DELAY, self.run_pending())
+        self.refresh.assert_called_once_with(['a'])
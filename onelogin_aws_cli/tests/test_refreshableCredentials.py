@@ -0,0 +1,148 @@
+import datetime
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from onelogin_aws_cli.daemon import RETRY_DELAY
+from onelogin_aws_cli.session import METHOD, _renew_forever, \
+    boto3_session, load_section, refreshable_credentials
+from onelogin_aws_cli.tests.fake_server import FakeServer
+
+
+class _Stop(Exception):
+    pass
+
+
+def _at(timestamp: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+class TestRefreshableCredentials(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+
+        # Nothing is read from, or written to, the credentials file
+        self.cred_file = os.path.join(self.tmp.name, 'aws', 'credentials')
+        env = patch.dict(
+            os.environ, AWS_SHARED_CREDENTIALS_FILE=self.cred_file
+        )
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.server = FakeServer().start()
+        self.addCleanup(self.server.stop)
+
+    def test_credentials(self):
+        api = self.server.client(self.cache_dir)
+        credentials = refreshable_credentials(api, background=False)
+
+        self.assertEqual(METHOD, credentials.method)
+        self.assertTrue(
+            credentials.get_frozen_credentials().access_key.startswith('ASIA')
+        )
+        # Served from memory until they need renewing
+        credentials.get_frozen_credentials()
+        self.assertEqual(1, self.server.requests.count('/'))
+        self.assertFalse(os.path.exists(os.path.dirname(self.cred_file)))
+
+    def test_refresh(self):
+        # Every use is within the refresh margin
+        api = self.server.client(
+            self.cache_dir, duration_seconds=900, refresh_margin=1000,
+        )
+        credentials = refreshable_credentials(api, background=False)
+        first = credentials.get_frozen_credentials().access_key
+        second = credentials.get_frozen_credentials().access_key
+
+        self.assertNotEqual(first, second)
+        # Each renewal reuses the SAML assertion
+        self.assertEqual(3, self.server.requests.count('/'))
+        self.assertEqual(
+            1, self.server.requests.count('/api/2/saml_assertion')
+        )
+
+    def test_background(self):
+        now = time.time()
+        fetcher = MagicMock(expiration=_at(now + 3600))
+        # Renewed once, then failing
+        renewals = iter([_at(now + 7200), None])
+
+        def renew():
+            expiration = next(renewals)
+            if expiration is not None:
+                fetcher.expiration = expiration
+
+        credentials = MagicMock()
+        credentials.get_frozen_credentials.side_effect = renew
+        delays = []
+
+        def sleep(seconds):
+            delays.append(seconds)
+            if len(delays) == 4:
+                raise _Stop()
+
+        with patch('onelogin_aws_cli.session.time') as mock_time:
+            mock_time.time = lambda: now
+            mock_time.sleep = sleep
+            with self.assertRaises(_Stop):
+                _renew_forever(credentials, fetcher, 300)
+
+        # Woken just inside the refresh margin, where botocore renews them
+        self.assertEqual([3301, 6901, RETRY_DELAY, 6901],
+                         [round(delay) for delay in delays])
+
+    def test_background_failing(self):
+        start = time.time()
+        fetcher = MagicMock(expiration=_at(start + 3600))
+        credentials = MagicMock()
+        credentials.get_frozen_credentials.side_effect = Exception("Failed")
+        delays = []
+
+        def sleep(seconds):
+            self.assertGreaterEqual(seconds, 0)
+            delays.append(seconds)
+            if len(delays) == 12:
+                raise _Stop()
+
+        with patch('onelogin_aws_cli.session.time') as mock_time:
+            mock_time.time = lambda: start + sum(delays)
+            mock_time.sleep = sleep
+            with self.assertRaises(_Stop):
+                _renew_forever(credentials, fetcher, 300)
+
+        # Retried straight away once expired
+        self.assertGreater(sum(delays[:-2]), 3600)
+        self.assertEqual([0, RETRY_DELAY], delays[-2:])
+
+    def test_boto3_session(self):
+        api = self.server.client(self.cache_dir)
+
+        # Ahead of credentials in the environment
+        with patch.dict(os.environ, AWS_ACCESS_KEY_ID='env-key',
+                        AWS_SECRET_ACCESS_KEY='env-secret'):
+            session = boto3_session(api=api, background=False)
+            credentials = session.get_credentials()
+
+        self.assertEqual(METHOD, credentials.method)
+        self.assertTrue(credentials.access_key.startswith('ASIA'))
+        self.assertEqual('us-east-1', session.region_name)
+
+    def test_load_section(self):
+        path = os.path.join(self.tmp.name, 'config')
+        with open(path, 'w') as fp:
+            fp.write("[live]\n" + "".join(
+                "{} = {}\n".format(key, value)
+                for key, value in self.server.settings().items()
+            ))
+
+        section = load_section('live', path, profile='named')
+        self.assertEqual('live', section.section_name)
+        self.assertEqual('named', section['profile'])
+
+        with self.assertRaisesRegex(Exception, "'missing' not defined"):
+            load_section('missing', path)
@@ -0,0 +1,141 @@
+import base64
+import datetime
+import os
+from unittest import TestCase
+
+from onelogin_aws_cli.saml import assertion_expiry, parse_assertion, \
+    parse_role, parse_saml_datetime
+
+TEST_ROOT = os.path.join(os.path.dirname(__file__), "fixtures")
+
+SAML_WITH_EXPIRY = b"""<?xml version="1.0"?>
+<samlp:Response xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion"
+                xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol">
+    <saml:Assertion>
+        <saml:Subject>
+            <saml:SubjectConfirmation>
+                <saml:SubjectConfirmationData
+                    NotOnOrAfter="2018-05-24T15:18:41Z"/>
+            </saml:SubjectConfirmation>
+        </saml:Subject>
+        <saml:Conditions NotBefore="2018-05-24T15:12:41Z"
+                         NotOnOrAfter="2018-05-24T15:15:41.123Z"/>
+    </saml:Assertion>
+</samlp:Response>"""
+
+SAML_WITH_ATTRIBUTES = b"""<?xml version="1.0"?>
+<samlp:Response xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion"
+                xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol">
+    <saml:Assertion>
+        <saml:Conditions NotOnOrAfter="2018-05-24T15:15:41Z"/>
+        <saml:AttributeStatement>
+            <saml:Attribute
+                Name="https://aws.amazon.com/SAML/Attributes/Role">
+                <saml:AttributeValue>
+                    arn:aws:iam::123456789012:saml-provider/OneLogin,
+                    arn:aws:iam::123456789012:role/Reversed
+                </saml:AttributeValue>
+                <saml:AttributeValue>arn:aws:iam::123456789012:role/Ordered,arn:aws:iam::123456789012:saml-provider/OneLogin</saml:AttributeValue>
+            </saml:Attribute>
+            <saml:Attribute
+                Name="https://aws.amazon.com/SAML/Attributes/RoleSessionName">
+                <saml:AttributeValue>user@example.com</saml:AttributeValue>
+            </saml:Attribute>
+            <saml:Attribute
+                Name="https://aws.amazon.com/SAML/Attributes/SessionDuration">
+                <saml:AttributeValue>7200</saml:AttributeValue>
+            </saml:Attribute>
+        </saml:AttributeStatement>
+    </saml:Assertion>
+"""
+
+
+class TestSaml(TestCase):
+
+    def test_parse_saml_datetime(self):
+        utc = datetime.timezone.utc
+        self.assertEqual(
+            datetime.datetime(2018, 5, 24, 15, 15, 41, tzinfo=utc),
+            parse_saml_datetime('2018-05-24T15:15:41Z')
+        )
+        self.assertEqual(
+            datetime.datetime(2018, 5, 24, 13, 15, 41, 123456, tzinfo=utc),
+            parse_saml_datetime('2018-05-24T15:15:41.1234567+02:00')
+        )
+        with self.assertRaises(ValueError):
+            parse_saml_datetime('yesterday')
+
+    def test_assertion_expiry(self):
+        self.assertEqual(
+            datetime.datetime(2018, 5, 24, 15, 15, 41, 123000,
+                              tzinfo=datetime.timezone.utc),
+            assertion_expiry(base64.b64encode(SAML_WITH_EXPIRY).decode())
+        )
+
+    def test_assertion_expiry_missing(self):
+        with open(os.path.join(TEST_ROOT, 'saml_single_role.xml'), 'rb') as fp:
+            saml = base64.b64encode(fp.read())
+
+        self.assertIsNone(assertion_expiry(saml))
+        self.assertIsNone(assertion_expiry('not-an-assertion'))
+
+    def test_parse_role(self):
+        role = "arn:aws:iam::123456789012:role/Admin"
+        principal = "arn:aws:iam::123456789012:saml-provider/OneLogin"
+
+        self.assertEqual(
+            (role, principal), parse_role("{},{}".format(role, principal))
+        )
+        self.assertEqual(
+            (role, principal), parse_role("{}, {}".format(principal, role))
+        )
+
+    def test_parse_assertion(self):
+        attributes = parse_assertion(
+            base64.b64encode(SAML_WITH_ATTRIBUTES).decode()
+        )
+
+        self.assertEqual([
+            ("arn:aws:iam::123456789012:role/Reversed",
+             "arn:aws:iam::123456789012:saml-provider/OneLogin"),
+            ("arn:aws:iam::123456789012:role/Ordered",
+             "arn:aws:iam::123456789012:saml-provider/OneLogin"),
+        ], attributes.roles)
+        self.assertEqual("user@example.com", attributes.session_name)
+        self.assertEqual(7200, attributes.session_duration)
+        self.assertEqual(
+            datetime.datetime(2018, 5, 24, 15, 15, 41,
+                              tzinfo=datetime.timezone.utc),
+            attributes.expiry
+        )
+
+    def test_parse_assertion_stops_early(self):
+        # The response is truncated after the attributes, which a full parse
+        # would reject, so this only passes if parsing stops once they are read
+        saml = base64.b64encode(SAML_WITH_ATTRIBUTES + b"<unclosed")
+
+        attributes = parse_assertion(saml, chunk_size=64)
+
+        self.assertEqual(2, len(attributes.roles))
+        self.assertEqual(7200, attributes.session_duration)
+
+    def test_parse_assertion_malformed_duration(self):
+        saml = SAML_WITH_ATTRIBUTES.replace(
+            b"<saml:AttributeValue>7200<", b"<saml:AttributeValue>2h<"
+        )
+
+        attributes = parse_assertion(base64.b64encode(saml))
+
+        self.assertEqual(2, len(attributes.roles))
+        self.assertIsNone(attributes.session_duration)
+
+    def test_parse_assertion_fixture(self):
+        with open(os.path.join(TEST_ROOT, 'saml_multi_role.xml'), 'rb') as fp:
+            saml = base64.encodebytes(fp.read())
+
+        attributes = parse_assertion(saml, chunk_size=128)
+
+        self.assertEqual(3, len(attributes.roles))
+        for role, principal in attributes.roles:
+            self.assertIn(":role/", role)
+            self.assertIn(":saml-provider/", principal)
@@ -0,0 +1,151 @@
+import configparser
+import multiprocessing
+import os
+import tempfile
+from unittest import TestCase
+
+from onelogin_aws_cli.sharedcredentials import SharedCredentialsFile
+
+EXISTING = """# Managed by hand
+[first]
+aws_access_key_id = old-key
+; keep me
+aws_secret_access_key = old-secret
+region = eu-west-1
+
+[second]
+aws_access_key_id = second-key
+"""
+
+
+def _update_profile(path, name):
+    SharedCredentialsFile(path).update({name: dict(aws_access_key_id=name)})
+
+
+class TestSharedCredentialsFile(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'credentials')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, content):
+        with open(self.path, 'w') as fp:
+            fp.write(content)
+
+    def _read(self):
+        with open(self.path) as fp:
+            return fp.read()
+
+    def test_update_new_file(self):
+        SharedCredentialsFile(self.path).update(dict(
+            mock=dict(aws_access_key_id='key', aws_session_token='token'),
+        ))
+
+        self.assertEqual(
+            "[mock]\naws_access_key_id = key\naws_session_token = token\n",
+            self._read()
+        )
+
+    def test_update_in_place(self):
+        self._write(EXISTING)
+
+        SharedCredentialsFile(self.path).update(dict(
+            first=dict(
+                aws_access_key_id='new-key',
+                aws_session_token='new-token',
+            ),
+        ))
+
+        self.assertEqual("""# Managed by hand
+[first]
+aws_access_key_id = new-key
+; keep me
+aws_secret_access_key = old-secret
+region = eu-west-1
+aws_session_token = new-token
+
+[second]
+aws_access_key_id = second-key
+""", self._read())
+
+    def test_update_appends_profiles(self):
+        self._write(EXISTING.rstrip('\n'))
+
+        SharedCredentialsFile(self.path).update(dict(
+            third=dict(aws_access_key_id='third-key'),
+            fourth=dict(aws_access_key_id='fourth-key'),
+        ))
+
+        self.assertEqual(EXISTING + """
+[third]
+aws_access_key_id = third-key
+
+[fourth]
+aws_access_key_id = fourth-key
+""", self._read())
+
+    def test_update_replaces_continuation_lines(self):
+        self._write("[first]\nkey = one\n  two\nother = value\n")
+
+        SharedCredentialsFile(self.path).update(dict(first=dict(key='new')))
+
+        self.assertEqual("[first]\nkey = new\nother = value\n", self._read())
+
+    def test_update_unchanged(self):
+        self._write(EXISTING)
+        os.chmod(self.path, 0o600)
+        inode = os.stat(self.path).st_ino
+
+        changed = SharedCredentialsFile(self.path).update(dict(
+            second=dict(aws_access_key_id='second-key'),
+        ))
+
+        self.assertFalse(changed)
+        self.assertEqual(inode, os.stat(self.path).st_ino)
+
+    def test_update_keeps_permissions(self):
+        self._write(EXISTING)
+        os.chmod(self.path, 0o600)
+
+        SharedCredentialsFile(self.path).update(dict(
+            second=dict(aws_access_key_id='new-key'),
+        ))
+
+        self.assertEqual(0o600, os.stat(self.path).st_mode & 0o777)
+
+    def test_update_through_symlink(self):
+        target = os.path.join(self.tmp.name, 'dotfiles', 'credentials')
+        os.makedirs(os.path.dirname(target))
+        with open(target, 'w') as fp:
+            fp.write(EXISTING)
+        os.symlink(target, self.path)
+
+        SharedCredentialsFile(self.path).update(dict(
+            second=dict(aws_access_key_id='new-key'),
+        ))
+
+        self.assertTrue(os.path.islink(self.path))
+        with open(target) as fp:
+            self.assertIn("aws_access_key_id = new-key", fp.read())
+
+    def test_concurrent_updates(self):
+        names = ['profile{}'.format(i) for i in range(8)]
+        processes = [
+            multiprocessing.Process(
+                target=_update_profile, args=(self.path, name),
+            )
+            for name in names
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        config = configparser.ConfigParser()
+        config.read(self.path)
+        self.assertEqual(sorted(names), sorted(config.sections()))
+        # The lock file is removed by the last to hold it
+        self.assertEqual(['credentials'], os.listdir(self.tmp.name))
@@ -0,0 +1,232 @@
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from onelogin_aws_cli.singleflight import MARKER_TTL, SingleFlight
+from onelogin_aws_cli.tests.fake_server import FakeServer, role_arns
+
+
+class TestSingleFlight(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_completed(self):
+        flight = SingleFlight(self.tmp.name, 'section:role')
+        self.assertIsNone(flight.completed(0))
+        # Never waited for the lock
+        self.assertIsNone(flight.completed())
+
+        before = time.time()
+        with flight.lock():
+            flight.complete(dict(profile='mock-profile'))
+
+        self.assertEqual(
+            dict(profile='mock-profile'), flight.completed(before)
+        )
+        self.assertIsNone(flight.completed(time.time() + 1))
+        # Completed while waiting for the lock, but not after it
+        self.assertEqual(dict(profile='mock-profile'), flight.completed())
+        with flight.lock():
+            self.assertIsNone(flight.completed())
+        # Keyed separately
+        self.assertIsNone(
+            SingleFlight(self.tmp.name, 'section:other').completed(0)
+        )
+
+    def test_corrupt_marker(self):
+        flight = SingleFlight(self.tmp.name, 'section:role')
+        with open(flight.marker_path, 'w') as fp:
+            fp.write('{')
+
+        self.assertIsNone(flight.completed(0))
+
+    def test_leaves_nothing_behind(self):
+        flight = SingleFlight(self.tmp.name, 'section:role')
+        with flight.lock():
+            flight.complete(dict(profile='mock-profile'))
+        stale = SingleFlight(self.tmp.name, 'section:other')
+        with stale.lock():
+            stale.complete(dict(profile='mock-other'))
+        past = time.time() - MARKER_TTL - 1
+        os.utime(stale.marker_path, (past, past))
+
+        with flight.lock():
+            pass
+
+        self.assertEqual(
+            [os.path.basename(flight.marker_path)], os.listdir(self.tmp.name)
+        )
+
+    def test_lock(self):
+        flight = SingleFlight(self.tmp.name, 'section:role')
+        events = []
+
+        def waiter():
+            with SingleFlight(self.tmp.name, 'section:role').lock():
+                events.append('waiter')
+
+        with flight.lock():
+            thread = threading.Thread(target=waiter)
+            thread.start()
+            thread.join(0.2)
+            events.append('holder')
+        thread.join()
+
+        self.assertEqual(['holder', 'waiter'], events)
+
+    def test_lock_many_waiters(self):
+        # Each holder removes the lock file, which must not let two waiters
+        # in at once
+        holding = []
+        overlaps = []
+
+        def worker():
+            for _ in range(20):
+                with SingleFlight(self.tmp.name, 'section:role').lock():
+                    holding.append(1)
+                    if len(holding) > 1:
+                        overlaps.append(1)
+                    time.sleep(0.001)
+                    holding.pop()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], overlaps)
+
+
+class TestSingleFlightLogin(TestCase):
+    """Several logins for the same profile, as if from separate processes"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cred_file = os.path.join(self.tmp.name, 'credentials')
+
+        env = patch.dict(
+            os.environ, AWS_SHARED_CREDENTIALS_FILE=self.cred_file
+        )
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.server = FakeServer(latency=0.02).start()
+        self.addCleanup(self.server.stop)
+
+    def _client(self, worker: int, **config):
+        # Each worker keeps its own caches, as a separate process without a
+        # keychain would
+        config.setdefault('role_arn', role_arns(1)[0])
+        return self.server.client(
+            os.path.join(self.tmp.name, 'cache-{}'.format(worker)),
+            profile='herd', **config
+        )
+
+    def _concurrently(self, fn, workers: int = 8) -> list:
+        results = [None] * workers
+
+        def run(worker):
+            results[worker] = fn(self._client(worker))
+
+        threads = [
+            threading.Thread(target=run, args=(worker,))
+            for worker in range(workers)
+        ]
+        with contextlib.redirect_stdout(StringIO()):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return results
+
+    def test_save_credentials(self):
+        results = self._concurrently(lambda api: api.save_credentials())
+
+        self.assertEqual(1, self.server.requests.count('/'))
+        self.assertEqual(
+            1, self.server.requests.count('/api/2/saml_assertion')
+        )
+        self.assertEqual(
+            1, len({r['herd']['Credentials']['AccessKeyId'] for r in results})
+        )
+        self.assertEqual(
+            1, len({r['herd']['Credentials']['Expiration'] for r in results})
+        )
+
+        # The marker holds nothing secret
+        flight = self._client(0)._single_flight()
+        with open(flight.marker_path) as fp:
+            marker = fp.read()
+        self.assertNotIn(results[0]['herd']['Credentials']['SessionToken'],
+                         marker)
+        self.assertEqual('herd', json.loads(marker)['result']['profile'])
+
+    def test_sequential(self):
+        with contextlib.redirect_stdout(StringIO()):
+            self._client(0).save_credentials()
+            self._client(1).save_credentials()
+
+        self.assertEqual(2, self.server.requests.count('/'))
+
+    def test_role_prompt(self):
+        server = FakeServer(roles=3).start()
+        self.addCleanup(server.stop)
+        roles = role_arns(3)
+
+        def save(worker, choice):
+            api = server.client(
+                os.path.join(self.tmp.name, 'cache-{}'.format(worker)),
+                profile='herd',
+            )
+            with patch('builtins.input', return_value=choice):
+                return api.save_credentials()
+
+        with contextlib.redirect_stdout(StringIO()):
+            first = save(0, '1')
+            second = save(1, '3')
+
+        self.assertEqual(2, server.requests.count('/'))
+        self.assertEqual(
+            roles[0].split('/')[-1],
+            first['herd']['AssumedRoleUser']['Arn'].split('/')[1],
+        )
+        self.assertEqual(
+            roles[2].split('/')[-1],
+            second['herd']['AssumedRoleUser']['Arn'].split('/')[1],
+        )
+
+    def test_removed_profile(self):
+        with contextlib.redirect_stdout(StringIO()):
+            self._client(0).save_credentials()
+            os.remove(self.cred_file)
+            self._client(1).save_credentials()
+
+        self.assertEqual(2, self.server.requests.count('/'))
+
+    def test_get_credentials(self):
+        # Workers share the credentials cache, as processes with a keychain
+        # do
+        cache_dir = os.path.join(self.tmp.name, 'cache')
+
+        def get_credentials(api):
+            api.credentials_cache = self.server.client(
+                cache_dir
+            ).credentials_cache
+            return api.get_credentials()
+
+        results = self._concurrently(get_credentials)
+
+        self.assertEqual(1, self.server.requests.count('/'))
+        self.assertEqual(
+            1, len({r['Credentials']['AccessKeyId'] for r in results})
+        )
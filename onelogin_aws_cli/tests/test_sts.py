@@ -0,0 +1,322 @@
+import datetime
+import os
+import socket
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from onelogin_aws_cli import OneloginAWS
+from onelogin_aws_cli.cache import FileCache
+from onelogin_aws_cli.sts import (
+    GLOBAL_ENDPOINT, MAX_ATTEMPTS, SamlStsClient, clear_sts_clients,
+    get_saml_client, get_sts_client, parse_candidates, probe_endpoints,
+    regional_endpoint, resolve_sts_endpoint,
+)
+from onelogin_aws_cli.tests.fake_server import FakeServer, PRINCIPAL_ARN, \
+    role_arns
+from onelogin_aws_cli.tests.helper import endpoint_url, stand_in_endpoint
+
+
+class TestSts(TestCase):
+
+    def setUp(self):
+        clear_sts_clients()
+
+    def tearDown(self):
+        clear_sts_clients()
+
+    def test_get_sts_client_shared(self):
+        client = get_sts_client('ap-southeast-2')
+
+        self.assertIs(client, get_sts_client('ap-southeast-2'))
+        self.assertEqual('ap-southeast-2', client.meta.region_name)
+
+    def test_get_sts_client_per_region_and_endpoint(self):
+        sydney = get_sts_client('ap-southeast-2')
+        ireland = get_sts_client('eu-west-1')
+        local = get_sts_client('eu-west-1', 'http://127.0.0.1:1')
+
+        self.assertIsNot(sydney, ireland)
+        self.assertIsNot(ireland, local)
+        self.assertEqual('http://127.0.0.1:1', local.meta.endpoint_url)
+
+    def test_get_sts_client_without_tcp_keepalive(self):
+        from botocore.config import Config
+
+        # As in versions of botocore from before the option was added
+        config = MagicMock(side_effect=Config, OPTION_DEFAULTS={
+            name: value for name, value in Config.OPTION_DEFAULTS.items()
+            if name != 'tcp_keepalive'
+        })
+        with patch('botocore.config.Config', config):
+            client = get_sts_client('ap-southeast-2')
+
+        config.assert_called_once_with(max_pool_connections=16)
+        self.assertEqual('ap-southeast-2', client.meta.region_name)
+
+    def test_get_sts_client_concurrent(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            clients = list(executor.map(
+                lambda _: get_sts_client('eu-west-1'), range(16)
+            ))
+
+        self.assertEqual(1, len(set(id(client) for client in clients)))
+
+
+class TestStsEndpoint(TestCase):
+
+    def setUp(self):
+        self.fast = stand_in_endpoint(status=404)
+        self.slow = stand_in_endpoint(status=404, delay=0.3)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = FileCache('sts-endpoint', self.tmp.name)
+        self.candidates = {
+            'ap-southeast-2': endpoint_url(self.fast),
+            'us-east-1': endpoint_url(self.slow),
+            # Nothing is listening on the discard port
+            'eu-west-1': 'http://127.0.0.1:9',
+        }
+
+    def tearDown(self):
+        for server in (self.fast, self.slow):
+            server.shutdown()
+            server.server_close()
+        self.tmp.cleanup()
+
+    def test_probe_endpoints(self):
+        self.assertEqual(
+            'ap-southeast-2', probe_endpoints(self.candidates, timeout=1)
+        )
+
+    def test_probe_endpoints_none_answer(self):
+        self.assertIsNone(probe_endpoints(
+            dict(nowhere='http://127.0.0.1:9'), timeout=1
+        ))
+
+    def test_resolve_sts_endpoint_fixed(self):
+        self.assertEqual(
+            ('eu-west-1', None), resolve_sts_endpoint(None, 'eu-west-1')
+        )
+        self.assertEqual(
+            ('us-east-1', GLOBAL_ENDPOINT),
+            resolve_sts_endpoint('global', 'eu-west-1')
+        )
+        self.assertEqual(
+            ('ap-southeast-2', 'https://sts.ap-southeast-2.amazonaws.com'),
+            resolve_sts_endpoint('ap-southeast-2')
+        )
+        self.assertEqual(
+            ('cn-north-1', 'https://sts.cn-north-1.amazonaws.com.cn'),
+            resolve_sts_endpoint('cn-north-1')
+        )
+        self.assertEqual(
+            ('us-isob-east-1', None), resolve_sts_endpoint('us-isob-east-1')
+        )
+        self.assertEqual(
+            ('eu-west-1', 'http://127.0.0.1:8080'),
+            resolve_sts_endpoint('http://127.0.0.1:8080', 'eu-west-1')
+        )
+
+    def test_resolve_sts_endpoint_auto(self):
+        resolved = resolve_sts_endpoint(
+            'auto', candidates=self.candidates, cache=self.cache,
+        )
+        self.assertEqual(('ap-southeast-2', endpoint_url(self.fast)), resolved)
+
+        # The result is remembered for the network, so nothing is probed
+        with patch('onelogin_aws_cli.sts.probe_endpoints') as probe:
+            self.assertEqual(resolved, resolve_sts_endpoint(
+                'auto', candidates=self.candidates, cache=self.cache,
+            ))
+            probe.assert_not_called()
+
+        # Moving to another network probes again
+        with patch('onelogin_aws_cli.sts.network_fingerprint',
+                   return_value='other-network'):
+            with patch('onelogin_aws_cli.sts.probe_endpoints',
+                       return_value='us-east-1') as probe:
+                self.assertEqual(
+                    ('us-east-1', endpoint_url(self.slow)),
+                    resolve_sts_endpoint(
+                        'auto', candidates=self.candidates, cache=self.cache,
+                    )
+                )
+                probe.assert_called_once_with(self.candidates)
+
+    def test_parse_candidates(self):
+        self.assertEqual(
+            {
+                'eu-west-1': 'https://sts.eu-west-1.amazonaws.com',
+                'ap-southeast-2': 'https://sts.ap-southeast-2.amazonaws.com',
+            },
+            parse_candidates(' eu-west-1, ap-southeast-2,')
+        )
+        self.assertEqual(
+            {'cn-north-1': 'https://sts.cn-north-1.amazonaws.com.cn'},
+            parse_candidates('cn-north-1,us-iso-east-1')
+        )
+
+
+class TestSamlStsClient(TestCase):
+    """The built-in client, against the local STS stand-in"""
+
+    def setUp(self):
+        clear_sts_clients()
+        self.addCleanup(clear_sts_clients)
+
+        self.server = FakeServer().start()
+        self.addCleanup(self.server.stop)
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.api = self.server.client(self.tmp.name)
+        self.api.get_saml_assertion()
+
+    def _assume(self, client, role_arn: str = None) -> dict:
+        return client.assume_role_with_saml(
+            RoleArn=role_arn or role_arns(1)[0],
+            PrincipalArn=PRINCIPAL_ARN,
+            SAMLAssertion=self.api.saml.saml_response,
+            DurationSeconds=3600,
+        )
+
+    def test_same_as_boto3(self):
+        response = self._assume(SamlStsClient(self.server.url))
+        expected = self._assume(get_sts_client(endpoint_url=self.server.url))
+
+        self.assertEqual(set(expected), set(response))
+        for key in ('Credentials', 'AssumedRoleUser'):
+            self.assertEqual(set(expected[key]), set(response[key]))
+        for key in ('Subject', 'SubjectType', 'Audience'):
+            self.assertEqual(expected[key], response[key])
+        self.assertEqual(
+            expected['AssumedRoleUser']['Arn'],
+            response['AssumedRoleUser']['Arn'],
+        )
+
+        expiration = response['Credentials']['Expiration']
+        self.assertIsInstance(expiration, datetime.datetime)
+        # Assumed a moment apart
+        self.assertAlmostEqual(
+            expected['Credentials']['Expiration'].timestamp(),
+            expiration.timestamp(), delta=2,
+        )
+        metadata = response['ResponseMetadata']
+        self.assertEqual(200, metadata['HTTPStatusCode'])
+        self.assertEqual(36, len(metadata['RequestId']))
+        self.assertIn('date', metadata['HTTPHeaders'])
+
+    def test_connection_reused(self):
+        client = SamlStsClient(self.server.url)
+        self._assume(client)
+        connection = client._idle[0]
+        self._assume(client)
+
+        self.assertEqual([connection], client._idle)
+
+    def test_error(self):
+        with self.assertRaisesRegex(
+                Exception,
+                r"^An error occurred \(AccessDenied\) when calling the "
+                r"AssumeRoleWithSAML operation: Role not in assertion$"):
+            self._assume(SamlStsClient(self.server.url),
+                         role_arn='arn:aws:iam::123456789012:role/Other')
+
+        # Not retried
+        self.assertEqual(1, self.server.requests.count('/'))
+
+    def test_retries(self):
+        # The first two attempts fail
+        self.server.error_rate = 0.5
+        with patch.object(self.server._random, 'random',
+                          side_effect=[0.0, 0.0, 0.9]), \
+                patch('onelogin_aws_cli.sts.time.sleep') as sleep:
+            response = self._assume(SamlStsClient(self.server.url))
+
+        self.assertEqual(2, response['ResponseMetadata']['RetryAttempts'])
+        self.assertEqual(2, sleep.call_count)
+        self.assertEqual(3, self.server.requests.count('/'))
+
+    def test_dropped_connection(self):
+        client = SamlStsClient(self.server.url)
+        self._assume(client)
+        # The server closes an idle keep-alive connection
+        client._idle[0].sock.close()
+
+        self._assume(client)
+
+    def test_max_wait(self):
+        # Accepts connections, but never answers
+        listener = socket.socket()
+        self.addCleanup(listener.close)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(MAX_ATTEMPTS)
+        client = SamlStsClient(
+            'http://127.0.0.1:{}'.format(listener.getsockname()[1]),
+            timeout=0.2, max_wait=0.5,
+        )
+
+        started = time.monotonic()
+        with self.assertRaises(OSError):
+            self._assume(client)
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_used_by_default(self):
+        self.assertIsInstance(self.api.sts_client, SamlStsClient)
+        self.assertIs(self.api.sts_client, get_saml_client(
+            endpoint_url=self.server.url
+        ))
+
+        api = OneloginAWS(self.server.settings(sts_client='boto3'))
+        self.assertEqual(self.server.url, api.sts_client.meta.endpoint_url)
+
+    def test_get_saml_client(self):
+        aws_config = os.path.join(self.tmp.name, 'config')
+        env = patch.dict(os.environ, AWS_CONFIG_FILE=aws_config)
+        env.start()
+        self.addCleanup(env.stop)
+
+        with patch.dict(os.environ, AWS_REGION='eu-west-1'):
+            self.assertEqual(
+                'https://sts.eu-west-1.amazonaws.com',
+                get_saml_client().endpoint_url,
+            )
+
+        with patch.dict(os.environ, HTTPS_PROXY='http://proxy:3128',
+                        NO_PROXY='127.0.0.1'):
+            self.assertIsNone(get_saml_client('eu-west-1'))
+            self.assertIsNotNone(
+                get_saml_client(endpoint_url=self.server.url)
+            )
+
+        self.assertIsNone(get_saml_client('us-iso-east-1'))
+
+        # The region of the profile in the AWS config file
+        with open(aws_config, 'w') as fp:
+            fp.write("[default]\nregion = ap-southeast-2\n"
+                     "[profile fips]\nuse_fips_endpoint = true\n")
+        self.assertEqual(
+            'https://sts.ap-southeast-2.amazonaws.com',
+            get_saml_client().endpoint_url,
+        )
+
+        # Settings changing the endpoint are left to boto3
+        with patch.dict(os.environ, AWS_PROFILE='fips'):
+            self.assertIsNone(get_saml_client('eu-west-1'))
+        with patch.dict(os.environ, AWS_STS_REGIONAL_ENDPOINTS='legacy'):
+            self.assertIsNone(get_saml_client('eu-west-1'))
+        with patch.dict(os.environ,
+                        AWS_ENDPOINT_URL_STS='https://sts.example.com'):
+            self.assertIsNone(get_saml_client())
+            # Unless the endpoint is chosen here
+            self.assertIsNotNone(
+                get_saml_client(endpoint_url=self.server.url)
+            )
+
+    def test_regional_endpoint(self):
+        self.assertEqual(GLOBAL_ENDPOINT, regional_endpoint(None))
+        self.assertEqual('https://sts.cn-north-1.amazonaws.com.cn',
+                         regional_endpoint('cn-north-1'))
+        self.assertIsNone(regional_endpoint('us-isob-east-1'))
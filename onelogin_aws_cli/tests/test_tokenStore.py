@@ -0,0 +1,127 @@
+import datetime
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from onelogin_aws_cli.cache import FileCache
+from onelogin_aws_cli.oauth import MAX_ATTEMPTS, TokenStore
+
+
+class _FakeClient(object):
+    """Stands in for `onelogin.api.client.OneLoginClient`"""
+
+    def __init__(self, errors=()):
+        self.access_token = self.refresh_token = self.expiration = None
+        self.error = self.error_description = None
+        self.errors = list(errors)
+        self.calls = []
+
+    def _issue(self, call):
+        self.calls.append(call)
+        self.error = self.errors.pop(0) if self.errors else None
+        if self.error is None:
+            self.access_token = 'access-{}'.format(len(self.calls))
+            self.refresh_token = 'refresh-{}'.format(len(self.calls))
+            self.expiration = datetime.datetime.now(datetime.timezone.utc) \
+                + datetime.timedelta(hours=10)
+
+    def get_access_token(self):
+        self._issue('get')
+
+    def regenerate_token(self):
+        self._issue('refresh')
+
+    def remove_stored_token(self):
+        self.access_token = self.refresh_token = self.expiration = None
+
+
+class TestTokenStore(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sleep = MagicMock()
+        self.store = TokenStore(
+            FileCache('oauth-token', self.tmp.name), 'mock-key',
+            sleep=self.sleep,
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_prepare_reuses_cached_token(self):
+        first = _FakeClient()
+        self.store.prepare(first)
+        self.assertEqual(['get'], first.calls)
+
+        second = _FakeClient()
+        self.store.prepare(second)
+        self.assertEqual([], second.calls)
+        self.assertEqual(first.access_token, second.access_token)
+        self.assertEqual(first.expiration, second.expiration)
+
+    def test_prepare_refreshes_before_expiry(self):
+        client = _FakeClient()
+        self.store.prepare(client)
+        client.expiration = datetime.datetime.now(datetime.timezone.utc) + \
+            datetime.timedelta(minutes=1)
+
+        self.store.prepare(client)
+
+        self.assertEqual(['get', 'refresh'], client.calls)
+        self.assertEqual('access-2', client.access_token)
+
+    def test_prepare_rejected_refresh(self):
+        client = _FakeClient()
+        self.store.prepare(client)
+        client.expiration = datetime.datetime.now(datetime.timezone.utc)
+        client.errors = ['401']
+
+        self.store.prepare(client)
+
+        self.assertEqual(['get', 'refresh', 'get'], client.calls)
+        self.sleep.assert_not_called()
+
+    def test_prepare_backs_off_when_rate_limited(self):
+        client = _FakeClient(errors=['429', '429'])
+
+        self.store.prepare(client)
+
+        self.assertEqual(['get', 'get', 'get'], client.calls)
+        self.assertEqual(2, self.sleep.call_count)
+        first, second = [c[0][0] for c in self.sleep.call_args_list]
+        self.assertLessEqual(first, 1)
+        self.assertGreaterEqual(second, 1)
+
+    def test_prepare_gives_up(self):
+        client = _FakeClient(errors=['429'] * MAX_ATTEMPTS)
+        with self.assertRaisesRegex(Exception, r"^Onelogin Error: '429'"):
+            self.store.prepare(client)
+
+        client = _FakeClient(errors=['401'])
+        with self.assertRaisesRegex(Exception, r"^Onelogin Error: '401'"):
+            self.store.prepare(client)
+        self.assertEqual(['get'], client.calls)
+
+    def test_rejected(self):
+        first = _FakeClient()
+        self.store.prepare(first)
+        # Requested rather than reused, so the call failed for another reason
+        first.error = '401'
+        self.assertFalse(self.store.rejected(first))
+
+        second = _FakeClient()
+        self.store.prepare(second)
+        second.error = '500'
+        self.assertFalse(self.store.rejected(second))
+        second.error = '401'
+        second.error_description = \
+            'Authentication Failed: Invalid user credentials'
+        self.assertFalse(self.store.rejected(second))
+        second.error_description = 'Unauthorized'
+        self.assertTrue(self.store.rejected(second))
+        self.assertIsNone(second.access_token)
+
+        # Forgotten, so a new token is requested
+        third = _FakeClient()
+        self.store.prepare(third)
+        self.assertEqual(['get'], third.calls)
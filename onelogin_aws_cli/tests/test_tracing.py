@@ -0,0 +1,200 @@
+import contextlib
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from onelogin_aws_cli import tracing
+from onelogin_aws_cli.tests.fake_server import FakeServer, OTP
+
+
+class TestTracer(TestCase):
+
+    def setUp(self):
+        self.addCleanup(tracing.stop)
+
+    def test_disabled(self):
+        with tracing.span("phase") as span:
+            self.assertIsNone(span)
+
+        @tracing.traced("decorated")
+        def decorated():
+            return 'result'
+
+        self.assertEqual('result', decorated())
+
+    def test_nesting(self):
+        tracer = tracing.start()
+
+        with tracing.span("login"):
+            with tracing.span("load_password"):
+                with tracing.span("prompt_password", tracing.USER):
+                    pass
+
+            thread = threading.Thread(target=tracing.traced(
+                "assume_role", tracing.NETWORK
+            )(lambda: None))
+            thread.start()
+            thread.join()
+
+        records = {r['name']: r for r in tracer.records()}
+        self.assertIsNone(records['login']['parent_span_id'])
+        self.assertEqual(
+            records['login']['span_id'],
+            records['load_password']['parent_span_id'],
+        )
+        self.assertEqual(
+            records['load_password']['span_id'],
+            records['prompt_password']['parent_span_id'],
+        )
+        # Spans on other threads nest within the first span
+        self.assertEqual(
+            records['login']['span_id'],
+            records['assume_role']['parent_span_id'],
+        )
+        self.assertEqual('network', records['assume_role']['wait'])
+        self.assertEqual(
+            {tracer.trace_id}, {r['trace_id'] for r in records.values()}
+        )
+
+    def test_error(self):
+        tracer = tracing.start()
+
+        with self.assertRaises(RuntimeError):
+            with tracing.span("phase"):
+                raise RuntimeError("failed")
+
+        self.assertEqual("RuntimeError: failed", tracer.records()[0]['error'])
+        status = tracer.otlp()['resourceSpans'][0]['scopeSpans'][0][
+            'spans'][0]['status']
+        self.assertEqual(dict(code=2, message="RuntimeError: failed"), status)
+
+    def test_waited(self):
+        tracer = tracing.start()
+
+        with tracing.span("login"):
+            with tracing.span("mfa_push", tracing.USER) as push:
+                # Polling while the user approves the push counts once, as
+                # time spent waiting on the user
+                with tracing.span("poll", tracing.NETWORK) as poll:
+                    with tracing.span("inner", tracing.USER):
+                        pass
+            with tracing.span("assume_role", tracing.NETWORK) as sts:
+                pass
+
+        self.assertAlmostEqual(
+            push.duration_ms, tracer.waited(tracing.USER)
+        )
+        self.assertAlmostEqual(
+            poll.duration_ms + sts.duration_ms,
+            tracer.waited(tracing.NETWORK),
+        )
+
+    def test_otlp(self):
+        tracer = tracing.start()
+
+        with tracing.span("login"):
+            with tracing.span("assume_role", tracing.NETWORK,
+                              role_arn="arn:aws:iam::1:role/r"):
+                pass
+
+        resource_spans = tracer.otlp()['resourceSpans'][0]
+        self.assertEqual(
+            [dict(key='service.name',
+                  value=dict(stringValue='onelogin-aws-cli'))],
+            resource_spans['resource']['attributes'],
+        )
+        login, assume_role = resource_spans['scopeSpans'][0]['spans']
+        self.assertEqual(32, len(login['traceId']))
+        self.assertEqual(16, len(login['spanId']))
+        self.assertNotIn('parentSpanId', login)
+        self.assertEqual(login['spanId'], assume_role['parentSpanId'])
+        self.assertEqual(1, login['kind'])
+        self.assertEqual(3, assume_role['kind'])
+        self.assertEqual([
+            dict(key='onelogin_aws_cli.wait',
+                 value=dict(stringValue='network')),
+            dict(key='role_arn',
+                 value=dict(stringValue='arn:aws:iam::1:role/r')),
+        ], assume_role['attributes'])
+        self.assertLessEqual(
+            int(login['startTimeUnixNano']),
+            int(assume_role['startTimeUnixNano']),
+        )
+
+
+class TestTracing(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.trace_file = os.path.join(self.tmp.name, 'trace.jsonl')
+
+        env = patch.dict(
+            os.environ,
+            AWS_SHARED_CREDENTIALS_FILE=os.path.join(
+                self.tmp.name, 'credentials'
+            ),
+        )
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.server = FakeServer(mfa='otp').start()
+        self.addCleanup(self.server.stop)
+
+    def _login(self, **kwargs):
+        api = self.server.client(
+            os.path.join(self.tmp.name, 'cache'), profile='fake'
+        )
+        stderr = StringIO()
+        with patch('builtins.input', return_value=OTP), \
+                contextlib.redirect_stdout(StringIO()), \
+                contextlib.redirect_stderr(stderr):
+            with tracing.tracing(**kwargs):
+                api.save_credentials()
+        return stderr.getvalue()
+
+    def test_jsonl(self):
+        self._login(path=self.trace_file)
+        self._login(path=self.trace_file)
+
+        with open(self.trace_file) as fp:
+            records = [json.loads(line) for line in fp]
+
+        names = [r['name'] for r in records]
+        for name in ("login", "get_saml_assertion", "get_ip_address",
+                     "onelogin_oauth_token", "onelogin_saml_assertion",
+                     "select_mfa_device", "prompt_mfa_token", "mfa_verify",
+                     "get_arns", "choose_role", "assume_role",
+                     "write_credentials"):
+            self.assertIn(name, names)
+
+        # Appended, with a trace for each login
+        self.assertEqual(2, len({r['trace_id'] for r in records}))
+        waits = {r['name']: r['wait'] for r in records}
+        self.assertEqual('user', waits['prompt_mfa_token'])
+        self.assertEqual('network', waits['mfa_verify'])
+        self.assertEqual('local', waits['get_arns'])
+
+    def test_otlp(self):
+        self._login(path=self.trace_file, fmt=tracing.FORMAT_OTLP)
+
+        with open(self.trace_file) as fp:
+            lines = fp.read().splitlines()
+
+        self.assertEqual(1, len(lines))
+        spans = json.loads(lines[0])['resourceSpans'][0]['scopeSpans'][0][
+            'spans']
+        self.assertIn('assume_role', [s['name'] for s in spans])
+
+    def test_timings(self):
+        output = self._login(timings=True)
+
+        self.assertRegex(output, r"(?m)^login +[\d.]+ ms  local$")
+        self.assertRegex(output, r"(?m)^  assume_role +[\d.]+ ms  network$")
+        self.assertRegex(output, r"(?m)^Waiting on user +[\d.]+ ms$")
+        self.assertRegex(output, r"(?m)^Waiting on network +[\d.]+ ms$")
+        self.assertFalse(os.path.exists(self.trace_file))
@@ -1,10 +1,22 @@
 import contextlib
+import os
 from unittest import TestCase
 from unittest.mock import patch
 
 from io import StringIO
 
-from onelogin_aws_cli.userquery import user_choice, user_role_prompt
+from onelogin_aws_cli.userquery import KEY_BACKSPACE, KEY_DOWN, KEY_ENTER, \
+    KEY_INTERRUPT, KEY_UP, RoleIndex, _terminal_keys, search_choice, \
+    user_choice, user_role_prompt
+
+ROLES = [
+    ('arn:aws:iam::222222222222:role/Developer',
+     'arn:aws:iam::222222222222:saml-provider/OneLogin'),
+    ('arn:aws:iam::111111111111:role/ReadOnly',
+     'arn:aws:iam::111111111111:saml-provider/OneLogin'),
+    ('arn:aws:iam::111111111111:role/Admin',
+     'arn:aws:iam::111111111111:saml-provider/OneLogin'),
+]
 
 
 class TestUser_choice(TestCase):
@@ -30,6 +42,7 @@ class TestUser_choice(TestCase):
         output = mock_stdout.getvalue()
         assert result == "world"
         assert "Invalid option" in output
+        assert output.count("[2] world") == 1
 
     def test_user_choice_no_options(self):
         with self.assertRaises(Exception):
@@ -79,3 +92,135 @@ class TestUser_choice(TestCase):
         ])
 
         self.assertEqual(('mock_role1', 'mock_principal_1'), selected_role)
+
+
+class TestRoleIndex(TestCase):
+
+    def test_ordering_and_labels(self):
+        index = RoleIndex(ROLES, aliases={'222222222222': 'alpha'})
+
+        self.assertEqual([ROLES[2], ROLES[1], ROLES[0]], index.roles)
+        self.assertEqual('alpha (222222222222) Developer',
+                         index.label(ROLES[0]))
+        self.assertEqual('111111111111 Admin', index.label(ROLES[2]))
+
+    def test_search(self):
+        index = RoleIndex(ROLES, aliases={'222222222222': 'alpha'})
+
+        self.assertEqual([ROLES[0]], index.search('alpha'))
+        self.assertEqual([ROLES[2]], index.search('1111 adm'))
+        self.assertEqual([ROLES[1]], index.search('rdonly'))
+        self.assertEqual([], index.search('xyz'))
+        self.assertEqual([ROLES[2], ROLES[1], ROLES[0]], index.search(''))
+
+    def test_search_ranking(self):
+        deploy = ('arn:aws:iam::111111111111:role/DeployAdmin', 'principal')
+        data = ('arn:aws:iam::222222222222:role/Data', 'principal')
+        index = RoleIndex([deploy, data])
+
+        # Substring matches come before letters matching in order
+        self.assertEqual([data, deploy], index.search('da'))
+        self.assertEqual([data], index.search('dat'))
+        self.assertEqual([data, deploy], index.search('da'))
+
+    def test_search_many_roles(self):
+        roles = [
+            ('arn:aws:iam::{:012d}:role/Role{}'.format(account, role),
+             'arn:aws:iam::{:012d}:saml-provider/OneLogin'.format(account))
+            for account in range(100) for role in range(50)
+        ]
+        index = RoleIndex(roles)
+
+        for query in ['0', '00', '000000000042', '000000000042 role4']:
+            matches = index.search(query)
+        # Role4 and Role40 to Role49 contain the query, and come first
+        self.assertEqual(
+            [roles[42 * 50 + 4]] + roles[42 * 50 + 40:42 * 50 + 50],
+            matches[:11]
+        )
+
+
+class TestSearchChoice(TestCase):
+
+    def test_type_to_filter(self):
+        index = RoleIndex(ROLES)
+        out = StringIO()
+
+        result = search_choice(
+            'Pick a role:', index, iter(['r', 'e', KEY_ENTER]), out
+        )
+
+        self.assertEqual(ROLES[1], result)
+        self.assertIn('Pick a role:', out.getvalue())
+        self.assertIn('? re', out.getvalue())
+
+    def test_arrow_keys_and_backspace(self):
+        index = RoleIndex(ROLES)
+
+        result = search_choice(
+            'Pick a role:', index,
+            iter(['x', KEY_ENTER, KEY_BACKSPACE, KEY_DOWN, KEY_ENTER]),
+            StringIO()
+        )
+
+        self.assertEqual(ROLES[1], result)
+
+    def test_interrupt(self):
+        with self.assertRaises(KeyboardInterrupt):
+            search_choice(
+                'Pick a role:', RoleIndex(ROLES), iter([KEY_INTERRUPT]),
+                StringIO()
+            )
+
+    def test_keys_run_out(self):
+        self.assertIsNone(search_choice(
+            'Pick a role:', RoleIndex(ROLES), iter([]), StringIO()
+        ))
+
+
+class TestTerminalKeys(TestCase):
+
+    def _keys(self, typed: bytes) -> list:
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        os.write(write_fd, typed)
+        os.close(write_fd)
+        return list(_terminal_keys(read_fd))
+
+    def test_keys(self):
+        self.assertEqual(
+            ['a', KEY_UP, KEY_DOWN, KEY_BACKSPACE, KEY_ENTER],
+            self._keys(b'a\x1b[A\x1bOB\x7f\r'),
+        )
+
+    def test_non_ascii(self):
+        self.assertEqual(['é', 'ü', 'x'], self._keys('éüx'.encode('utf-8')))
+
+    def test_bare_escape(self):
+        # Neither waits for more input nor swallows the next key
+        self.assertEqual(['a'], self._keys(b'\x1ba'))
+        self.assertEqual([], self._keys(b'\x1b'))
+
+
+class TestUserRolePromptAliases(TestCase):
+
+    def test_saved_choice_by_alias(self):
+        aliases = {'111111111111': 'prod'}
+
+        for saved in ['arn:aws:iam::prod:role/Admin', 'prod:role/Admin',
+                      '111111111111:role/Admin']:
+            self.assertEqual(ROLES[2], user_role_prompt(
+                ROLES, saved_choice=saved, aliases=aliases
+            ))
+
+    def test_numbered_prompt_shows_aliases(self):
+        mock_stdout = StringIO()
+
+        with patch('builtins.input', side_effect=['1']):
+            with contextlib.redirect_stdout(mock_stdout):
+                user_role_prompt(ROLES, aliases={'111111111111': 'prod'})
+
+        self.assertIn(
+            "[2] arn:aws:iam::111111111111:role/ReadOnly (prod)",
+            mock_stdout.getvalue()
+        )
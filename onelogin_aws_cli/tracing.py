@@ -0,0 +1,313 @@
+"""
+Opt-in timing of each phase of a login.
+
+Spans are only recorded once `start` has been called, so that `span` costs
+next to nothing otherwise. Each span says what it was waiting on: the user,
+the network, or neither, so that time spent typing a password or approving
+MFA can be told apart from time spent waiting on OneLogin and AWS.
+"""
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+# What a span spent its time waiting on
+USER = "user"
+NETWORK = "network"
+LOCAL = "local"
+
+FORMAT_JSONL = "jsonl"
+FORMAT_OTLP = "otlp"
+FORMATS = (FORMAT_JSONL, FORMAT_OTLP)
+
+SERVICE_NAME = "onelogin-aws-cli"
+WAIT_ATTRIBUTE = "onelogin_aws_cli.wait"
+
+# OpenTelemetry span kinds and status codes
+_SPAN_KIND_INTERNAL = 1
+_SPAN_KIND_CLIENT = 3
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+_tracer = None
+
+
+def _time_ns() -> int:
+    # `time.time_ns` needs Python 3.7
+    return int(time.time() * 1e9)
+
+
+class _NoSpan(object):
+    """Stands in for a span while tracing is off"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Span(object):
+    """A single timed phase"""
+
+    __slots__ = (
+        'name', 'wait', 'span_id', 'parent_id', 'attributes', 'start_ns',
+        'end_ns', 'error',
+    )
+
+    def __init__(self, name: str, wait: str, span_id: str,
+                 parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.wait = wait
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = _time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class Tracer(object):
+    """
+    Records the spans of a single run.
+
+    Spans nest within the span open on the same thread. Spans opened on
+    other threads, such as concurrent role assumptions, nest within the
+    first span of the run.
+    """
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self._root_id = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def span(self, name: str, wait: str = LOCAL, **attributes):
+        stack = self._stack()
+        parent_id = stack[-1].span_id if stack else self._root_id
+        span = Span(name, wait, os.urandom(8).hex(), parent_id, attributes)
+        if self._root_id is None:
+            self._root_id = span.span_id
+
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = "{}: {}".format(type(e).__name__, e)
+            raise
+        finally:
+            span.end_ns = _time_ns()
+            stack.pop()
+            with self._lock:
+                self.spans.append(span)
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def records(self) -> list:
+        """Return each finished span as a flat dict, in start order"""
+
+        return [
+            dict(
+                trace_id=self.trace_id,
+                span_id=span.span_id,
+                parent_span_id=span.parent_id,
+                name=span.name,
+                wait=span.wait,
+                start_time_unix_nano=span.start_ns,
+                end_time_unix_nano=span.end_ns,
+                duration_ms=round(span.duration_ms, 3),
+                attributes=span.attributes,
+                error=span.error,
+            )
+            for span in sorted(self.spans, key=lambda s: s.start_ns)
+        ]
+
+    def otlp(self) -> dict:
+        """
+        Return the spans as an OTLP/JSON `ExportTraceServiceRequest`, as read
+        by the OpenTelemetry collector
+        """
+
+        spans = []
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            attributes = dict(span.attributes)
+            attributes[WAIT_ATTRIBUTE] = span.wait
+            otlp_span = dict(
+                traceId=self.trace_id,
+                spanId=span.span_id,
+                name=span.name,
+                kind=_SPAN_KIND_CLIENT if span.wait == NETWORK
+                else _SPAN_KIND_INTERNAL,
+                startTimeUnixNano=str(span.start_ns),
+                endTimeUnixNano=str(span.end_ns),
+                attributes=[
+                    dict(key=key, value=_otlp_value(value))
+                    for key, value in sorted(attributes.items())
+                ],
+                status=dict(code=_STATUS_OK) if span.error is None
+                else dict(code=_STATUS_ERROR, message=span.error),
+            )
+            if span.parent_id is not None:
+                otlp_span['parentSpanId'] = span.parent_id
+            spans.append(otlp_span)
+
+        return dict(resourceSpans=[dict(
+            resource=dict(attributes=[dict(
+                key="service.name", value=dict(stringValue=SERVICE_NAME),
+            )]),
+            scopeSpans=[dict(scope=dict(name=__name__), spans=spans)],
+        )])
+
+    def write(self, path: str, fmt: str = FORMAT_JSONL):
+        """
+        Append the spans to a file. `jsonl` writes a line for each span,
+        `otlp` writes a line holding the whole run.
+        """
+
+        if fmt == FORMAT_OTLP:
+            lines = [self.otlp()]
+        else:
+            lines = self.records()
+
+        with open(path, 'a') as fp:
+            for line in lines:
+                fp.write(json.dumps(line, sort_keys=True) + "\n")
+
+    def summary(self) -> str:
+        """
+        Return a table of the spans, and the time spent waiting on the user
+        and on the network
+        """
+
+        children = {}
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            children.setdefault(span.parent_id, []).append(span)
+
+        lines = []
+
+        def render(span, depth):
+            lines.append("{:<40} {:>10.1f} ms  {}".format(
+                "  " * depth + span.name, span.duration_ms, span.wait,
+            ))
+            for child in children.get(span.span_id, []):
+                render(child, depth + 1)
+
+        for span in children.get(None, []):
+            render(span, 0)
+
+        for wait in (USER, NETWORK):
+            lines.append("{:<40} {:>10.1f} ms".format(
+                "Waiting on {}".format(wait), self.waited(wait),
+            ))
+        return "\n".join(lines)
+
+    def waited(self, wait: str) -> float:
+        """
+        Return the milliseconds spent in spans waiting on `wait`, not
+        counting those nested within another such span
+        """
+
+        by_id = {span.span_id: span for span in self.spans}
+        total = 0
+        for span in self.spans:
+            if span.wait != wait:
+                continue
+            parent = by_id.get(span.parent_id)
+            while parent is not None and parent.wait != wait:
+                parent = by_id.get(parent.parent_id)
+            if parent is None:
+                total += span.duration_ms
+        return total
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return dict(boolValue=value)
+    if isinstance(value, int):
+        return dict(intValue=str(value))
+    if isinstance(value, float):
+        return dict(doubleValue=value)
+    return dict(stringValue=str(value))
+
+
+def start() -> Tracer:
+    """Start recording spans in this process"""
+
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop() -> Optional[Tracer]:
+    """Stop recording spans, returning the tracer which recorded them"""
+
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def span(name: str, wait: str = LOCAL, **attributes):
+    """
+    Time a block of code, if tracing has been started
+
+    :param wait: What the block spends its time waiting on
+    """
+
+    if _tracer is None:
+        return _NO_SPAN
+    return _tracer.span(name, wait, **attributes)
+
+
+def traced(name: str, wait: str = LOCAL):
+    """Time every call to the decorated function as a span"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(name, wait):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def tracing(path: Optional[str] = None, fmt: str = FORMAT_JSONL,
+            timings: bool = False, name: str = "login"):
+    """
+    Record the spans of the block within a span called `name`, then append
+    them to `path` and print a summary to stderr if `timings` is set
+    """
+
+    if not path and not timings:
+        yield None
+        return
+
+    tracer = start()
+    try:
+        with tracer.span(name):
+            yield tracer
+    finally:
+        stop()
+        if path:
+            tracer.write(path, fmt)
+        if timings:
+            print(tracer.summary(), file=sys.stderr)
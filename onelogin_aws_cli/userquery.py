@@ -1,10 +1,133 @@
 """
 Interactions with the user through the cli
 """
-from typing import Any, Callable, List, Tuple
+import codecs
+import os
+import re
+import select
+import sys
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, \
+    Tuple
 
 RolePrincipalPair = Tuple
 
+ROLE_ARN = re.compile(r'^arn:[^:]*:iam::(?P<account>\d*):role/(?P<name>.+)$')
+# A saved role choice, whose account may be given by its alias
+SAVED_ROLE = re.compile(
+    r'^(?:arn:[^:]*:iam::)?(?P<account>[^:]+):role/(?P<name>.+)$'
+)
+
+# Matches shown at once by the interactive picker
+MAX_VISIBLE = 10
+# Seconds to wait for the rest of an escape sequence after an ESC
+ESCAPE_TIMEOUT = 0.05
+
+KEY_UP = 'up'
+KEY_DOWN = 'down'
+KEY_ENTER = 'enter'
+KEY_BACKSPACE = 'backspace'
+KEY_INTERRUPT = 'interrupt'
+
+_ESCAPE_KEYS = {'[A': KEY_UP, '[B': KEY_DOWN, 'OA': KEY_UP, 'OB': KEY_DOWN}
+_CONTROL_KEYS = {
+    '\r': KEY_ENTER, '\n': KEY_ENTER,
+    '\x7f': KEY_BACKSPACE, '\x08': KEY_BACKSPACE,
+    '\x03': KEY_INTERRUPT, '\x04': KEY_INTERRUPT,
+    '\x10': KEY_UP, '\x0e': KEY_DOWN,
+}
+
+
+class RoleIndex(object):
+    """
+    The roles from a SAML assertion, ordered by account and role name, with
+    a search key for each so they can be filtered as the user types.
+    """
+
+    def __init__(self, roles: List[RolePrincipalPair],
+                 aliases: Dict[str, str] = None):
+        """
+        :param roles: (role ARN, principal ARN) pairs
+        :param aliases: Mapping of account ID to account alias
+        """
+        self.aliases = aliases or {}
+        entries = []
+        for role in roles:
+            account, name = self.split_arn(role[0])
+            label = self._label(account, name)
+            entries.append((account, name, label, label.lower(), role))
+        entries.sort(key=lambda e: (self.aliases.get(e[0], e[0]), e[1]))
+
+        self.roles = [e[4] for e in entries]
+        self._labels = {e[4]: e[2] for e in entries}
+        self._keys = [e[3] for e in entries]
+        self._last_query = ''
+        self._last_matches = list(range(len(entries)))
+
+    def __len__(self):
+        return len(self.roles)
+
+    @staticmethod
+    def split_arn(role_arn: str) -> Tuple[str, str]:
+        """Return the account ID and role name of a role ARN"""
+        match = ROLE_ARN.match(role_arn)
+        if match is None:
+            return '', role_arn
+        return match.group('account'), match.group('name')
+
+    def label(self, role: RolePrincipalPair) -> str:
+        """Describe a role by its account and name"""
+        label = self._labels.get(role)
+        if label is None:
+            label = self._label(*self.split_arn(role[0]))
+        return label
+
+    def search(self, query: str) -> List[RolePrincipalPair]:
+        """
+        Return the roles matching every word of `query`, with roles
+        containing each word ahead of roles only containing its letters in
+        order.
+
+        Matches are narrowed from those of the previous query when the query
+        has only been extended, so searching as each key is typed only looks
+        at the roles which still match.
+        """
+
+        terms = query.lower().split()
+        if query.startswith(self._last_query):
+            candidates = self._last_matches
+        else:
+            candidates = range(len(self._keys))
+
+        exact = []
+        fuzzy = []
+        for i in candidates:
+            key = self._keys[i]
+            if all(term in key for term in terms):
+                exact.append(i)
+            elif all(_is_subsequence(term, key) for term in terms):
+                fuzzy.append(i)
+
+        self._last_query = query
+        self._last_matches = sorted(exact + fuzzy)
+        return [self.roles[i] for i in exact + fuzzy]
+
+    def _label(self, account: str, name: str) -> str:
+        alias = self.aliases.get(account)
+        if alias:
+            return "{} ({}) {}".format(alias, account, name)
+        if account:
+            return "{} {}".format(account, name)
+        return name
+
+
+def _is_subsequence(term: str, key: str) -> bool:
+    position = 0
+    for char in term:
+        position = key.find(char, position) + 1
+        if position == 0:
+            return False
+    return True
+
 
 def user_choice(question: str,
                 options: List[Any],
@@ -27,12 +150,10 @@ def user_choice(question: str,
     print(question)
     if len(options) == 0:
         raise Exception("No options found")
-    option_list = []
     for i, option in enumerate(options):
-        option_list.append("[{}] {}".format(i + 1, renderer(option)))
+        print("[{}] {}".format(i + 1, renderer(option)))
     selection = None
     while selection is None:
-        print("\n".join(option_list))
         choice = input("? ")
         try:
             val = int(choice) - 1
@@ -45,15 +166,192 @@ def user_choice(question: str,
     return selection
 
 
+def search_choice(question: str, index: RoleIndex, keys: Iterator[str],
+                  out: TextIO) -> Optional[RolePrincipalPair]:
+    """
+    Let the user pick a role by typing part of its account or name, showing
+    the best matches after every key press.
+
+    :param question: Specifying context for the user to select an option
+    :param index: The roles to pick from
+    :param keys: The keys pressed, as characters or one of the `KEY_` names
+    :param out: Where to draw the picker
+    :return: The chosen role, or `None` if the keys ran out first
+    """
+
+    query = ''
+    matches = index.search(query)
+    selected = 0
+    drawn = 0
+
+    out.write(question + "\n")
+    while True:
+        visible = matches[:MAX_VISIBLE]
+        selected = min(selected, max(len(visible) - 1, 0))
+        lines = [
+            "{} {}".format('>' if i == selected else ' ', index.label(role))
+            for i, role in enumerate(visible)
+        ]
+        if len(matches) > len(visible):
+            lines.append("  ... {} more".format(len(matches) - len(visible)))
+        elif not matches:
+            lines.append("  No matching roles")
+
+        # Redraw over the previous matches
+        if drawn:
+            out.write("\x1b[{}F".format(drawn))
+        out.write("\x1b[J" + "".join(line + "\n" for line in lines))
+        out.write("? " + query)
+        out.flush()
+        drawn = len(lines)
+
+        key = next(keys, None)
+        if key is None:
+            return None
+        out.write("\r")
+
+        if key == KEY_INTERRUPT:
+            out.write("\n")
+            raise KeyboardInterrupt
+        elif key == KEY_ENTER:
+            if visible:
+                out.write("\x1b[J")
+                return visible[selected]
+        elif key == KEY_UP:
+            selected = max(selected - 1, 0)
+        elif key == KEY_DOWN:
+            selected += 1
+        elif key == KEY_BACKSPACE:
+            query = query[:-1]
+            matches = index.search(query)
+            selected = 0
+        elif len(key) == 1 and key.isprintable():
+            query += key
+            matches = index.search(query)
+            selected = 0
+
+
+def _terminal_keys(fd: int) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    pending = None
+    while True:
+        char = pending or _read_char(fd, decoder)
+        pending = None
+        if not char:
+            return
+        if char != '\x1b':
+            yield _CONTROL_KEYS.get(char, char)
+            continue
+
+        # The rest of an escape sequence arrives straight after the ESC,
+        # while a bare ESC is followed by nothing
+        sequence = _read_char(fd, decoder, ESCAPE_TIMEOUT)
+        if sequence not in ('[', 'O'):
+            pending = sequence
+            continue
+        sequence += _read_char(fd, decoder, ESCAPE_TIMEOUT) or ''
+        if sequence in _ESCAPE_KEYS:
+            yield _ESCAPE_KEYS[sequence]
+
+
+def _read_char(fd: int, decoder,
+               timeout: Optional[float] = None) -> Optional[str]:
+    """
+    Read one character from a terminal
+
+    :return: The character, `''` at the end of input, or `None` if nothing
+             was typed within `timeout` seconds
+    """
+
+    while True:
+        if timeout is not None and \
+                not select.select([fd], [], [], timeout)[0]:
+            return None
+        data = os.read(fd, 1)
+        if not data:
+            return ''
+        # Only complete once every byte of a multi-byte character is read
+        char = decoder.decode(data)
+        if char:
+            return char
+
+
+def _interactive_choice(question: str,
+                        index: RoleIndex) -> Optional[RolePrincipalPair]:
+    try:
+        import termios
+        import tty
+    except ImportError:  # pragma: no cover - Windows
+        return None
+
+    if not (sys.stdin.isatty() and sys.stdout.isatty()):
+        return None
+
+    fd = sys.stdin.fileno()
+    attributes = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        # Keep ^C as a key, so the terminal is restored before exiting
+        raw = termios.tcgetattr(fd)
+        raw[3] &= ~termios.ISIG
+        termios.tcsetattr(fd, termios.TCSANOW, raw)
+        selection = search_choice(
+            question, index, _terminal_keys(fd), sys.stdout
+        )
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, attributes)
+    sys.stdout.write("\n")
+    return selection
+
+
 def user_role_prompt(all_roles: List[RolePrincipalPair],
-                     saved_choice: str = None) -> RolePrincipalPair:
+                     saved_choice: str = None,
+                     aliases: Dict[str, str] = None) -> RolePrincipalPair:
     """
     Prompt a user with a list of AWS IAM roles to choose from. If only 1 role
     is available, return that.
+
+    On a terminal, roles can be searched for by account or role name. When
+    input is not a terminal, the roles are numbered instead.
+
+    :param saved_choice: Role ARN to use without prompting. The account ID
+                         may be replaced by the account's alias, as in
+                         `arn:aws:iam::production:role/Admin` or
+                         `production:role/Admin`
+    :param aliases: Mapping of account ID to account alias, shown next to
+                    each role
     """
+    if saved_choice:
+        for role in all_roles:
+            if _is_saved_choice(role, saved_choice, aliases or {}):
+                return role
+        print("Ignoring invalid saved choice '{}'".format(saved_choice))
+
+    if len(all_roles) > 1:
+        index = RoleIndex(all_roles, aliases)
+        selection = _interactive_choice("Pick a role:", index)
+        if selection is not None:
+            return selection
+
+    def renderer(role):
+        alias = (aliases or {}).get(RoleIndex.split_arn(role[0])[0])
+        return "{} ({})".format(role[0], alias) if alias else role[0]
+
     return user_choice(
         "Pick a role:",
         all_roles,
-        renderer=lambda role: role[0],
-        saved_choice=saved_choice,
+        renderer=renderer,
+    )
+
+
+def _is_saved_choice(role: RolePrincipalPair, saved_choice: str,
+                     aliases: Dict[str, str]) -> bool:
+    if role[0] == saved_choice:
+        return True
+    match = SAVED_ROLE.match(saved_choice)
+    if match is None:
+        return False
+    account, name = RoleIndex.split_arn(role[0])
+    return name == match.group('name') and match.group('account') in (
+        account, aliases.get(account)
     )